@@ -0,0 +1,10 @@
+'''Admin URLconf, imported on the first request under /admin/
+
+Registering the ModelAdmins is deferred to here (see
+core.apps.LazyAdminConfig) to keep it out of process start-up.
+'''
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns, app_name, _ = admin.site.urls
@@ -1,6 +1,11 @@
+import importlib.util
 import os
+import tempfile
+from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -20,7 +25,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'core.apps.LazyAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -44,8 +49,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ShardRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -72,13 +79,133 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+SQLITE_PRODUCTION_OPTIONS = {
+    'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': ';'.join((
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA mmap_size=%d' % int(
+            os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+        ),
+        'PRAGMA cache_size=-%d' % int(
+            os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)
+        ),
+        'PRAGMA temp_store=MEMORY',
+    )),
 }
 
+# Postgres is used when DB_HOST is set, SQLite otherwise. Connections are
+# kept open for DB_CONN_MAX_AGE seconds and health checked before reuse.
+# DB_POOL=1 switches to the driver-side pool instead (requires psycopg 3
+# with the pool extra; Django disallows combining it with CONN_MAX_AGE).
+
+if os.environ.get('DB_HOST'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'HOST': os.environ.get('DB_HOST'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'NAME': os.environ.get('DB_NAME'),
+            'USER': os.environ.get('DB_USER'),
+            'PASSWORD': os.environ.get('DB_PASS'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # requirements.txt only declares psycopg2, which has no pool
+        if not (
+            importlib.util.find_spec('psycopg')
+            and importlib.util.find_spec('psycopg_pool')
+        ):
+            raise ImproperlyConfigured(
+                'DB_POOL=1 requires psycopg 3 with the pool extra: '
+                'pip install "psycopg[binary,pool]".'
+            )
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    # Read replicas, one alias per host in DB_REPLICA_HOSTS (comma separated)
+    for index, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+        start=1,
+    ):
+        DATABASES[f'replica_{index}'] = dict(
+            DATABASES['default'],
+            HOST=host.strip(),
+            OPTIONS=dict(DATABASES['default']['OPTIONS']),
+            TEST={'MIRROR': 'default'},
+        )
+    # Shards for per-user data, one alias per host in DB_SHARD_HOSTS
+    for index, host in enumerate(
+        filter(None, os.environ.get('DB_SHARD_HOSTS', '').split(',')),
+        start=1,
+    ):
+        DATABASES[f'shard_{index}'] = dict(
+            DATABASES['default'],
+            HOST=host.strip(),
+            OPTIONS=dict(DATABASES['default']['OPTIONS']),
+        )
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        }
+    }
+    # SQLite production profile: WAL lets readers run while a write is in
+    # progress, IMMEDIATE transactions take the write lock up front instead
+    # of failing on lock upgrade, and the timeout (SQLite's busy_timeout)
+    # waits for the lock rather than raising "database is locked".
+    if os.environ.get('DB_SQLITE_PRODUCTION') == '1':
+        DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+    # DB_SQLITE_SHARDS extra files for per-user data
+    for index in range(1, int(os.environ.get('DB_SQLITE_SHARDS', 0)) + 1):
+        DATABASES[f'shard_{index}'] = dict(
+            DATABASES['default'],
+            NAME=BASE_DIR / f'db_shard_{index}.sqlite3',
+        )
+
+# Safe-method requests read from a replica; a client that writes is pinned
+# to the primary for REPLICA_STICKY_SECONDS (read-your-writes).
+REPLICA_DATABASES = [alias for alias in DATABASES if alias.startswith('replica_')]
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# Each user's recipes, tags and ingredients live on one of these (see
+# core.sharding); the default database is the first shard. New users are
+# placed by consistent hashing with SHARD_VIRTUAL_NODES points per shard,
+# and each shard's ids start SHARD_ID_SPAN after the previous one's.
+SHARD_DATABASES = [
+    alias for alias in DATABASES
+    if alias == 'default' or alias.startswith('shard_')
+]
+SHARD_VIRTUAL_NODES = int(os.environ.get('SHARD_VIRTUAL_NODES', 100))
+SHARD_ID_SPAN = 2 ** 40
+# User placements are cached this long; moves wait for it between steps
+SHARD_DIRECTORY_CACHE_SECONDS = int(
+    os.environ.get('SHARD_DIRECTORY_CACHE_SECONDS', 30)
+)
+DATABASE_ROUTERS = ['core.routers.ShardRouter', 'core.routers.ReplicaRouter']
+
+# A cache shared by all workers when REDIS_URL is set (requires the redis
+# package); otherwise each process has its own. Replicas require one.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -98,6 +225,28 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# PASSWORD_HASH_ITERATIONS sets the PBKDF2 work factor for this environment
+# (Django's default when unset); existing hashes are upgraded on login.
+# PASSWORD_HASH_WORKERS > 0 lets at most that many hashes run at once on
+# the host, sharing slots in PASSWORD_HASH_SLOTS_PATH between all workers,
+# so a login burst cannot pin every CPU.
+
+PASSWORD_HASHERS = [
+    'user.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 0))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+PASSWORD_HASH_SLOTS_PATH = os.environ.get(
+    'PASSWORD_HASH_SLOTS_PATH',
+    os.path.join(tempfile.gettempdir(), 'recipe-api-password-hash'),
+)
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 2))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -120,6 +269,52 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT='/vol/web/media'
 STATIC_ROOT='/vol/web/static'
 
+# Account export archives are private, so they are kept outside MEDIA_ROOT
+EXPORT_ROOT = os.environ.get('EXPORT_ROOT', '/vol/web/exports')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'exports': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': EXPORT_ROOT},
+    },
+}
+
+# How media files are sent: empty streams them from the worker (with
+# zero-copy sendfile where the WSGI server supports it), 'x-accel-redirect'
+# hands them to nginx at MEDIA_ACCEL_PREFIX (an internal location aliased
+# to MEDIA_ROOT) and 'x-sendfile' to Apache or lighttpd
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Files not named by their content may change, so they are cached briefly
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 3600))
+
+# Uploads larger than this are streamed to a temporary file instead of
+# being kept in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(
+    os.environ.get('FILE_UPLOAD_MAX_MEMORY_SIZE', 1024 * 1024)
+)
+
+# Recipe image limits, checked from the image header before it is decoded
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)
+)
+IMAGE_UPLOAD_FORMATS = [
+    name.strip().upper()
+    for name in os.environ.get(
+        'IMAGE_UPLOAD_FORMATS', 'JPEG,PNG,GIF,WEBP',
+    ).split(',')
+    if name.strip()
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -132,13 +327,103 @@ TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 
 
 
+# Auth tokens expire AUTH_TOKEN_TTL after their last refresh. Use extends
+# the expiry at most once per AUTH_TOKEN_REFRESH_INTERVAL to keep writes
+# off the auth hot path.
+AUTH_TOKEN_TTL = timedelta(
+    seconds=int(os.environ.get('AUTH_TOKEN_TTL_SECONDS', 7 * 24 * 3600))
+)
+AUTH_TOKEN_REFRESH_INTERVAL = timedelta(
+    seconds=int(os.environ.get('AUTH_TOKEN_REFRESH_INTERVAL_SECONDS', 3600))
+)
+
+
 # REST_FRAMEWORK settings
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': ['core.throttling.BucketThrottle'],
 }
 
 
 # drf_spectacular settings
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
-}
\ No newline at end of file
+}
+
+# Deep health check settings
+HEALTH_CHECK_CACHE_SECONDS = float(
+    os.environ.get('HEALTH_CHECK_CACHE_SECONDS', 5)
+)
+HEALTH_CHECK_THRESHOLDS_MS = {
+    'database': float(os.environ.get('HEALTH_CHECK_DB_MS', 100)),
+    'storage': float(os.environ.get('HEALTH_CHECK_STORAGE_MS', 250)),
+    'cache': float(os.environ.get('HEALTH_CHECK_CACHE_MS', 50)),
+    'tasks': float(os.environ.get('HEALTH_CHECK_TASKS_MS', 100)),
+}
+HEALTH_CHECK_TASK_LATENCY_SECONDS = float(
+    os.environ.get('HEALTH_CHECK_TASK_LATENCY_SECONDS', 60)
+)
+
+
+# OpenAPI schema cache. The schema is regenerated when APP_VERSION changes
+# (or, when unset, when the project's source files change).
+APP_VERSION = os.environ.get('APP_VERSION', '')
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR', BASE_DIR / 'schema')
+SCHEMA_CACHE_MAX_AGE = int(os.environ.get('SCHEMA_CACHE_MAX_AGE', 86400))
+
+
+# Budget for process start-up plus the first request, checked by the
+# profile_startup management command (0 disables the check). Measured at
+# about 350-550 ms on a development machine.
+STARTUP_TARGET_MS = float(os.environ.get('STARTUP_TARGET_MS', 1000))
+
+
+# Delta sync (/api/recipe/sync/). Changes become visible after
+# SYNC_SETTLE_SECONDS, so transactions still committing aren't skipped.
+# Tombstones are kept for SYNC_TOMBSTONE_RETENTION; older sync tokens get
+# 410 and must sync from scratch.
+SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', 2))
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 500))
+SYNC_TOMBSTONE_RETENTION = timedelta(
+    days=int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+)
+
+
+# Batch endpoint (/api/batch/): sub-requests per batch, and threads used
+# for reads when a batch asks for parallel execution
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+
+
+# Users whose similar recipes index is kept in memory per process
+SIMILAR_RECIPES_CACHE_USERS = int(
+    os.environ.get('SIMILAR_RECIPES_CACHE_USERS', 100)
+)
+
+
+# Token bucket throttling per user (or client IP) and route class. Rates
+# are "<requests>/<s|min|hour|day>"; an empty value disables a class. The
+# buckets are kept in THROTTLE_STORE_PATH, shared by the workers of a host.
+THROTTLE_RATES = {
+    'reads': os.environ.get('THROTTLE_READS_RATE', '1200/min'),
+    'writes': os.environ.get('THROTTLE_WRITES_RATE', '300/min'),
+    'uploads': os.environ.get('THROTTLE_UPLOADS_RATE', '30/min'),
+    'token': os.environ.get('THROTTLE_TOKEN_RATE', '30/min'),
+}
+THROTTLE_STORE_PATH = os.environ.get(
+    'THROTTLE_STORE_PATH',
+    os.path.join(tempfile.gettempdir(), 'recipe-api-throttle'),
+)
+THROTTLE_SLOTS = int(os.environ.get('THROTTLE_SLOTS', 65536))
+
+
+# Background tasks (core.tasks, run by python manage.py run_tasks)
+TASK_WORKER_CONCURRENCY = int(os.environ.get('TASK_WORKER_CONCURRENCY', 2))
+TASK_POLL_INTERVAL = float(os.environ.get('TASK_POLL_INTERVAL', 1))
+TASK_RETENTION = timedelta(
+    days=int(os.environ.get('TASK_RETENTION_DAYS', 7))
+)
+
+
+# Account exports: builds run at once across all task workers
+EXPORT_CONCURRENCY = int(os.environ.get('EXPORT_CONCURRENCY', 2))
@@ -1,29 +1,30 @@
-from drf_spectacular.views import(
-    SpectacularAPIView, 
-    SpectacularRedocView, 
-    SpectacularSwaggerView
-)
-from django.contrib import admin
-from django.urls import path,include
+import re
+
+from django.urls import path,include,re_path
 from django.conf import settings
-from django.conf.urls.static import static
 
 from core import views as core_views
+from core.lazy import lazy_include, lazy_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    lazy_include('admin/', 'app.admin_urls', namespace='admin'),
     path('api/health-check/', core_views.health_check, name='health-check'),
+    path('api/batch/', core_views.batch, name='batch'),
     
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
-    path('api/docs/',SpectacularSwaggerView.as_view(url_name='api-schema'),name='api-docs',),
+    # The schema views import drf_spectacular's generator, so they are
+    # only loaded when first requested.
+    path('api/schema/', lazy_view('core.schema.CachedSpectacularAPIView'), name='api-schema'),
+    path('api/docs/',lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='api-schema'),name='api-docs',),
 
     path('api/user/',include('user.urls')),
     path('api/recipe/',include('recipe.urls')),
 ]
 
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, 
-        document_root=settings.MEDIA_ROOT,
-    )
\ No newline at end of file
+# Uploaded files are served in production too; see core.files.serve_media
+urlpatterns += [
+    re_path(
+        r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+        core_views.media,
+        name='media',
+    ),
+]
\ No newline at end of file
@@ -0,0 +1,59 @@
+'''Benchmark per-request database connection overhead
+
+Simulates the request cycle Django runs in production (request_started,
+one query, request_finished) so connections are opened and closed exactly
+as they would be by a WSGI worker, once with CONN_MAX_AGE=0 and once with
+persistent connections.
+
+Usage:
+    python benchmarks/bench_connections.py [--requests N]
+'''
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+import django
+
+django.setup()
+
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+
+def run(requests, conn_max_age):
+    """Return the mean time per simulated request in microseconds"""
+    connection.close()
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_started.send(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        request_finished.send(sender=None)
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    vendor = connection.vendor
+    per_request = run(args.requests, conn_max_age=0)
+    persistent = run(args.requests, conn_max_age=600)
+    print(f'{vendor}: {args.requests} requests')
+    print(f'  CONN_MAX_AGE=0    {per_request:10.1f} us/request')
+    print(f'  CONN_MAX_AGE=600  {persistent:10.1f} us/request')
+    print(f'  connection overhead saved: {per_request - persistent:.1f} us/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''Benchmark similar recipe queries against a large in-memory index
+
+Fills a RecipeIndex with synthetic recipes, each with a few tags and
+ingredients drawn with a skewed popularity, and times top-k queries
+under both metrics. No database is needed.
+
+Usage:
+    python benchmarks/bench_similar_recipes.py [--recipes N] [--tags N]
+        [--ingredients N] [--queries N] [--limit N]
+'''
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+import django
+
+django.setup()
+
+from recipe.similarity import RecipeIndex
+
+
+def build(recipes, tags, ingredients):
+    """Return an index of synthetic recipes"""
+    rng = random.Random(42)
+    tag_weights = [1 / (rank + 1) for rank in range(tags)]
+    ingredient_weights = [1 / (rank + 1) for rank in range(ingredients)]
+    index = RecipeIndex(user_id=None)
+    for recipe_id in range(1, recipes + 1):
+        features = {
+            ('tags', t)
+            for t in rng.choices(range(tags), tag_weights, k=3)
+        } | {
+            ('ingredients', i)
+            for i in rng.choices(range(ingredients), ingredient_weights, k=6)
+        }
+        index._add(recipe_id, features)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type=int, default=100_000)
+    parser.add_argument('--tags', type=int, default=50)
+    parser.add_argument('--ingredients', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = build(args.recipes, args.tags, args.ingredients)
+    print(f'Built index of {args.recipes} recipes in '
+          f'{time.perf_counter() - start:.1f} s')
+
+    query_ids = random.Random(7).sample(range(1, args.recipes + 1),
+                                        args.queries)
+    for metric in ('jaccard', 'weighted'):
+        timings = []
+        for recipe_id in query_ids:
+            start = time.perf_counter()
+            index.similar(recipe_id, args.limit, metric)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f'{metric:>8}: median {statistics.median(timings):.1f} ms, '
+              f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+'''Benchmark SQLite read throughput while writes are in progress
+
+Runs reader threads against a recipe-shaped table while one writer thread
+keeps inserting rows in small transactions, once with SQLite defaults and
+once with SQLITE_PRODUCTION_OPTIONS from app.settings.
+
+Usage:
+    python benchmarks/bench_sqlite_concurrency.py [--readers N] [--seconds S]
+'''
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import django
+from django.conf import settings
+
+from app import settings as app_settings
+
+WORKDIR = tempfile.mkdtemp()
+
+settings.configure(
+    DATABASES={
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(WORKDIR, 'default.sqlite3'),
+        },
+        'production': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(WORKDIR, 'production.sqlite3'),
+            'OPTIONS': app_settings.SQLITE_PRODUCTION_OPTIONS,
+        },
+    },
+)
+django.setup()
+
+from django.db import connections, transaction
+from django.db.utils import OperationalError
+
+
+def setup(alias, rows=10000):
+    """Create and fill the benchmark table"""
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'CREATE TABLE recipe (id INTEGER PRIMARY KEY, user_id INTEGER,'
+            ' title TEXT, price REAL)'
+        )
+        cursor.executemany(
+            'INSERT INTO recipe (user_id, title, price) VALUES (%s, %s, %s)',
+            [(i % 100, f'Recipe {i}', i % 50) for i in range(rows)],
+        )
+    connections[alias].close()
+
+
+def run(alias, readers, seconds):
+    """Return reads/sec, read errors and writes completed"""
+    stop = threading.Event()
+    counts = {'reads': 0, 'errors': 0, 'writes': 0}
+    lock = threading.Lock()
+
+    def reader(user_id):
+        reads = errors = 0
+        while not stop.is_set():
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(
+                        'SELECT id, title, price FROM recipe'
+                        ' WHERE user_id = %s ORDER BY id DESC LIMIT 20',
+                        [user_id],
+                    )
+                    cursor.fetchall()
+                reads += 1
+            except OperationalError:
+                errors += 1
+        connections[alias].close()
+        with lock:
+            counts['reads'] += reads
+            counts['errors'] += errors
+
+    def writer():
+        writes = 0
+        while not stop.is_set():
+            try:
+                with transaction.atomic(using=alias):
+                    with connections[alias].cursor() as cursor:
+                        for _ in range(20):
+                            cursor.execute(
+                                'INSERT INTO recipe (user_id, title, price)'
+                                ' VALUES (%s, %s, %s)',
+                                [writes % 100, 'New recipe', 1],
+                            )
+                        time.sleep(0.002)
+                writes += 1
+            except OperationalError:
+                pass
+        connections[alias].close()
+        counts['writes'] = writes
+
+    threads = [threading.Thread(target=writer)]
+    threads += [
+        threading.Thread(target=reader, args=(i,)) for i in range(readers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return counts['reads'] / seconds, counts['errors'], counts['writes']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for alias in ('default', 'production'):
+        setup(alias)
+        throughput, errors, writes = run(alias, args.readers, args.seconds)
+        print(
+            f'{alias:>10}: {throughput:10.0f} reads/sec, '
+            f'{errors} locked reads, {writes} write transactions'
+        )
+
+
+if __name__ == '__main__':
+    main()
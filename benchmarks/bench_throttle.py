@@ -0,0 +1,120 @@
+'''Benchmark the overhead of a throttle check
+
+Times BucketStore.take and a full BucketThrottle.allow_request in one
+process, then runs several processes against the same bucket file, each
+on its own bucket and all on one shared bucket, and checks that the
+shared bucket hands out exactly its capacity across processes.
+
+Usage:
+    python benchmarks/bench_throttle.py [--checks N] [--processes N]
+'''
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.request import Request
+
+from core.throttling import BucketStore, BucketThrottle
+
+
+SLOTS = 65536
+
+
+def time_checks(store, key, checks):
+    """Return microseconds per take() on one bucket"""
+    start = time.perf_counter()
+    for _ in range(checks):
+        store.take(key, 1e12, 1e12)
+    return (time.perf_counter() - start) / checks * 1e6
+
+
+def worker(path, key, checks, results):
+    store = BucketStore(path, SLOTS)
+    results.put(time_checks(store, key, checks))
+
+
+def drain(path, checks, results):
+    store = BucketStore(path, SLOTS)
+    results.put(sum(
+        store.take('shared-drain', 1000, 1e-9)[0] for _ in range(checks)
+    ))
+
+
+def run_processes(target, path, processes, args):
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=target, args=(path, *args(number), results),
+        )
+        for number in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    values = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checks', type=int, default=200_000)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'buckets')
+        store = BucketStore(path, SLOTS)
+        print(f'take(), 1 process: {time_checks(store, "key", args.checks):.2f} us')
+
+        request = Request(RequestFactory().get('/api/recipe/recipe/'))
+        request.user = get_user_model()(id=1)
+        throttle = BucketThrottle()
+        with override_settings(
+            THROTTLE_STORE_PATH=path,
+            THROTTLE_SLOTS=SLOTS,
+            THROTTLE_RATES={'reads': '1000000000/s'},
+        ):
+            start = time.perf_counter()
+            for _ in range(args.checks):
+                throttle.allow_request(request, None)
+            elapsed = time.perf_counter() - start
+        print(f'allow_request(), 1 process: {elapsed / args.checks * 1e6:.2f} us')
+
+        for label, key in (('own', lambda n: f'key-{n}'),
+                           ('shared', lambda n: 'shared')):
+            timings = run_processes(
+                worker, path, args.processes,
+                lambda n: (key(n), args.checks),
+            )
+            print(
+                f'take(), {args.processes} processes, {label} bucket: '
+                f'{max(timings):.2f} us (slowest process)'
+            )
+
+        allowed = run_processes(
+            drain, path, args.processes, lambda n: (2000,),
+        )
+        print(
+            f'shared bucket of 1000 tokens, {args.processes} processes: '
+            f'{sum(allowed)} allowed {allowed}'
+        )
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
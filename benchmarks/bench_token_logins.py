@@ -0,0 +1,88 @@
+'''Benchmark /api/user/token/ logins per second
+
+Logs in concurrently from several client threads under each hashing
+profile: Django's default work factor inline, a reduced work factor
+inline, and the reduced work factor offloaded to the hashing pool. Runs
+against a throwaway test database.
+
+Usage:
+    python benchmarks/bench_token_logins.py [--logins N] [--threads N]
+        [--iterations N] [--workers N]
+'''
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+
+EMAIL = 'bench@example.com'
+PASSWORD = 'benchpass123'
+
+
+def run(logins, threads):
+    """Return logins/sec for the current settings"""
+    get_user_model().objects.filter(email=EMAIL).delete()
+    get_user_model().objects.create_user(email=EMAIL, password=PASSWORD)
+    url = reverse('user:token')
+
+    def login(_):
+        res = APIClient().post(url, {'email': EMAIL, 'password': PASSWORD})
+        assert res.status_code == 200, res.data
+
+    login(None)  # upgrade the hash and start the pool outside the timing
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(login, range(logins)))
+    return logins / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+    profiles = [
+        ('default work factor, inline', {
+            'PASSWORD_HASH_ITERATIONS': 0,
+            'PASSWORD_HASH_WORKERS': 0,
+        }),
+        (f'{args.iterations} iterations, inline', {
+            'PASSWORD_HASH_ITERATIONS': args.iterations,
+            'PASSWORD_HASH_WORKERS': 0,
+        }),
+        (f'{args.iterations} iterations, {args.workers} hashing slots', {
+            'PASSWORD_HASH_ITERATIONS': args.iterations,
+            'PASSWORD_HASH_WORKERS': args.workers,
+            'PASSWORD_HASH_TIMEOUT': 60,
+        }),
+    ]
+    for label, overrides in profiles:
+        # Measure hashing, not the token issuance throttle
+        with override_settings(THROTTLE_RATES={}, **overrides):
+            rate = run(args.logins, args.threads)
+        print(f'{label:>40}: {rate:8.1f} logins/sec')
+
+
+if __name__ == '__main__':
+    main()
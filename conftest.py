@@ -0,0 +1,16 @@
+'''Settings shared by the whole test run'''
+import pytest
+from django.test import override_settings
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_throttling(tmp_path_factory):
+    """Turn throttling off, with buckets in a file of this run's own
+
+    The default THROTTLE_STORE_PATH outlives the run and is shared with
+    other runs on the host. core/tests/test_throttling.py turns the rates
+    back on for its own tests, each with a fresh store.
+    """
+    store = tmp_path_factory.mktemp('throttle') / 'buckets'
+    with override_settings(THROTTLE_RATES={}, THROTTLE_STORE_PATH=str(store)):
+        yield
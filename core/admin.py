@@ -1,6 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from core import models
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import cached_property
+from core import models, sharding
 from django.utils.translation import gettext as _
 
 # Register your models here.
@@ -41,7 +47,221 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+
+
+CURSOR_VAR = 'cursor'
+SHARD_VAR = 'shard'
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that reads unfiltered table sizes from planner statistics
+
+    On Postgres an unfiltered COUNT(*) scans the whole table, so large
+    tables use pg_class.reltuples instead. Filtered querysets and other
+    databases fall back to an exact count.
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.estimate_threshold:
+                return row[0]
+        return super().count
+
+
+class CursorChangeList(ChangeList):
+    """Changelist that pages by primary key instead of OFFSET
+
+    Each page is read with "pk < cursor ORDER BY pk DESC LIMIT n", so
+    deep pages cost the same as the first one. Sorting by other columns
+    is disabled because the cursor relies on the primary key order.
+    """
+    cursor_paging = True
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        self.uncursored_queryset = queryset
+        self.cursor = request.GET.get(CURSOR_VAR)
+        if self.cursor:
+            try:
+                queryset = queryset.filter(pk__lt=int(self.cursor))
+            except ValueError:
+                self.cursor = None
+        return queryset
+
+    def get_results(self, request):
+        page = list(self.queryset[:self.list_per_page + 1])
+        self.result_list = page[:self.list_per_page]
+        self.paginator = self.model_admin.get_paginator(
+            request, self.uncursored_queryset, self.list_per_page,
+        )
+        self.result_count = self.paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor) or len(page) > self.list_per_page
+        self.next_page_url = None
+        if len(page) > self.list_per_page:
+            self.next_page_url = self.get_query_string(
+                {CURSOR_VAR: self.result_list[-1].pk},
+            )
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR])
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Pick the shard a changelist of per-user data reads from
+
+    The shard is selected by ScalableModelAdmin.changelist_view; without
+    a choice the default database is listed.
+    """
+    title = _('shard')
+    parameter_name = SHARD_VAR
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.SHARD_DATABASES]
+
+    def queryset(self, request, queryset):
+        return queryset
+
+    def choices(self, changelist):
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': (self.value() or DEFAULT_DB_ALIAS) == alias,
+                'query_string': changelist.get_query_string(
+                    {SHARD_VAR: alias}, remove=[CURSOR_VAR],
+                ),
+                'display': title,
+            }
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """Admin for tables too large for exact counts and OFFSET paging
+
+    With sharding, the changelist reads the shard picked in its "shard"
+    filter, and an object's pages the shard that holds it (ids are
+    unique across shards).
+    """
+    ordering = ('-id',)
+    sortable_by = ()
+    list_per_page = 100
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
+
+    def get_list_select_related(self, request):
+        # Users are only on the default database, so a join on another
+        # shard would find none; get_queryset prefetches them instead
+        if sharding.is_sharded():
+            return ()
+        return super().get_list_select_related(request)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if sharding.is_sharded():
+            queryset = queryset.prefetch_related('user')
+        return queryset
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if sharding.is_sharded():
+            return (ShardListFilter, *list_filter)
+        return list_filter
+
+    def _shard_of(self, object_id):
+        for alias in settings.SHARD_DATABASES:
+            try:
+                if self.model._base_manager.using(alias).filter(
+                    pk=object_id,
+                ).exists():
+                    return alias
+            except (ValueError, ValidationError):
+                break
+        return DEFAULT_DB_ALIAS
+
+    def _on_shard(self, alias, view, *args, **kwargs):
+        if not sharding.is_sharded():
+            return view(*args, **kwargs)
+        with sharding.use_shard(alias):
+            response = view(*args, **kwargs)
+            # Templates may still query, so render on the shard
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        alias = request.GET.get(SHARD_VAR)
+        if alias not in settings.SHARD_DATABASES:
+            alias = DEFAULT_DB_ALIAS
+        return self._on_shard(
+            alias, super().changelist_view, request, extra_context,
+        )
+
+    def changeform_view(self, request, object_id=None, form_url='',
+                        extra_context=None):
+        # New objects are saved to their user's shard by the router
+        alias = (
+            self._shard_of(object_id) if object_id is not None
+            else sharding.current_db()
+        )
+        return self._on_shard(
+            alias, super().changeform_view, request, object_id, form_url,
+            extra_context,
+        )
+
+    def delete_view(self, request, object_id, extra_context=None):
+        return self._on_shard(
+            self._shard_of(object_id), super().delete_view, request,
+            object_id, extra_context,
+        )
+
+    def history_view(self, request, object_id, extra_context=None):
+        return self._on_shard(
+            self._shard_of(object_id), super().history_view, request,
+            object_id, extra_context,
+        )
+
+
+class RecipeAdmin(ScalableModelAdmin):
+    list_display = ['id', 'title', 'user', 'time_minutes', 'price']
+    # Prefix and exact lookups only, so searches stay on the indexes
+    search_fields = ['title__startswith', 'user__email__exact']
+    autocomplete_fields = ['tags', 'ingredients']
+
+
+class RecipeAttrAdmin(ScalableModelAdmin):
+    list_display = ['id', 'name', 'user']
+    search_fields = ['name__startswith']
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after']
+    list_filter = ['status']
+    ordering = ('-id',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.Tag, RecipeAttrAdmin)
+admin.site.register(models.Ingredient, RecipeAttrAdmin)
+admin.site.register(models.Task, TaskAdmin)
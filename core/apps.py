@@ -1,6 +1,44 @@
 from django.apps import AppConfig
+from django.contrib.admin.apps import SimpleAdminConfig
+from django.core import checks
 
 
 class CoreConfig(AppConfig):
+    # apps.py also holds LazyAdminConfig, so 'core' must name its config
+    default = True
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from core import sharding, stats, sync  # noqa: F401 (connects signal receivers)
+        from core.routers import check_replica_cache
+
+        post_migrate.connect(sharding.reserve_id_ranges, sender=self)
+        checks.register(check_replica_cache, checks.Tags.caches)
+
+
+def check_lazy_admin_app(app_configs, **kwargs):
+    """Load the admin modules before checking the registered ModelAdmins"""
+    from django.contrib.admin import autodiscover
+    from django.contrib.admin.checks import check_admin_app
+
+    autodiscover()
+    return check_admin_app(app_configs, **kwargs)
+
+
+# Create a new class LazyAdminConfig that inherits from SimpleAdminConfig
+class LazyAdminConfig(SimpleAdminConfig):
+    """Admin app that imports admin.py modules when the admin is first used
+
+    The admin URLconf (app.admin_urls) runs autodiscover, so processes
+    that only serve the API never import the ModelAdmin classes.
+    """
+
+    def ready(self):
+        from django.contrib.admin.checks import check_dependencies
+
+        checks.register(check_dependencies, checks.Tags.admin)
+        checks.register(check_lazy_admin_app, checks.Tags.admin)
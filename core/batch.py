@@ -0,0 +1,170 @@
+'''In-process execution of batched API requests
+
+The batch endpoint authenticates once and hands the resulting user and
+token to every sub-request, which is dispatched straight to the view its
+path resolves to, without another pass through the middleware. The
+middleware runs once, for the batch request: replica routing sees a
+POST, so every sub-request reads from the primary, and a write in any
+of them pins the user. The views' own permission and throttle classes
+still run, so each sub-request takes its own throttle token.
+
+Only JSON responses can be batched; a sub-request answered with a file
+or other streamed or non-JSON body gets 400 instead. Errors keep their
+status whatever their body: a sub-request that fails with, say, Django's
+HTML 500 page is reported as that 500 with a JSON detail.
+'''
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Request headers passed on from the batch request to its sub-requests
+INHERITED_META = (
+    'HTTP_ACCEPT_LANGUAGE',
+    'HTTP_HOST',
+    'HTTP_USER_AGENT',
+    'REMOTE_ADDR',
+    'SERVER_NAME',
+    'SERVER_PORT',
+    'SERVER_PROTOCOL',
+    'wsgi.url_scheme',
+)
+
+
+def build_request(request, method, path, body=None):
+    """Return a WSGIRequest for a sub-request of the batch request"""
+    url = urlsplit(path)
+    payload = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: request.META[key]
+        for key in INHERITED_META
+        if key in request.META
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': BytesIO(payload),
+    })
+    sub_request = WSGIRequest(environ)
+    # Read by rest_framework.request.Request instead of authenticating
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def _not_found():
+    return {'status': 404, 'body': {'detail': 'Not found.'}}
+
+
+def _not_batchable():
+    return {
+        'status': 400,
+        'body': {
+            'detail': 'This response cannot be batched, request it directly.',
+        },
+    }
+
+
+def _error(response):
+    if response.status_code >= 500:
+        detail = 'A server error occurred.'
+    else:
+        detail = response.reason_phrase
+    return {'status': response.status_code, 'body': {'detail': detail}}
+
+
+def execute(request, item):
+    """Run one sub-request and return its status and decoded body"""
+    path = urlsplit(item['path']).path
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return _not_found()
+    if match.url_name == 'batch':
+        return _not_found()
+
+    # Turn exceptions into responses as Django's handler would
+    view = convert_exception_to_response(
+        lambda sub_request: match.func(sub_request, *match.args, **match.kwargs)
+    )
+    response = view(build_request(
+        request, item['method'], item['path'], item.get('body'),
+    ))
+    if hasattr(response, 'render'):
+        response.render()
+
+    try:
+        if response.streaming:
+            # e.g. a file download; its body is never read
+            return _not_batchable()
+        body = None
+        if response.content:
+            content_type = response.get('Content-Type', '')
+            if not content_type.startswith('application/json'):
+                if response.status_code >= 400:
+                    return _error(response)
+                return _not_batchable()
+            body = json.loads(response.content)
+        return {'status': response.status_code, 'body': body}
+    finally:
+        response.close()
+
+
+def _execute_in_thread(request, item):
+    try:
+        return execute(request, item)
+    finally:
+        # Worker threads open their own connections
+        connections.close_all()
+
+
+def run(request, items, parallel=False):
+    """Run the sub-requests in order and return their results
+
+    With parallel, consecutive reads run concurrently on up to
+    BATCH_MAX_WORKERS threads; writes always run one at a time, in order.
+    """
+    results = [None] * len(items)
+    reads = []
+
+    def flush():
+        if len(reads) == 1:
+            index = reads[0]
+            results[index] = execute(request, items[index])
+        elif reads:
+            workers = min(settings.BATCH_MAX_WORKERS, len(reads))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Each thread gets a copy of the context, e.g. the
+                # replica routing state of the batch request
+                futures = {
+                    index: executor.submit(
+                        contextvars.copy_context().run,
+                        _execute_in_thread, request, items[index],
+                    )
+                    for index in reads
+                }
+            for index, future in futures.items():
+                results[index] = future.result()
+        reads.clear()
+
+    for index, item in enumerate(items):
+        if parallel and item['method'] in SAFE_METHODS:
+            reads.append(index)
+            continue
+        flush()
+        results[index] = execute(request, item)
+    flush()
+    return results
@@ -0,0 +1,193 @@
+'''File downloads with HTTP range requests
+
+A single "bytes=" range is answered with 206 Partial Content, so clients
+can resume interrupted downloads. Multiple ranges are not supported and
+get the whole file, which RFC 9110 allows.
+
+Media files are served by serve_media(), which answers conditional
+requests from the file's stat() alone and can hand the transfer itself
+to the front server (MEDIA_SENDFILE).
+'''
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+# Uploads are saved under a random UUID name (recipe_image_file_path), so
+# a name never refers to different content and may be cached for good
+CONTENT_NAMED_RE = re.compile(
+    r'(?:^|/)[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+    r'\.\w+$'
+)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested range starts past the end of the file"""
+
+
+def parse_range(header, size):
+    """Return the inclusive (start, end) bytes a Range header asks for
+
+    Return None when the header should be ignored and the whole file
+    sent, and raise RangeNotSatisfiable when no byte of the file is in
+    the range.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def _read(file, start, length):
+    """Yield length bytes of file from start, closing it when done"""
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def ranged_response(request, file, size, content_type, filename=None,
+                    etag=None):
+    """Return a response streaming file, or the part of it requested
+
+    An If-Range header that doesn't match etag asks for the whole file,
+    since it has changed since the client's partial download.
+    """
+    header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if header and if_range is not None and if_range != etag:
+        header = None
+
+    try:
+        byte_range = parse_range(header, size) if header else None
+    except RangeNotSatisfiable:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        # The WSGI server's file wrapper can send the whole file with
+        # zero-copy sendfile()
+        response = FileResponse(
+            file,
+            content_type=content_type,
+            as_attachment=bool(filename),
+            filename=filename or '',
+        )
+        if not filename:
+            response.headers.pop('Content-Disposition', None)
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read(file, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        if filename:
+            response['Content-Disposition'] = content_disposition_header(
+                as_attachment=True, filename=filename,
+            )
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+def _front_server_response(path, full_path, content_type):
+    """Return a response telling the front server to send the file"""
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+def serve_media(request, path):
+    """Return a response for the file at path under MEDIA_ROOT"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('File not found.')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('File not found.')
+
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    last_modified = int(stat_result.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified,
+    )
+    if response is None:
+        content_type = (
+            mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        )
+        if settings.MEDIA_SENDFILE:
+            # The front server handles ranges itself
+            response = _front_server_response(path, full_path, content_type)
+        else:
+            response = ranged_response(
+                request,
+                open(full_path, 'rb'),
+                stat_result.st_size,
+                content_type,
+                etag=etag,
+            )
+
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if CONTENT_NAMED_RE.search(path):
+            patch_cache_control(
+                response, public=True, max_age=IMMUTABLE_MAX_AGE,
+                immutable=True,
+            )
+        else:
+            patch_cache_control(
+                response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE,
+            )
+    return response
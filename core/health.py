@@ -0,0 +1,150 @@
+'''Dependency probes for the deep health check'''
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+
+from core import tasks
+
+
+STATUS_OK = 'ok'
+STATUS_DEGRADED = 'degraded'
+STATUS_DOWN = 'down'
+
+_lock = threading.Lock()
+_cached_result = None
+_cached_at = 0.0
+
+
+def _timed(probe):
+    """Run a probe and return its status and latency in milliseconds"""
+    start = time.perf_counter()
+    try:
+        details = probe() or {}
+    except Exception as exc:
+        latency = (time.perf_counter() - start) * 1000
+        return {
+            'status': STATUS_DOWN,
+            'latency_ms': round(latency, 2),
+            'error': exc.__class__.__name__,
+        }
+    latency = (time.perf_counter() - start) * 1000
+    return {'status': STATUS_OK, 'latency_ms': round(latency, 2), **details}
+
+
+def probe_database():
+    """Run a round-trip query against every configured database"""
+    for alias in connections:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
+
+def probe_storage():
+    """Write, read back and delete a small file in media storage"""
+    payload = uuid.uuid4().hex.encode()
+    name = default_storage.save(
+        f'health-check/{uuid.uuid4().hex}.txt',
+        ContentFile(payload),
+    )
+    try:
+        with default_storage.open(name) as stored:
+            if stored.read() != payload:
+                raise IOError('Storage returned unexpected content')
+    finally:
+        default_storage.delete(name)
+
+
+def probe_cache():
+    """Set and read back a key in the default cache"""
+    key = f'health-check:{uuid.uuid4().hex}'
+    cache.set(key, 1, timeout=5)
+    try:
+        if cache.get(key) != 1:
+            raise IOError('Cache returned unexpected value')
+    finally:
+        cache.delete(key)
+
+
+def probe_tasks():
+    """Report the background task queue depth and latency"""
+    return tasks.stats()
+
+
+PROBES = {
+    'database': probe_database,
+    'storage': probe_storage,
+    'cache': probe_cache,
+    'tasks': probe_tasks,
+}
+
+
+def run_probes():
+    """Run every probe and grade it against the configured thresholds"""
+    thresholds = settings.HEALTH_CHECK_THRESHOLDS_MS
+    checks = {}
+    for name, probe in PROBES.items():
+        result = _timed(probe)
+        limit = thresholds.get(name)
+        if (
+            result['status'] == STATUS_OK
+            and limit is not None
+            and result['latency_ms'] > limit
+        ):
+            result['status'] = STATUS_DEGRADED
+        checks[name] = result
+
+    # Tasks waiting longer than this suggest too few or no workers
+    queue = checks['tasks']
+    if (
+        queue['status'] == STATUS_OK
+        and queue['latency_seconds'] > settings.HEALTH_CHECK_TASK_LATENCY_SECONDS
+    ):
+        queue['status'] = STATUS_DEGRADED
+
+    statuses = {check['status'] for check in checks.values()}
+    if STATUS_DOWN in statuses:
+        overall = STATUS_DOWN
+    elif STATUS_DEGRADED in statuses:
+        overall = STATUS_DEGRADED
+    else:
+        overall = STATUS_OK
+
+    return {
+        'healthy': overall != STATUS_DOWN,
+        'status': overall,
+        'checks': checks,
+    }
+
+
+def get_deep_health():
+    """Return the probe result, reusing it within the cache window
+
+    The result is kept in process memory rather than in the Django cache,
+    since the cache itself is one of the probed dependencies.
+    """
+    global _cached_result, _cached_at
+
+    ttl = settings.HEALTH_CHECK_CACHE_SECONDS
+    with _lock:
+        now = time.monotonic()
+        if _cached_result is None or now - _cached_at >= ttl:
+            _cached_result = run_probes()
+            _cached_at = now
+        age = now - _cached_at
+
+    return dict(_cached_result, cached_for_seconds=round(age, 2))
+
+
+def reset_cache():
+    """Forget the cached probe result"""
+    global _cached_result, _cached_at
+
+    with _lock:
+        _cached_result = None
+        _cached_at = 0.0
@@ -0,0 +1,99 @@
+'''Cheap checks of uploaded images before they are decoded
+
+Decoded, an image takes width x height x 4 bytes or so however small
+the file is, so a crafted upload of a few KB can claim gigabytes.
+check_image() reads only the header to learn the format and dimensions
+and rejects the upload before anything decodes it, and
+MaxSizeUploadHandler stops keeping an upload once it is too large.
+'''
+import io
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """Drop the rest of an upload once it is larger than max_bytes
+
+    The upload is replaced with an empty file that keeps its name and
+    size, so check_image() can report it. Install it ahead of the
+    default handlers, which stream large uploads to temporary files.
+    """
+
+    def __init__(self, max_bytes, request=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received <= self.max_bytes:
+            return None
+        return UploadedFile(
+            io.BytesIO(),
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.received,
+        )
+
+
+def _too_many_pixels(actual):
+    return ValidationError(
+        'Ensure the image has at most %(max)s pixels (it is %(actual)s).',
+        code='max_pixels',
+        params={'max': settings.IMAGE_UPLOAD_MAX_PIXELS, 'actual': actual},
+    )
+
+
+def check_image(file):
+    """Check an uploaded image against the IMAGE_UPLOAD_* limits
+
+    Only the image header is read. Raise ValidationError when the file
+    is too large, isn't an image in an allowed format or has too many
+    pixels.
+    """
+    max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+    if file.size > max_bytes:
+        raise ValidationError(
+            'Ensure the image is at most %(max)s (it is %(size)s).',
+            code='max_bytes',
+            params={
+                'max': filesizeformat(max_bytes),
+                'size': filesizeformat(file.size),
+            },
+        )
+
+    # Pillow is only needed by uploads, not at start-up
+    from PIL import Image, UnidentifiedImageError
+
+    formats = settings.IMAGE_UPLOAD_FORMATS
+    file.seek(0)
+    try:
+        # Opening reads the header; pixel data is only read on load()
+        with Image.open(file, formats=formats) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        # Pillow's own limit, for images far larger than it can decode
+        raise _too_many_pixels('far more')
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        raise ValidationError(
+            'Upload a valid image in one of these formats: %(formats)s.',
+            code='invalid_image',
+            params={'formats': ', '.join(formats)},
+        )
+    finally:
+        file.seek(0)
+
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise _too_many_pixels(f'{width} x {height}')
@@ -0,0 +1,45 @@
+'''Deferred loading of heavyweight views
+
+Views such as the schema and docs pull in large parts of drf_spectacular,
+and the admin pulls in its forms, templates and ModelAdmins. Wiring them
+through these helpers keeps those imports out of process start-up; they
+happen on the first request that needs them.
+'''
+import threading
+
+from django.urls import URLResolver
+from django.urls.resolvers import RoutePattern
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """Return a view that imports a class-based view on first request"""
+    lock = threading.Lock()
+    view = None
+
+    @csrf_exempt
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            with lock:
+                if view is None:
+                    view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+
+def lazy_include(route, urlconf_module, namespace):
+    """Like path(route, include(...)) but imports the URLconf when used
+
+    The URLconf module is only imported once a request path falls under
+    route or a URL in its namespace is reversed.
+    """
+    return URLResolver(
+        RoutePattern(route, is_endpoint=False),
+        urlconf_module,
+        app_name=namespace,
+        namespace=namespace,
+    )
@@ -0,0 +1,41 @@
+'''Batched work for maintenance commands on large tables
+
+Each batch is its own short statement or transaction, with a pause in
+between, so a long run holds no lock for long and leaves room for the
+API's queries.
+'''
+import time
+
+
+def run_in_batches(step, pause):
+    """Call step() until it returns None; return the sum of its results
+
+    step does one batch and returns how many rows it handled, or None
+    when nothing is left. Sleep pause seconds between batches.
+    """
+    total = 0
+    while True:
+        count = step()
+        if count is None:
+            return total
+        total += count
+        time.sleep(pause)
+
+
+def delete_in_batches(queryset, order_by, batch_size, pause):
+    """Delete the queryset's rows batch by batch; return how many
+
+    Batches are found in order_by order, which should be indexed.
+    """
+    def step():
+        ids = list(
+            queryset.order_by(order_by)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return None
+        # Filtering again keeps rows that stopped matching in between
+        count, _ = queryset.filter(pk__in=ids).delete()
+        return count
+
+    return run_in_batches(step, pause)
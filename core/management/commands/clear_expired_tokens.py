@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import maintenance
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired auth tokens in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Tokens deleted per statement',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between batches',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now()
+        # Found through the expires_at index
+        deleted = maintenance.delete_in_batches(
+            AuthToken.objects.filter(expires_at__lte=cutoff),
+            'expires_at',
+            options['batch_size'],
+            options['pause'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} expired tokens')
+        )
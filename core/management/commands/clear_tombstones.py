@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import maintenance, sharding
+from core.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete sync tombstones older than SYNC_TOMBSTONE_RETENTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Tombstones deleted per statement',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between batches',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - settings.SYNC_TOMBSTONE_RETENTION
+        deleted = 0
+        for alias in settings.SHARD_DATABASES:
+            with sharding.use_shard(alias):
+                deleted += self._clear(cutoff, options)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} tombstones')
+        )
+
+    def _clear(self, cutoff, options):
+        return maintenance.delete_in_batches(
+            Tombstone.objects.filter(deleted_at__lt=cutoff),
+            'deleted_at',
+            options['batch_size'],
+            options['pause'],
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import schema
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema for the current code version'
+
+    def handle(self, *args, **options):
+        path = schema.write()
+        self.stdout.write(self.style.SUCCESS(f'Schema written to {path}'))
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import maintenance, merge, sharding
+from core.models import Ingredient, Tag
+
+
+class Command(BaseCommand):
+    help = (
+        'Merge tags and ingredients whose names differ only in case or '
+        'spacing into the oldest of them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Groups of duplicates merged per transaction',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between batches',
+        )
+
+    def handle(self, *args, **options):
+        for model in (Tag, Ingredient):
+            merged = 0
+            for alias in settings.SHARD_DATABASES:
+                with sharding.use_shard(alias):
+                    merged += self._merge(model, options)
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Merged {merged} duplicate '
+                f'{model._meta.verbose_name_plural}'
+            ))
+
+    def _merge(self, model, options):
+        def step():
+            groups = list(
+                merge.duplicate_groups(model)[:options['batch_size']]
+            )
+            if not groups:
+                return None
+            return merge.merge_groups(model, groups)
+
+        return maintenance.run_in_batches(step, options['pause'])
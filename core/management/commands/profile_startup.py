@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Run in a fresh interpreter so that nothing is imported yet
+PROBE = '''
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+from app.wsgi import application
+ready = time.perf_counter()
+
+environ = {'PATH_INFO': %(path)r, 'HTTP_HOST': 'localhost'}
+setup_testing_defaults(environ)
+statuses = []
+body = application(environ, lambda status, headers: statuses.append(status))
+b''.join(body)
+done = time.perf_counter()
+
+json.dump({
+    'ready_ms': (ready - start) * 1000,
+    'first_request_ms': (done - ready) * 1000,
+    'status': statuses[0],
+}, sys.stdout)
+'''
+
+
+def parse_importtime(output):
+    """Sum -X importtime self times (in ms) per top-level package"""
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000
+    return packages
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start time and the import cost of each package'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='/api/health-check/',
+            help='Path of the first request to serve',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Number of packages to list',
+        )
+        parser.add_argument(
+            '--target-ms',
+            type=float,
+            default=settings.STARTUP_TARGET_MS,
+            help='Fail if start-up plus first request takes longer (0: off)',
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             PROBE % {'path': options['path']}],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Start-up failed:\n{result.stderr[-2000:]}')
+
+        timings = json.loads(result.stdout)
+        packages = parse_importtime(result.stderr)
+        ranked = sorted(packages.items(), key=lambda item: -item[1])
+        for package, ms in ranked[:options['top']]:
+            self.stdout.write(f'{ms:9.1f} ms  {package}')
+        self.stdout.write(
+            f'Imports: {sum(packages.values()):.1f} ms, '
+            f'app ready: {timings["ready_ms"]:.1f} ms, '
+            f'first request ({timings["status"]}): '
+            f'{timings["first_request_ms"]:.1f} ms'
+        )
+
+        total = timings['ready_ms'] + timings['first_request_ms']
+        target = options['target_ms']
+        if target and total > target:
+            raise CommandError(
+                f'Start-up took {total:.0f} ms, over the {target:.0f} ms target'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Start-up took {total:.0f} ms'))
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users' recipes, tags and ingredients to another shard while "
+        'the API keeps running'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'users',
+            nargs='*',
+            help='Emails of the users to move',
+        )
+        parser.add_argument(
+            '--to',
+            help='Shard to move them to (default: their consistent hashing '
+                 'shard)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Move every user not on their consistent hashing shard, '
+                 'e.g. after adding a shard',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows copied per statement',
+        )
+        parser.add_argument(
+            '--users-per-move',
+            type=int,
+            default=100,
+            help='Users moved together, sharing the --wait pauses',
+        )
+        parser.add_argument(
+            '--wait',
+            type=float,
+            default=settings.SHARD_DIRECTORY_CACHE_SECONDS,
+            help='Seconds for cached user placements to expire between steps',
+        )
+
+    def handle(self, *args, **options):
+        target = options['to']
+        if target is not None and target not in settings.SHARD_DATABASES:
+            raise CommandError(
+                f'Unknown shard {target!r}; shards are '
+                f'{", ".join(settings.SHARD_DATABASES)}.'
+            )
+        if options['all'] == bool(options['users']):
+            raise CommandError('Give the users to move, or --all.')
+
+        users = get_user_model().objects.order_by('id')
+        if options['users']:
+            users = users.filter(email__in=options['users'])
+            missing = set(options['users']) - set(
+                users.values_list('email', flat=True)
+            )
+            if missing:
+                raise CommandError(f'Unknown users: {", ".join(sorted(missing))}')
+
+        emails = {}
+        moves = []
+        moved = 0
+        for user_id, email in users.values_list('id', 'email').iterator():
+            destination = target or sharding.ring_database(user_id)
+            if sharding.db_for_user(user_id) == destination:
+                continue
+            emails[user_id] = email
+            moves.append((user_id, destination))
+            if len(moves) == options['users_per_move']:
+                moved += self._move(moves, emails, options)
+                moves = []
+        if moves:
+            moved += self._move(moves, emails, options)
+
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} users'))
+
+    def _move(self, moves, emails, options):
+        moved = sharding.move_users(
+            moves,
+            batch_size=options['batch_size'],
+            wait=options['wait'],
+        )
+        for user_id, source, destination, copied in moved:
+            self.stdout.write(
+                f'Moved {emails[user_id]} from {source} to {destination} '
+                f'({copied} rows)'
+            )
+        return len(moved)
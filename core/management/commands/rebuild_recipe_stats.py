@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core import sharding, stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-user recipe statistics from the recipe tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Only rebuild statistics for the user with this email',
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('id')
+        if options['user']:
+            users = users.filter(email=options['user'])
+
+        rebuilt = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            with sharding.for_user(user_id):
+                stats.rebuild(user_id)
+            rebuilt += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt recipe statistics for {rebuilt} users')
+        )
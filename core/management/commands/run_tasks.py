@@ -0,0 +1,103 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import tasks
+
+
+# Seconds between purges of old finished tasks
+PURGE_INTERVAL = 3600
+
+
+def _run_in_thread(task_obj, worker_id):
+    close_old_connections()
+    try:
+        return tasks.run(task_obj, worker_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.TASK_WORKER_CONCURRENCY,
+            help='Tasks run at once by this worker',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.TASK_POLL_INTERVAL,
+            help='Seconds to wait before looking for new tasks when idle',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no task is due instead of waiting for more',
+        )
+
+    def handle(self, *args, **options):
+        tasks.discover()
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        concurrency = options['concurrency']
+        stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stopping.set())
+
+        self.stdout.write(
+            f'Worker {worker_id} running {len(tasks.registry)} task types '
+            f'with concurrency {concurrency}'
+        )
+        ran = 0
+        purged_at = 0.0
+        running = set()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while not stopping.is_set():
+                # Drop connections past CONN_MAX_AGE or left broken
+                close_old_connections()
+                if time.monotonic() - purged_at >= PURGE_INTERVAL:
+                    tasks.purge()
+                    purged_at = time.monotonic()
+
+                free = concurrency - len(running)
+                claimed = tasks.claim(worker_id, free) if free else []
+                for task_obj in claimed:
+                    running.add(
+                        executor.submit(_run_in_thread, task_obj, worker_id)
+                    )
+
+                if not running:
+                    if options['once']:
+                        break
+                    stopping.wait(options['poll_interval'])
+                    continue
+                # Look for more work when a slot frees up or, for tasks
+                # that become due meanwhile, after the poll interval
+                done, running = wait(
+                    running,
+                    timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED,
+                )
+                ran += self._finished(done)
+            # Let tasks in progress finish before exiting
+            ran += self._finished(wait(running).done)
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} tasks'))
+
+    def _finished(self, futures):
+        for future in futures:
+            if future.exception() is not None:
+                self.stderr.write(
+                    f'Could not record a task outcome: {future.exception()!r}'
+                )
+        return len(futures)
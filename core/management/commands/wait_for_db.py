@@ -1,20 +1,104 @@
+import random
 import time
-from django.core.management.base import BaseCommand
-from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import DatabaseError, OperationalError
 from psycopg2 import OperationalError as Psycopg2Error
 
+
+def backoff_delays(initial, maximum, factor=2):
+    """Yield exponentially growing delays with full jitter"""
+    delay = initial
+    while True:
+        yield random.uniform(0, delay)
+        delay = min(delay * factor, maximum)
+
+
+def warm_up(alias):
+    """Open a connection and run the hot request-path queries once"""
+    from core.models import AuthToken, Recipe, Tag, Ingredient
+
+    connections[alias].ensure_connection()
+    AuthToken.objects.using(alias).select_related('user').filter(
+        key='',
+    ).first()
+    Recipe.objects.using(alias).order_by('-id').first()
+    Tag.objects.using(alias).order_by('-name').first()
+    Ingredient.objects.using(alias).order_by('-name').first()
+
+
 class Command(BaseCommand):
-    def handle(self, *args, **options):
-        self.stdout.write('Waiting for database...')
-        db_up = False
+    help = 'Wait until every configured database accepts connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Give up and exit non-zero after this many seconds',
+        )
+        parser.add_argument(
+            '--initial-delay',
+            type=float,
+            default=0.1,
+            help='First retry delay in seconds',
+        )
+        parser.add_argument(
+            '--max-delay',
+            type=float,
+            default=5,
+            help='Upper bound for a single retry delay in seconds',
+        )
+        parser.add_argument(
+            '--warm',
+            action='store_true',
+            help='Open connections and run the hot queries once when ready',
+        )
+
+    def retry(self, func, errors, deadline, delays, what):
+        """Call func until it doesn't raise errors or the deadline passes"""
         retry_count = 0
-        while not db_up:
+        while True:
             try:
-                self.check(databases=['default'])
-                db_up = True
-            except (Psycopg2Error, OperationalError):
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                return func()
+            except errors:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'{what} after {retry_count} retries'
+                    )
+                delay = min(next(delays), remaining)
+                self.stdout.write(f'{what}, waiting {delay:.2f} seconds...')
+                time.sleep(delay)
                 retry_count += 1
+
+    def warm_up(self, aliases):
+        try:
+            for alias in aliases:
+                warm_up(alias)
+        except DatabaseError:
+            # Don't reuse a connection that failed mid-query
+            connections.close_all()
+            raise
+
+    def handle(self, *args, **options):
+        self.stdout.write('Waiting for database...')
+        aliases = list(connections)
+        deadline = time.monotonic() + options['timeout']
+        delays = backoff_delays(options['initial_delay'], options['max_delay'])
+        self.retry(
+            lambda: self.check(databases=aliases),
+            (Psycopg2Error, OperationalError),
+            deadline, delays, 'Database unavailable',
+        )
         self.stdout.write(self.style.SUCCESS('Database available!'))
-        print(f"Sleep called {retry_count} times")
+
+        if options['warm']:
+            # Within the same deadline: a database can accept connections
+            # before it can answer queries
+            self.retry(
+                lambda: self.warm_up(aliases),
+                (Psycopg2Error, DatabaseError),
+                deadline, delays, 'Database warm-up failed',
+            )
+            self.stdout.write(self.style.SUCCESS('Database connections warmed'))
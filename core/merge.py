@@ -0,0 +1,100 @@
+'''Merging tags and ingredients whose names differ only in case or spacing
+
+Each group of duplicates is merged into its oldest item: the through-table
+rows of the others are pointed at it (or deleted, when the recipe already
+has it), then the others are deleted. Statistics, delta sync and the
+similar recipes index follow the change like any other edit.
+'''
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Min, Value, When
+
+from core import sharding, stats, sync
+from core.models import Ingredient, Recipe, Tag
+
+
+ATTRS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+
+def duplicate_groups(model):
+    """Return the (user_id, normalized_name) groups with several items"""
+    return (
+        model.objects.values('user_id', 'normalized_name')
+        .annotate(n=Count('id'), keeper=Min('id'))
+        .filter(n__gt=1)
+        .order_by('user_id', 'normalized_name')
+    )
+
+
+def merge_groups(model, groups):
+    """Merge the items of each group into its oldest one
+
+    Return the number of items removed.
+    """
+    attr = ATTRS[model]
+    through = getattr(Recipe, attr).through
+    column = through._meta.get_field(attr[:-1]).attname
+    keepers = {
+        (group['user_id'], group['normalized_name']): group['keeper']
+        for group in groups
+    }
+    if not keepers:
+        return 0
+
+    with transaction.atomic(using=sharding.current_db()):
+        items = model.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in keepers},
+            normalized_name__in={name for _, name in keepers},
+        ).values_list('id', 'user_id', 'normalized_name')
+        keeper_of = {}
+        for item_id, user_id, name in items:
+            if (user_id, name) in keepers:
+                keeper_of[item_id] = keepers[user_id, name]
+        duplicates = [
+            item_id for item_id, keeper in keeper_of.items()
+            if item_id != keeper
+        ]
+
+        # Keep one row per recipe and keeper, preferring the keeper's own
+        rows = sorted(
+            through.objects.filter(**{f'{column}__in': list(keeper_of)})
+            .values_list('id', 'recipe_id', column),
+            key=lambda row: (row[2] != keeper_of[row[2]], row[0]),
+        )
+        assigned = set()
+        redundant = []
+        moved = []
+        recipe_ids = set()
+        for row_id, recipe_id, item_id in rows:
+            keeper = keeper_of[item_id]
+            if (recipe_id, keeper) in assigned:
+                redundant.append(row_id)
+            else:
+                assigned.add((recipe_id, keeper))
+                if item_id == keeper:
+                    continue
+                moved.append(row_id)
+            recipe_ids.add(recipe_id)
+
+        through.objects.filter(id__in=redundant).delete()
+        if moved:
+            through.objects.filter(id__in=moved).update(**{column: Case(
+                *[
+                    When(**{column: item_id}, then=Value(keeper_of[item_id]))
+                    for item_id in duplicates
+                ],
+                default=F(column),
+                output_field=through._meta.get_field(column),
+            )})
+        sync.touch_recipes(list(recipe_ids))
+
+        # Signals record the tombstones and drop their statistics
+        model.objects.filter(id__in=duplicates).delete()
+        keepers_by_user = defaultdict(list)
+        for (user_id, _), keeper in keepers.items():
+            keepers_by_user[user_id].append(keeper)
+        for user_id, keeper_ids in keepers_by_user.items():
+            stats.recount_items(user_id, attr, keeper_ids)
+
+    return len(duplicates)
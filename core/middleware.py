@@ -0,0 +1,71 @@
+'''Middleware for the core app'''
+from django.conf import settings
+
+from core import routers, sharding
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """Route safe requests to replicas with read-your-writes stickiness
+
+    After a user writes, their reads stay on the primary for
+    REPLICA_STICKY_SECONDS so they never see data older than their own
+    write. The pin is keyed by user id, recorded with routers.set_user()
+    once the request is authenticated, and kept in the default cache,
+    which must be shared between workers (checked as core.E001).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+
+        # Session users (the admin) are loaded here, on the primary, before
+        # the routing state exists; token users are recorded by
+        # ExpiringTokenAuthentication
+        user_id = None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            if request.user.is_authenticated:
+                user_id = request.user.pk
+        state = {
+            'use_replica': request.method in SAFE_METHODS,
+            'wrote': False,
+            'user_id': None,
+        }
+        token = routers.routing_state.set(state)
+        try:
+            if user_id is not None:
+                routers.set_user(user_id)
+            response = self.get_response(request)
+        finally:
+            routers.routing_state.reset(token)
+
+        if state['user_id'] is not None and state['wrote']:
+            routers.pin(state['user_id'])
+
+        return response
+
+
+class ShardRoutingMiddleware:
+    """Route per-user tables to the shard of the request's user
+
+    The user is looked up when a sharded table is first queried, so this
+    also covers users authenticated later by the API views.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sharding.is_sharded():
+            return self.get_response(request)
+
+        token = sharding.current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            sharding.current_request.reset(token)
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:10
+
+import core.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_existing_tokens(apps, schema_editor):
+    """Carry over tokens issued before expiry was introduced"""
+    Token = apps.get_model("authtoken", "Token")
+    AuthToken = apps.get_model("core", "AuthToken")
+    db = schema_editor.connection.alias
+    AuthToken.objects.using(db).bulk_create(
+        [
+            AuthToken(
+                key=token.key,
+                user_id=token.user_id,
+                expires_at=core.models.default_token_expiry(),
+            )
+            for token in Token.objects.using(db).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_recipe_image"),
+        ("authtoken", "0004_alter_tokenproxy_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuthToken",
+            fields=[
+                (
+                    "key",
+                    models.CharField(
+                        default=core.models.generate_token_key,
+                        max_length=40,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "expires_at",
+                    models.DateTimeField(
+                        db_index=True, default=core.models.default_token_expiry
+                    ),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(copy_existing_tokens, migrations.RunPython.noop),
+    ]
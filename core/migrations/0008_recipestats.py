@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_authtoken"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("recipe_count", models.IntegerField(default=0)),
+                ("total_time_minutes", models.BigIntegerField(default=0)),
+                (
+                    "total_price",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("price_buckets", models.JSONField(default=dict)),
+                ("tag_counts", models.JSONField(default=dict)),
+                ("ingredient_counts", models.JSONField(default=dict)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:54
+
+from django.db import migrations, models
+
+
+def fill_normalized_names(apps, schema_editor):
+    """Normalize the names of existing tags and ingredients in batches"""
+    db = schema_editor.connection.alias
+    for model_name in ("Tag", "Ingredient"):
+        model = apps.get_model("core", model_name)
+        batch = []
+        for item in model.objects.using(db).only("id", "name").iterator(chunk_size=1000):
+            item.normalized_name = " ".join(item.name.split()).casefold()
+            batch.append(item)
+            if len(batch) == 1000:
+                model.objects.using(db).bulk_update(batch, ["normalized_name"])
+                batch = []
+        model.objects.using(db).bulk_update(batch, ["normalized_name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_sync_tracking"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingredient",
+            name="normalized_name",
+            field=models.CharField(default="", editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="tag",
+            name="normalized_name",
+            field=models.CharField(default="", editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_normalized_names, migrations.RunPython.noop),
+    ]
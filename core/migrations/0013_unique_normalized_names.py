@@ -0,0 +1,123 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:54
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.utils import timezone
+
+
+def merge_duplicates(apps, schema_editor):
+    """Merge names differing only in case or spacing into the oldest item
+
+    Recipes are moved over to the kept item and marked as changed, the
+    others leave tombstones, and the statistics of the users concerned
+    are dropped, to be rebuilt on their next read.
+    """
+    db = schema_editor.connection.alias
+    Recipe = apps.get_model("core", "Recipe")
+    RecipeStats = apps.get_model("core", "RecipeStats")
+    Tombstone = apps.get_model("core", "Tombstone")
+    for model_name, attr in (("Tag", "tags"), ("Ingredient", "ingredients")):
+        model = apps.get_model("core", model_name)
+        through = getattr(Recipe, attr).through
+        column = through._meta.get_field(attr[:-1]).attname
+        groups = (
+            model.objects.using(db).values("user_id", "normalized_name")
+            .annotate(n=Count("id"), keeper=Min("id"))
+            .filter(n__gt=1)
+        )
+        keepers = {
+            (group["user_id"], group["normalized_name"]): group["keeper"]
+            for group in groups.iterator()
+        }
+        if not keepers:
+            continue
+
+        keeper_of = {}
+        for item_id, user_id, name in (
+            model.objects.using(db)
+            .filter(user_id__in={user_id for user_id, _ in keepers})
+            .values_list("id", "user_id", "normalized_name")
+            .iterator()
+        ):
+            if (user_id, name) in keepers:
+                keeper_of[item_id] = keepers[user_id, name]
+        duplicates = [
+            item_id for item_id, keeper in keeper_of.items() if item_id != keeper
+        ]
+
+        # Keep one row per recipe and keeper, preferring the keeper's own
+        rows = sorted(
+            through.objects.using(db)
+            .filter(**{f"{column}__in": list(keeper_of)})
+            .values_list("id", "recipe_id", column),
+            key=lambda row: (row[2] != keeper_of[row[2]], row[0]),
+        )
+        assigned = set()
+        redundant = []
+        moved = defaultdict(list)
+        recipe_ids = set()
+        for row_id, recipe_id, item_id in rows:
+            keeper = keeper_of[item_id]
+            if (recipe_id, keeper) in assigned:
+                redundant.append(row_id)
+            else:
+                assigned.add((recipe_id, keeper))
+                if item_id == keeper:
+                    continue
+                moved[keeper].append(row_id)
+            recipe_ids.add(recipe_id)
+
+        now = timezone.now()
+        through.objects.using(db).filter(id__in=redundant).delete()
+        for keeper, row_ids in moved.items():
+            through.objects.using(db).filter(id__in=row_ids).update(
+                **{column: keeper}
+            )
+        Recipe.objects.using(db).filter(id__in=recipe_ids).update(updated_at=now)
+        user_of = dict(
+            model.objects.using(db).filter(id__in=duplicates)
+            .values_list("id", "user_id")
+        )
+        Tombstone.objects.using(db).bulk_create(
+            [
+                Tombstone(
+                    user_id=user_of[item_id],
+                    kind=model_name.lower(),
+                    object_id=item_id,
+                    deleted_at=now,
+                )
+                for item_id in duplicates
+            ],
+            batch_size=1000,
+        )
+        model.objects.using(db).filter(id__in=duplicates).delete()
+        RecipeStats.objects.using(db).filter(
+            user_id__in={user_id for user_id, _ in keepers}
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_normalized_names"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="ingredient",
+            constraint=models.UniqueConstraint(
+                fields=("user", "normalized_name"),
+                name="ingredient_user_normalized_name_uniq",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="tag",
+            constraint=models.UniqueConstraint(
+                fields=("user", "normalized_name"),
+                name="tag_user_normalized_name_uniq",
+            ),
+        ),
+    ]
@@ -1,7 +1,9 @@
+import binascii
 import uuid
 import os
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -63,9 +65,12 @@ class User(AbstractBaseUser, PermissionsMixin):
 #Recipe model
 class Recipe(models.Model):
     """Recipe object"""
+    # No constraint: with sharding (core.sharding) the user row may be on
+    # another database
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
     title = models.CharField(max_length=255)
     description =models.TextField(blank=True)
@@ -75,20 +80,111 @@ class Recipe(models.Model):
     tags=models.ManyToManyField('Tag')
     ingredients=models.ManyToManyField('Ingredient')
     image=models.ImageField(null=True, upload_to=recipe_image_file_path)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Prefix searches in the admin (LIKE 'abc%') on Postgres
+            models.Index(
+                fields=['title'],
+                name='recipe_title_prefix_idx',
+                opclasses=['varchar_pattern_ops'],
+            ),
+            # One per ordering of the recipe list, which always filters
+            # on the user and breaks ties on id
+            models.Index(
+                fields=['user', 'id'],
+                name='recipe_user_id_idx',
+            ),
+            models.Index(
+                fields=['user', 'price', 'id'],
+                name='recipe_user_price_idx',
+            ),
+            models.Index(
+                fields=['user', 'time_minutes', 'id'],
+                name='recipe_user_time_idx',
+            ),
+            models.Index(
+                fields=['user', 'title', 'id'],
+                name='recipe_user_title_idx',
+            ),
+            # Delta sync (core.sync)
+            models.Index(
+                fields=['user', 'updated_at', 'id'],
+                name='recipe_user_updated_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
     
 
 
+def normalize_name(name):
+    """Return the form of a tag or ingredient name used to match it"""
+    return ' '.join(name.split()).casefold()
+
+
+class NamedItemManager(models.Manager):
+    def get_or_create_by_name(self, user, name):
+        """Return the user's item with this name, ignoring case and spacing"""
+        normalized_name = normalize_name(name)
+        # The oldest one, should duplicates not have been merged yet
+        item = self.filter(
+            user=user, normalized_name=normalized_name,
+        ).order_by('id').first()
+        if item is not None:
+            return item
+
+        from core import sharding
+
+        try:
+            with sharding.atomic(user.pk):
+                return self.create(user=user, name=name)
+        except IntegrityError:
+            # A concurrent request created it first
+            return self.get(user=user, normalized_name=normalized_name)
+
+
 # Tag model
 class Tag(models.Model):
     """Tag to be used for a recipe"""
     name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255, editable=False)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = NamedItemManager()
+
+    class Meta:
+        # Case and spacing variants of a name are the same item
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='tag_user_normalized_name_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['name'],
+                name='tag_name_prefix_idx',
+                opclasses=['varchar_pattern_ops'],
+            ),
+            models.Index(
+                fields=['user', 'updated_at', 'id'],
+                name='tag_user_updated_idx',
+            ),
+        ]
+
+    def save(self, *args, update_fields=None, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        if update_fields is not None and 'name' in update_fields:
+            update_fields = {*update_fields, 'normalized_name'}
+        super().save(*args, update_fields=update_fields, **kwargs)
 
     def __str__(self):
         return self.name
@@ -98,10 +194,241 @@ class Tag(models.Model):
 class Ingredient(models.Model):
     """Ingredient to be used in a recipe"""
     name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = NamedItemManager()
+
+    class Meta:
+        # Case and spacing variants of a name are the same item
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='ingredient_user_normalized_name_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_prefix_idx',
+                opclasses=['varchar_pattern_ops'],
+            ),
+            models.Index(
+                fields=['user', 'updated_at', 'id'],
+                name='ingredient_user_updated_idx',
+            ),
+        ]
+
+    def save(self, *args, update_fields=None, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        if update_fields is not None and 'name' in update_fields:
+            update_fields = {*update_fields, 'normalized_name'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
+def generate_token_key():
+    """Generate a random auth token key"""
+    return binascii.hexlify(os.urandom(20)).decode()
+
+
+def default_token_expiry():
+    """Return the expiry time for a newly issued auth token"""
+    return timezone.now() + settings.AUTH_TOKEN_TTL
+
+
+class AuthTokenManager(models.Manager):
+    def issue(self, user):
+        """Return a live token for the user, replacing an expired one"""
+        token = self.filter(user=user, expires_at__gt=timezone.now()).first()
+        if token is not None:
+            return token
+
+        self.filter(user=user).delete()
+        try:
+            with transaction.atomic():
+                return self.create(user=user)
+        except IntegrityError:
+            # A concurrent login issued the token first
+            return self.get(user=user)
+
+
+# Auth token model
+class AuthToken(models.Model):
+    """Authentication token that expires unless it keeps being used"""
+    key = models.CharField(
+        max_length=40,
+        primary_key=True,
+        default=generate_token_key,
+    )
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(
+        default=default_token_expiry,
+        db_index=True,
+    )
+
+    objects = AuthTokenManager()
+
+    def __str__(self):
+        return self.key
+
+
+# Recipe statistics model
+class RecipeStats(models.Model):
+    """Per-user recipe aggregates, maintained incrementally by core.stats"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,
+    )
+    recipe_count = models.IntegerField(default=0)
+    total_time_minutes = models.BigIntegerField(default=0)
+    total_price = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+    )
+    price_buckets = models.JSONField(default=dict)
+    tag_counts = models.JSONField(default=dict)
+    ingredient_counts = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f'Recipe stats for {self.user}'
+
+
+# Tombstone model
+class Tombstone(models.Model):
+    """Record of a deleted recipe, tag or ingredient for delta sync"""
+    # No constraint: deleting a user records tombstones for their objects
+    # while the user row goes away. clear_tombstones purges them later.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'deleted_at', 'kind', 'object_id'],
+                name='tombstone_user_deleted_idx',
+            ),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'Deleted {self.kind} {self.object_id}'
+
+
+# Background task model
+class Task(models.Model):
+    """A unit of background work, run by the run_tasks worker (core.tasks)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Not run before this time; retries are scheduled by moving it
+    run_after = models.DateTimeField(default=timezone.now)
+    # A running task whose lease expired is claimed again
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'run_after', 'id'],
+                name='task_status_run_after_idx',
+            ),
+            models.Index(
+                fields=['name', 'status'],
+                name='task_name_status_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+# Export model
+class Export(models.Model):
+    """Archive of a user's recipes, tags, ingredients and images"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    # Name of the archive in the 'exports' storage
+    file_name = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Export {self.id} of {self.user} ({self.status})'
+
+
+# User shard directory model
+class UserShard(models.Model):
+    """Database holding a user's recipes, tags and ingredients"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
     )
+    database = models.CharField(max_length=100)
+    # Set while core.sharding.move_user copies the user's data
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f'{self.user} on {self.database}'
@@ -0,0 +1,116 @@
+'''Database routers'''
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import sharding
+
+
+# Set per request by core.middleware.ReplicaRoutingMiddleware to a dict of
+# {'use_replica': bool, 'wrote': bool, 'user_id': int or None}. Outside a
+# request it is None, so management commands and background code always
+# see the primary.
+routing_state = ContextVar('routing_state', default=None)
+
+# Cache backends that aren't shared between worker processes
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin(user_id):
+    """Keep the user's reads on the primary for REPLICA_STICKY_SECONDS"""
+    cache.set(_pin_key(user_id), 1, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def set_user(user_id):
+    """Record the request's user, whose reads stay on the primary if pinned"""
+    state = routing_state.get()
+    if state is None:
+        return
+    state['user_id'] = user_id
+    if state['use_replica'] and cache.get(_pin_key(user_id)) is not None:
+        state['use_replica'] = False
+
+
+def stop_using_replica():
+    """Send the rest of the request's reads to the primary
+
+    Return whether they were going to a replica.
+    """
+    state = routing_state.get()
+    if state is None or not state['use_replica']:
+        return False
+    state['use_replica'] = False
+    return True
+
+
+def check_replica_cache(app_configs, **kwargs):
+    """Refuse replicas without a cache shared by the workers"""
+    if not settings.REPLICA_DATABASES:
+        return []
+    if settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Error(
+        'Read replicas need a cache shared by all workers to keep clients '
+        'that just wrote on the primary.',
+        hint='Set REDIS_URL, or configure another shared default cache.',
+        id='core.E001',
+    )]
+
+
+class ShardRouter:
+    """Send per-user tables to the user's shard (see core.sharding)"""
+
+    def db_for_read(self, model, **hints):
+        return sharding.route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return sharding.route(model, hints, write=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding.is_sharded():
+            return None
+        shards = settings.SHARD_DATABASES
+        if obj1._state.db in shards and obj2._state.db in shards:
+            return True
+        return None
+
+
+class ReplicaRouter:
+    """Send safe-method reads to a replica and everything else to primary"""
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        state = routing_state.get()
+        if not replicas or state is None or not state['use_replica']:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
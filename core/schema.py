@@ -0,0 +1,141 @@
+'''Precomputed OpenAPI schema
+
+Generating the schema introspects every viewset and serializer, so it is
+done once per code version: either ahead of time by the generate_schema
+command, which writes it to SCHEMA_CACHE_DIR, or on the first request.
+Rendered documents are then served from memory.
+'''
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import translation
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+
+
+_lock = threading.Lock()
+_schemas = {}
+_rendered = {}
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """Return APP_VERSION, or a fingerprint of the project's source files"""
+    if settings.APP_VERSION:
+        return settings.APP_VERSION
+
+    digest = hashlib.sha256()
+    base_dir = Path(settings.BASE_DIR)
+    packages = (p for p in base_dir.iterdir() if (p / '__init__.py').exists())
+    for package in sorted(packages):
+        for path in sorted(package.rglob('*.py')):
+            stat = path.stat()
+            digest.update(
+                f'{path.relative_to(base_dir)}:{stat.st_size}:'
+                f'{stat.st_mtime_ns}'.encode()
+            )
+    return digest.hexdigest()[:16]
+
+
+def schema_path(version=None):
+    """Return the file the schema for a code version is stored in"""
+    version = version or code_version()
+    return Path(settings.SCHEMA_CACHE_DIR) / f'openapi-{version}.json'
+
+
+def generate(api_version=None):
+    """Introspect the API and return the schema as a dict"""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(
+        urlconf=spectacular_settings.SERVE_URLCONF,
+        api_version=api_version,
+    )
+    return generator.get_schema(
+        request=None,
+        public=spectacular_settings.SERVE_PUBLIC,
+    )
+
+
+def write(api_version=None):
+    """Generate the schema and store it for the current code version"""
+    path = schema_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(generate(api_version)))
+    return path
+
+
+def get_schema(api_version=None, lang=None):
+    """Return the schema dict, generating it at most once per version"""
+    key = (code_version(), api_version, lang)
+    with _lock:
+        if key not in _schemas:
+            path = schema_path()
+            if api_version is None and lang is None and path.exists():
+                _schemas[key] = json.loads(path.read_text())
+            else:
+                _schemas[key] = generate(api_version)
+        return _schemas[key]
+
+
+def get_rendered(renderer, api_version=None, lang=None):
+    """Return the rendered schema document and its ETag"""
+    key = (code_version(), api_version, lang, renderer.media_type)
+    if key not in _rendered:
+        body = renderer.render(
+            get_schema(api_version, lang),
+            renderer.media_type,
+            {},
+        )
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        _rendered[key] = (body, etag)
+    return _rendered[key]
+
+
+def reset():
+    """Forget cached schemas, e.g. after the code version changed"""
+    with _lock:
+        _schemas.clear()
+        _rendered.clear()
+    code_version.cache_clear()
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """Serve the OpenAPI schema from memory with an ETag
+
+    The schema is generated once per code version (see core.schema), so
+    requests only pay for content negotiation and an ETag comparison.
+    """
+
+    def _get_schema_response(self, request):
+        version = (
+            self.api_version
+            or request.version
+            or self._get_version_parameter(request)
+        )
+        lang = None
+        if settings.USE_I18N and request.GET.get('lang'):
+            lang = translation.get_language()
+        body, etag = get_rendered(
+            request.accepted_renderer,
+            api_version=version,
+            lang=lang,
+        )
+        headers = {
+            'ETag': etag,
+            'Cache-Control':
+                f'public, max-age={settings.SCHEMA_CACHE_MAX_AGE}',
+        }
+        if etag in request.headers.get('If-None-Match', ''):
+            return HttpResponseNotModified(headers=headers)
+
+        content_type = request.accepted_renderer.media_type
+        if request.accepted_renderer.charset:
+            content_type += f'; charset={request.accepted_renderer.charset}'
+        headers['Content-Disposition'] = (
+            f'inline; filename="{self._get_filename(request, version)}"'
+        )
+        return HttpResponse(body, content_type=content_type, headers=headers)
@@ -0,0 +1,45 @@
+'''Serializers for the core app'''
+from django.conf import settings
+from rest_framework import serializers
+
+
+# Create a new class BatchItemSerializer that inherits from serializers.Serializer
+class BatchItemSerializer(serializers.Serializer):
+    """Serializer for one sub-request of a batch"""
+    method = serializers.ChoiceField(
+        choices=['GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'],
+    )
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        """Only allow API routes"""
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError('Path must start with /api/.')
+        return value
+
+
+# Create a new class BatchSerializer that inherits from serializers.Serializer
+class BatchSerializer(serializers.Serializer):
+    """Serializer for a batch of API requests"""
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+    parallel = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        """Limit the number of sub-requests"""
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f'At most {settings.BATCH_MAX_REQUESTS} requests per batch.'
+            )
+        return value
+
+
+class BatchResultSerializer(serializers.Serializer):
+    """Serializer for the result of one sub-request"""
+    status = serializers.IntegerField()
+    body = serializers.JSONField(allow_null=True)
+
+
+class BatchResponseSerializer(serializers.Serializer):
+    """Serializer for the results of a batch"""
+    responses = BatchResultSerializer(many=True)
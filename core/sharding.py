@@ -0,0 +1,377 @@
+'''Per-user sharding across several databases
+
+The tables of per-user data (SHARDED_MODELS: recipes, tags, ingredients,
+their through tables, statistics and sync tombstones) are split across
+SHARD_DATABASES, each user's rows on one of them. Users, tokens, tasks
+and exports stay on the default database, which is also the first shard.
+
+A new user is placed by consistent hashing of their id, and the placement
+is stored in the UserShard directory. The directory stays the source of
+truth, so adding a shard strands no data; users are moved afterwards with
+move_users() (python manage.py rebalance_shards). Users without a row
+predate sharding and live on the default database.
+
+ShardRouter (core.routers) sends a query on a sharded table to the shard
+of, in order: the user of the instance it is about (saves and related
+managers), the user or shard selected with for_user() or use_shard(), or
+the user authenticated for the current request (ShardRoutingMiddleware).
+Code spanning users, such as management commands, loops over the shards
+with use_shard(). Transactions must name the shard: use atomic(user_id).
+
+Every shard hands out ids from its own range, SHARD_ID_SPAN apart, so ids
+are unique across shards and a moved user keeps theirs.
+'''
+import bisect
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import sql
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.exceptions import APIException
+
+from core.models import UserShard
+
+
+SHARDED_MODELS = (
+    'core.tag',
+    'core.ingredient',
+    'core.recipe',
+    'core.recipe_tags',
+    'core.recipe_ingredients',
+    'core.recipestats',
+    'core.tombstone',
+)
+# Through tables are selected by their recipe's user
+THROUGH_MODELS = ('core.recipe_tags', 'core.recipe_ingredients')
+
+# The request being served, set by core.middleware.ShardRoutingMiddleware
+current_request = ContextVar('current_request', default=None)
+# ('user', user_id) or ('shard', alias), set by for_user() and use_shard()
+_scope = ContextVar('shard_scope', default=None)
+
+
+class NoShardSelected(Exception):
+    """A sharded table was queried without a user or shard to route to"""
+
+
+class UserMoving(APIException):
+    """The user's data is being moved to another shard"""
+    status_code = 503
+    default_detail = 'Your data is being moved, try again shortly.'
+    default_code = 'user_moving'
+    wait = 5
+
+
+def is_sharded():
+    """Return whether per-user data is split across several databases"""
+    return len(settings.SHARD_DATABASES) > 1
+
+
+def _hash(value):
+    digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+@lru_cache(maxsize=8)
+def _ring(databases, virtual_nodes):
+    points = sorted(
+        (_hash(f'{alias}#{index}'), alias)
+        for alias in databases
+        for index in range(virtual_nodes)
+    )
+    return [point for point, _ in points], [alias for _, alias in points]
+
+
+def ring_database(user_id):
+    """Return the shard consistent hashing places a user on"""
+    points, aliases = _ring(
+        tuple(settings.SHARD_DATABASES), settings.SHARD_VIRTUAL_NODES,
+    )
+    index = bisect.bisect(points, _hash(str(user_id))) % len(points)
+    return aliases[index]
+
+
+def _cache_key(user_id):
+    return f'shard-directory:{user_id}'
+
+
+def place(user_id):
+    """Record a new user's shard, chosen by consistent hashing"""
+    UserShard.objects.create(
+        user_id=user_id, database=ring_database(user_id),
+    )
+
+
+def locate(user_id):
+    """Return the user's (shard, moving) from the directory"""
+    entry = cache.get(_cache_key(user_id))
+    if entry is None:
+        entry = UserShard.objects.filter(user_id=user_id).values_list(
+            'database', 'moving',
+        ).first() or (DEFAULT_DB_ALIAS, False)
+        cache.set(
+            _cache_key(user_id), entry,
+            timeout=settings.SHARD_DIRECTORY_CACHE_SECONDS,
+        )
+    return entry
+
+
+def db_for_user(user_id):
+    """Return the database alias holding the user's data"""
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    return locate(user_id)[0]
+
+
+def atomic(user_id, **kwargs):
+    """Return transaction.atomic() on the user's shard"""
+    return transaction.atomic(using=db_for_user(user_id), **kwargs)
+
+
+@contextmanager
+def for_user(user_id):
+    """Route sharded tables to the user's shard inside the block"""
+    token = _scope.set(('user', user_id))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def use_shard(alias):
+    """Route sharded tables to one shard inside the block"""
+    token = _scope.set(('shard', alias))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_db():
+    """Return the shard selected for the current code, if any"""
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    return route(apps.get_model('core', 'Recipe'), {})
+
+
+def _instance_user_id(instance):
+    if instance is None:
+        return None
+    if isinstance(instance, get_user_model()):
+        return instance.pk
+    if instance._meta.label_lower in SHARDED_MODELS:
+        # Don't load a deferred field just to route
+        return instance.__dict__.get('user_id')
+    return None
+
+
+def _request_user_id():
+    request = current_request.get()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    return None
+
+
+def route(model, hints, write=False):
+    """Return the shard for a query on model, or None if not sharded"""
+    if not is_sharded() or model._meta.label_lower not in SHARDED_MODELS:
+        return None
+    instance = hints.get('instance')
+    user_id = _instance_user_id(instance)
+    if user_id is None:
+        scope = _scope.get()
+        if scope is not None and scope[0] == 'shard':
+            return scope[1]
+        user_id = scope[1] if scope is not None else _request_user_id()
+    if user_id is None:
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        raise NoShardSelected(
+            f'No user or shard selected for a {model._meta.label} query; '
+            'use core.sharding.for_user() or use_shard().'
+        )
+
+    database, moving = locate(user_id)
+    if write and moving:
+        raise UserMoving()
+    return database
+
+
+def _user_rows(model, using, user_id):
+    rows = model._base_manager.using(using)
+    if model._meta.label_lower in THROUGH_MODELS:
+        return rows.filter(recipe__user_id=user_id)
+    return rows.filter(user_id=user_id)
+
+
+def _insert(model, objs, using):
+    """Insert objs unchanged, keeping auto_now values as loaddata does"""
+    query = sql.InsertQuery(model)
+    query.insert_values(model._meta.concrete_fields, objs, raw=True)
+    query.get_compiler(using=using).execute_sql()
+
+
+def _copy(model, source, target, user_id, batch_size):
+    copied = 0
+    batch = []
+    rows = _user_rows(model, source, user_id).order_by('pk')
+    for obj in rows.iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) == batch_size:
+            _insert(model, batch, target)
+            copied += len(batch)
+            batch = []
+    if batch:
+        _insert(model, batch, target)
+    return copied + len(batch)
+
+
+def _delete(using, user_id):
+    # Not a deletion of the user's data, so no signals (tombstones, stats)
+    for label in reversed(SHARDED_MODELS):
+        model = apps.get_model(label)
+        _user_rows(model, using, user_id)._raw_delete(using)
+
+
+def _set_directory(user_id, database, moving):
+    UserShard.objects.update_or_create(
+        user_id=user_id, defaults={'database': database, 'moving': moving},
+    )
+    cache.delete(_cache_key(user_id))
+
+
+def move_users(moves, batch_size=500, wait=None):
+    """Move several users' data together; return what was moved
+
+    moves holds (user_id, target) pairs. Returns a (user_id, source,
+    target, rows copied) tuple for each user not already on their target.
+
+    The users' data stays readable from the old shards throughout. Their
+    writes are refused with UserMoving (503) from the start of the move
+    until the directory points at the new shards: twice, the move waits
+    wait seconds (SHARD_DIRECTORY_CACHE_SECONDS) for cached directory
+    entries to expire. The waits are shared by all the users, so a move
+    takes about 2 * wait seconds plus the time to copy their rows.
+    """
+    if wait is None:
+        wait = settings.SHARD_DIRECTORY_CACHE_SECONDS
+    sources = dict(
+        UserShard.objects.filter(
+            user_id__in=[user_id for user_id, _ in moves],
+        ).values_list('user_id', 'database')
+    )
+    pending = []
+    for user_id, target in moves:
+        if target not in settings.SHARD_DATABASES:
+            raise ValueError(f'{target!r} is not in SHARD_DATABASES.')
+        source = sources.get(user_id, DEFAULT_DB_ALIAS)
+        if source != target:
+            pending.append((user_id, source, target))
+    if not pending:
+        return []
+
+    for user_id, source, _ in pending:
+        _set_directory(user_id, source, moving=True)
+    copied = []
+    try:
+        time.sleep(wait)
+        for user_id, source, target in pending:
+            with transaction.atomic(using=target):
+                # Left over from an interrupted move
+                _delete(target, user_id)
+                copied.append(sum(
+                    _copy(apps.get_model(label), source, target, user_id,
+                          batch_size)
+                    for label in SHARDED_MODELS
+                ))
+        for user_id, _, target in pending:
+            _set_directory(user_id, target, moving=True)
+        time.sleep(wait)
+        for user_id, _, target in pending:
+            _set_directory(user_id, target, moving=False)
+    except BaseException:
+        for user_id, source, _ in pending:
+            _set_directory(user_id, source, moving=False)
+        for user_id, _, target in pending[:len(copied)]:
+            _delete(target, user_id)
+        raise
+
+    for user_id, source, _ in pending:
+        _delete(source, user_id)
+    return [
+        (user_id, source, target, rows)
+        for (user_id, source, target), rows in zip(pending, copied)
+    ]
+
+
+def move_user(user_id, target, batch_size=500, wait=None):
+    """Move a user's data to the target shard; return the rows copied
+
+    See move_users().
+    """
+    moved = move_users([(user_id, target)], batch_size, wait)
+    return moved[0][3] if moved else 0
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _place_new_user(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        place(instance.pk)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def _delete_user_data(sender, instance, **kwargs):
+    # Deleting the user on the default database only cascades there
+    if db_for_user(instance.pk) == DEFAULT_DB_ALIAS:
+        return
+    with for_user(instance.pk):
+        for label in ('core.recipe', 'core.tag', 'core.ingredient',
+                      'core.recipestats', 'core.tombstone'):
+            apps.get_model(label).objects.filter(user_id=instance.pk).delete()
+
+
+def reserve_id_ranges(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Make a shard's sharded tables hand out ids from its own range"""
+    if using not in settings.SHARD_DATABASES:
+        return
+    start = settings.SHARD_DATABASES.index(using) * settings.SHARD_ID_SPAN
+    if not start:
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for label in SHARDED_MODELS:
+            model = apps.get_model(label)
+            if not isinstance(model._meta.pk, models.AutoField):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    'UPDATE sqlite_sequence SET seq = MAX(seq, %s) '
+                    'WHERE name = %s',
+                    [start - 1, table],
+                )
+                if not cursor.rowcount:
+                    cursor.execute(
+                        'INSERT INTO sqlite_sequence (name, seq) '
+                        'VALUES (%s, %s)',
+                        [table, start - 1],
+                    )
+            elif connection.vendor == 'postgresql':
+                column = connection.ops.quote_name(model._meta.pk.column)
+                cursor.execute(
+                    'SELECT setval(pg_get_serial_sequence(%s, %s), '
+                    f'GREATEST(%s, (SELECT COALESCE(MAX({column}), 0) '
+                    f'FROM {connection.ops.quote_name(table)})))',
+                    [table, model._meta.pk.column, start - 1],
+                )
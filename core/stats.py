@@ -0,0 +1,328 @@
+'''Incremental maintenance of per-user recipe statistics
+
+Each change to a recipe, or to its tags and ingredients, adjusts the
+owner's RecipeStats row by the difference instead of rescanning their
+recipes. Code that bypasses model signals (queryset update/delete) must
+call apply_recipe, apply_items, recount_items or rebuild itself.
+
+The row is locked for every adjustment, so it is a per-user
+serialization point: concurrent writes of one user's recipes, tags and
+ingredients queue up behind each other, and every tag or ingredient
+assignment rewrites the user's whole tag_counts or ingredient_counts.
+Saves with update_fields that leave out the counted fields skip it.
+'''
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+from django.db.models.signals import (
+    m2m_changed,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from core import sharding
+from core.models import Ingredient, Recipe, RecipeStats, Tag
+
+
+# Upper bounds of the price distribution buckets
+PRICE_BUCKETS = (Decimal('5'), Decimal('10'), Decimal('20'), Decimal('50'))
+
+# Recipe fields the statistics are computed from, by name and attname
+RECIPE_FIELDS = frozenset({'user', 'user_id', 'time_minutes', 'price'})
+
+ITEM_FIELDS = {
+    'tags': 'tag_counts',
+    'ingredients': 'ingredient_counts',
+}
+
+
+def _decimal(price):
+    """Coerce a price as assigned on a model instance to a Decimal"""
+    return price if isinstance(price, Decimal) else Decimal(str(price))
+
+
+def price_bucket(price):
+    """Return the distribution bucket label for a price"""
+    lower = Decimal('0')
+    for upper in PRICE_BUCKETS:
+        if price < upper:
+            return f'{lower}-{upper}'
+        lower = upper
+    return f'{lower}+'
+
+
+def _adjust(counts, key, delta):
+    """Add delta to counts[key], dropping keys that reach zero"""
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def _locked_stats(user_id):
+    """Return the user's stats row locked for update
+
+    Users without a row (e.g. whose recipes predate the statistics) get
+    one rebuilt from the current tables; the second value reports that.
+    """
+    stats = RecipeStats.objects.select_for_update().filter(
+        user_id=user_id,
+    ).first()
+    if stats is not None:
+        return stats, False
+    return rebuild(user_id), True
+
+
+def _add_recipe(stats, time_minutes, price, sign):
+    stats.recipe_count += sign
+    stats.total_time_minutes += sign * time_minutes
+    stats.total_price += sign * _decimal(price)
+    _adjust(stats.price_buckets, price_bucket(_decimal(price)), sign)
+
+
+def ensure(user_id):
+    """Make sure the user has a stats row before a multi-step change
+
+    Bulk operations call this first, so that every delta they apply
+    afterwards lands on a row that predates the change.
+    """
+    with sharding.atomic(user_id):
+        _locked_stats(user_id)
+
+
+def apply_recipe(user_id, time_minutes, price, sign, stored=True):
+    """Add (sign=1) or remove (sign=-1) one recipe's values
+
+    stored says whether the change is already in the database, in which
+    case a freshly rebuilt row includes it and is left alone.
+    """
+    with sharding.atomic(user_id):
+        stats, rebuilt = _locked_stats(user_id)
+        if rebuilt and stored:
+            return
+        _add_recipe(stats, time_minutes, price, sign)
+        stats.save()
+
+
+def replace_recipes(user_id, before, after):
+    """Swap updated recipes' (time_minutes, price) values in one step"""
+    with sharding.atomic(user_id):
+        stats, rebuilt = _locked_stats(user_id)
+        if rebuilt:
+            return
+        for time_minutes, price in before:
+            _add_recipe(stats, time_minutes, price, -1)
+        for time_minutes, price in after:
+            _add_recipe(stats, time_minutes, price, 1)
+        stats.save()
+
+
+def apply_items(user_id, attr, item_ids, sign, stored=True):
+    """Add or remove one recipe assignment for each tag/ingredient id"""
+    if not item_ids:
+        return
+    field = ITEM_FIELDS[attr]
+    with sharding.atomic(user_id):
+        stats, rebuilt = _locked_stats(user_id)
+        if rebuilt and stored:
+            return
+        counts = getattr(stats, field)
+        for item_id in item_ids:
+            _adjust(counts, str(item_id), sign)
+        stats.save(update_fields=[field])
+
+
+def forget_items(user_id, attr, item_ids):
+    """Drop deleted tags/ingredients from the user's counts"""
+    field = ITEM_FIELDS[attr]
+    with sharding.atomic(user_id):
+        stats, _ = _locked_stats(user_id)
+        counts = getattr(stats, field)
+        for item_id in item_ids:
+            counts.pop(str(item_id), None)
+        stats.save(update_fields=[field])
+
+
+def recount_items(user_id, attr, item_ids):
+    """Recount the assignments of some tags/ingredients from the tables"""
+    field = ITEM_FIELDS[attr]
+    through = getattr(Recipe, attr).through
+    column = through._meta.get_field(attr[:-1]).attname
+    with sharding.atomic(user_id):
+        stats, rebuilt = _locked_stats(user_id)
+        if rebuilt:
+            return
+        counts = getattr(stats, field)
+        for item_id in item_ids:
+            counts.pop(str(item_id), None)
+        rows = (
+            through.objects.filter(**{f'{column}__in': item_ids})
+            .values(column)
+            .annotate(n=Count('id'))
+        )
+        for row in rows:
+            counts[str(row[column])] = row['n']
+        stats.save(update_fields=[field])
+
+
+def rebuild(user_id):
+    """Recompute the user's stats from scratch and return them"""
+    recipes = Recipe.objects.filter(user_id=user_id)
+    totals = recipes.aggregate(
+        count=Count('id'),
+        time=Sum('time_minutes'),
+        price=Sum('price'),
+    )
+    buckets = {}
+    for price in recipes.values_list('price', flat=True).iterator():
+        _adjust(buckets, price_bucket(price), 1)
+
+    item_counts = {}
+    for attr, field in ITEM_FIELDS.items():
+        through = getattr(Recipe, attr).through
+        column = through._meta.get_field(attr[:-1]).attname
+        rows = (
+            through.objects.filter(recipe__user_id=user_id)
+            .values(column)
+            .annotate(n=Count('id'))
+        )
+        item_counts[field] = {str(row[column]): row['n'] for row in rows}
+
+    stats, _ = RecipeStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'recipe_count': totals['count'],
+            'total_time_minutes': totals['time'] or 0,
+            'total_price': totals['price'] or 0,
+            'price_buckets': buckets,
+            **item_counts,
+        },
+    )
+    return stats
+
+
+def _snapshot(recipe):
+    return (recipe.user_id, int(recipe.time_minutes), _decimal(recipe.price))
+
+
+def _counted(update_fields):
+    """Return whether a save with update_fields may change the stats"""
+    return update_fields is None or not RECIPE_FIELDS.isdisjoint(update_fields)
+
+
+@receiver(pre_save, sender=Recipe)
+def _capture_previous(sender, instance, raw=False, update_fields=None,
+                      **kwargs):
+    """Make sure an updated recipe knows its previously stored values"""
+    if raw or instance._state.adding or not _counted(update_fields):
+        return
+    if getattr(instance, '_stats_snapshot', None) is None:
+        instance._stats_snapshot = (
+            Recipe.objects.filter(pk=instance.pk)
+            .values_list('user_id', 'time_minutes', 'price')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def _recipe_saved(sender, instance, created, raw=False, update_fields=None,
+                  **kwargs):
+    if raw or not _counted(update_fields):
+        return
+    previous = None if created else instance._stats_snapshot
+    current = _snapshot(instance)
+    if previous != current:
+        if previous is not None:
+            apply_recipe(*previous, -1)
+        apply_recipe(*current, 1)
+    instance._stats_snapshot = current
+
+
+@receiver(pre_delete, sender=Recipe)
+def _recipe_deleted(sender, instance, **kwargs):
+    snapshot = getattr(instance, '_stats_snapshot', None) or _snapshot(instance)
+    apply_recipe(*snapshot, -1, stored=False)
+    for attr in ITEM_FIELDS:
+        item_ids = getattr(instance, attr).values_list('id', flat=True)
+        apply_items(snapshot[0], attr, list(item_ids), -1, stored=False)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def _item_deleted(sender, instance, **kwargs):
+    # The cascade removes through-table rows without m2m_changed signals
+    attr = 'tags' if sender is Tag else 'ingredients'
+    forget_items(instance.user_id, attr, [instance.pk])
+
+
+def _assignments(through, item_column, instance, reverse, pk_set=None):
+    """Return the (recipe_id, item_id) rows an m2m change applies to"""
+    if reverse:
+        rows = through.objects.filter(**{item_column: instance.pk})
+        column = 'recipe_id'
+    else:
+        rows = through.objects.filter(recipe_id=instance.pk)
+        column = item_column
+    if pk_set is not None:
+        rows = rows.filter(**{f'{column}__in': pk_set})
+    return list(rows.values_list('recipe_id', item_column))
+
+
+def _m2m_changed(attr):
+    """Build an m2m_changed receiver for Recipe.<attr>"""
+    through = getattr(Recipe, attr).through
+    item_column = through._meta.get_field(attr[:-1]).attname
+
+    def receiver(sender, instance, action, reverse, pk_set, **kwargs):
+        if action == 'pre_remove':
+            # pk_set may name rows that were never assigned, so record the
+            # assignments that are actually about to go.
+            instance._stats_pending = _assignments(
+                through, item_column, instance, reverse, pk_set,
+            )
+            return
+        if action == 'pre_clear':
+            instance._stats_pending = _assignments(
+                through, item_column, instance, reverse,
+            )
+            return
+
+        if action == 'post_add':
+            # post_add only reports the newly inserted ids
+            pending = [
+                (other_id, instance.pk) if reverse else (instance.pk, other_id)
+                for other_id in pk_set
+            ]
+            sign = 1
+        elif action in ('post_remove', 'post_clear'):
+            pending = instance.__dict__.pop('_stats_pending', [])
+            sign = -1
+        else:
+            return
+
+        if not pending:
+            return
+        owners = dict(
+            Recipe.objects.filter(
+                pk__in={recipe_id for recipe_id, _ in pending},
+            ).values_list('id', 'user_id')
+        )
+        by_user = {}
+        for recipe_id, item_id in pending:
+            by_user.setdefault(owners[recipe_id], []).append(item_id)
+        for user_id, item_ids in by_user.items():
+            apply_items(user_id, attr, item_ids, sign)
+
+    return receiver
+
+
+for _attr in ITEM_FIELDS:
+    m2m_changed.connect(
+        _m2m_changed(_attr),
+        sender=getattr(Recipe, _attr).through,
+        weak=False,
+        dispatch_uid=f'recipe-stats-{_attr}',
+    )
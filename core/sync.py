@@ -0,0 +1,201 @@
+'''Delta sync of recipes, tags and ingredients
+
+Live objects carry updated_at and deletions leave a Tombstone, so the
+changes since a point in time can be read from the (user, updated_at)
+indexes. Every change has a position (timestamp, kind, id); sync tokens
+encode the position of the last change a client has seen. Code that
+bypasses model signals (queryset update/delete) must call touch_recipes
+and record_deletions itself.
+'''
+import base64
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import Ingredient, Recipe, Tag, Tombstone
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Kinds in the order they sort within the same timestamp
+KINDS = {
+    'ingredient': Ingredient,
+    'recipe': Recipe,
+    'tag': Tag,
+}
+MODEL_KINDS = {model: kind for kind, model in KINDS.items()}
+
+
+class InvalidToken(ValueError):
+    """Raised for sync tokens that can't be decoded"""
+
+
+def encode_token(position):
+    """Return the opaque token for a (timestamp, kind, id) position"""
+    timestamp, kind, object_id = position
+    micros = (timestamp - EPOCH) // timedelta(microseconds=1)
+    raw = f'{micros}:{kind}:{object_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Return the (timestamp, kind, id) position a token encodes"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        micros, kind, object_id = raw.decode().split(':')
+        timestamp = EPOCH + timedelta(microseconds=int(micros))
+        object_id = int(object_id)
+    except (ValueError, OverflowError):
+        raise InvalidToken(token)
+    if kind and kind not in KINDS:
+        raise InvalidToken(token)
+    return timestamp, kind, object_id
+
+
+def _after(position, time_field, id_field, kind=None):
+    """Q for rows positioned after position
+
+    Rows of a single kind pass kind; otherwise the kind column is
+    compared as well.
+    """
+    timestamp, after_kind, after_id = position
+    later = Q(**{f'{time_field}__gt': timestamp})
+    same_time = Q(**{time_field: timestamp})
+    if kind is None:
+        return later | same_time & (
+            Q(kind__gt=after_kind)
+            | Q(kind=after_kind, **{f'{id_field}__gt': after_id})
+        )
+    if kind > after_kind:
+        return later | same_time
+    if kind == after_kind:
+        return later | same_time & Q(**{f'{id_field}__gt': after_id})
+    return later
+
+
+def _live_changes(user, kind, position, horizon, limit):
+    model = KINDS[kind]
+    rows = model.objects.filter(user=user, updated_at__lt=horizon)
+    if position is not None:
+        rows = rows.filter(_after(position, 'updated_at', 'id', kind))
+    if model is Recipe:
+        rows = rows.prefetch_related('tags', 'ingredients')
+    for obj in rows.order_by('updated_at', 'id')[:limit]:
+        yield (obj.updated_at, kind, obj.id), obj
+
+
+def _deletions(user, position, horizon, limit):
+    if position is None:
+        # A first sync has nothing to delete
+        return
+    rows = Tombstone.objects.filter(
+        _after(position, 'deleted_at', 'object_id'),
+        user=user,
+        deleted_at__lt=horizon,
+    )
+    for tombstone in rows.order_by('deleted_at', 'kind', 'object_id')[:limit]:
+        yield (tombstone.deleted_at, tombstone.kind, tombstone.object_id), None
+
+
+def changes(user, position=None, limit=500):
+    """Return the user's changes after position, oldest first
+
+    Returns (changes, next_position, more), where each change is a
+    (position, obj) pair and obj is None for a deletion. Changes made in
+    the last SYNC_SETTLE_SECONDS are held back, so transactions that
+    commit late can't end up behind a position already handed out.
+    """
+    horizon = timezone.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    streams = [
+        _live_changes(user, kind, position, horizon, limit + 1)
+        for kind in KINDS
+    ]
+    streams.append(_deletions(user, position, horizon, limit + 1))
+    merged = heapq.merge(*streams, key=lambda change: change[0])
+    page = [change for _, change in zip(range(limit + 1), merged)]
+
+    more = len(page) > limit
+    page = page[:limit]
+    if more:
+        next_position = page[-1][0]
+    else:
+        # Everything before the horizon has been sent
+        next_position = (horizon, '', 0)
+    return page, next_position, more
+
+
+def is_expired(position):
+    """Return whether tombstones after position may have been purged"""
+    cutoff = timezone.now() - settings.SYNC_TOMBSTONE_RETENTION
+    return position[0] < cutoff
+
+
+def touch_recipes(recipe_ids):
+    """Mark recipes as changed, e.g. after their tags or ingredients were
+
+    recipe_ids may be a list or a values() subquery.
+    """
+    Recipe.objects.filter(id__in=recipe_ids).update(updated_at=timezone.now())
+
+
+def record_deletions(kind, rows):
+    """Leave tombstones for deleted (user_id, object_id) rows"""
+    now = timezone.now()
+    Tombstone.objects.bulk_create(
+        [
+            Tombstone(user_id=user_id, kind=kind, object_id=object_id,
+                      deleted_at=now)
+            for user_id, object_id in rows
+        ],
+        batch_size=1000,
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def _object_deleted(sender, instance, **kwargs):
+    record_deletions(MODEL_KINDS[sender], [(instance.user_id, instance.pk)])
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def _item_deleted(sender, instance, **kwargs):
+    # The cascade removes through-table rows without m2m_changed signals
+    touch_recipes(instance.recipe_set.values('id'))
+
+
+def _m2m_changed(attr):
+    """Build an m2m_changed receiver touching recipes of Recipe.<attr>"""
+    through = getattr(Recipe, attr).through
+    item_column = through._meta.get_field(attr[:-1]).attname
+
+    def receiver(sender, instance, action, reverse, pk_set, **kwargs):
+        if not reverse:
+            if action in ('post_add', 'post_remove', 'post_clear'):
+                touch_recipes([instance.pk])
+        elif action == 'pre_clear':
+            instance._sync_pending = list(
+                through.objects.filter(**{item_column: instance.pk})
+                .values_list('recipe_id', flat=True)
+            )
+        elif action == 'post_clear':
+            touch_recipes(instance.__dict__.pop('_sync_pending', []))
+        elif action in ('post_add', 'post_remove'):
+            touch_recipes(pk_set)
+
+    return receiver
+
+
+for _attr in ('tags', 'ingredients'):
+    m2m_changed.connect(
+        _m2m_changed(_attr),
+        sender=getattr(Recipe, _attr).through,
+        weak=False,
+        dispatch_uid=f'sync-{_attr}',
+    )
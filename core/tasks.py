@@ -0,0 +1,214 @@
+'''Database-backed background tasks
+
+Functions registered with @task are queued as Task rows with enqueue()
+and run by the run_tasks worker (python manage.py run_tasks), so no
+broker is needed. Queueing inside a transaction commits the task with
+the data it refers to.
+
+A worker claims a task with a conditional UPDATE that also leases it for
+the task's timeout, so every task runs on one worker at a time; if the
+worker dies, the task is claimed again once the lease runs out. Claims
+of a task type with a concurrency cap are serialized per type (an
+advisory lock on Postgres; SQLite runs one write at a time anyway), so
+two workers can't both see a free slot. Tasks
+therefore run at least once and should be safe to repeat. Failed runs
+are retried with exponential backoff up to max_attempts.
+'''
+import hashlib
+import logging
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.models import Task
+
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+@dataclass(frozen=True)
+class TaskType:
+    """A registered task function and how to run it"""
+    name: str
+    func: object
+    max_attempts: int
+    retry_delay: float
+    timeout: float
+    concurrency: int | None
+    on_failure: object
+
+
+def task(name=None, *, max_attempts=3, retry_delay=10, timeout=300,
+         concurrency=None, on_failure=None):
+    """Register a function as a background task
+
+    retry_delay is the wait in seconds before the first retry, doubling
+    after each failure; timeout is how long a run may take before another
+    worker may claim the task; concurrency caps how many run at once
+    across all workers. on_failure is called with the task's kwargs once
+    the last attempt has failed.
+    """
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        registry[task_name] = TaskType(
+            task_name, func, max_attempts, retry_delay, timeout, concurrency,
+            on_failure,
+        )
+        func.task_name = task_name
+        return func
+    return decorator
+
+
+def discover():
+    """Import the tasks module of every installed app"""
+    autodiscover_modules('tasks')
+
+
+def enqueue(func, delay=0, **kwargs):
+    """Queue a run of a @task function with JSON-serializable kwargs"""
+    task_type = registry[func.task_name]
+    return Task.objects.create(
+        name=task_type.name,
+        kwargs=kwargs,
+        max_attempts=task_type.max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _claimable(now):
+    return (
+        Q(status=Task.QUEUED, run_after__lte=now)
+        | Q(status=Task.RUNNING, locked_until__lt=now)
+    )
+
+
+def _lock_task_type(name):
+    """Hold a lock on the task type until the transaction ends"""
+    if connection.vendor != 'postgresql':
+        return
+    digest = hashlib.blake2b(
+        f'core.tasks:{name}'.encode(), digest_size=8,
+    ).digest()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s)',
+            [int.from_bytes(digest, 'big', signed=True)],
+        )
+
+
+def _claim_one(task_id, task_type, worker_id, now, running):
+    tasks = Task.objects.filter(_claimable(now), id=task_id)
+    if task_type.concurrency is not None:
+        _lock_task_type(task_type.name)
+        tasks = tasks.alias(
+            running=Coalesce(Subquery(running), Value(0)),
+        ).filter(running__lt=task_type.concurrency)
+    # Another worker may have claimed it since the SELECT
+    return tasks.update(
+        status=Task.RUNNING,
+        locked_by=worker_id,
+        locked_until=now + timedelta(seconds=task_type.timeout),
+        attempts=F('attempts') + 1,
+        started_at=now,
+    )
+
+
+def claim(worker_id, limit):
+    """Lease up to limit due tasks to the worker and return them"""
+    now = timezone.now()
+    candidates = (
+        Task.objects.filter(_claimable(now), name__in=registry)
+        .order_by('run_after', 'id')
+        .values_list('id', 'name')[:limit * 4]
+    )
+    running = (
+        Task.objects.filter(
+            name=OuterRef('name'),
+            status=Task.RUNNING,
+            locked_until__gte=now,
+        )
+        .values('name')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+
+    claimed = []
+    for task_id, name in candidates:
+        with transaction.atomic():
+            if not _claim_one(
+                task_id, registry[name], worker_id, now, running,
+            ):
+                continue
+        claimed.append(task_id)
+        if len(claimed) == limit:
+            break
+
+    return list(Task.objects.filter(id__in=claimed).order_by('run_after', 'id'))
+
+
+def run(task_obj, worker_id):
+    """Run a claimed task and record the outcome"""
+    task_type = registry[task_obj.name]
+    try:
+        task_type.func(**task_obj.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Task %s (%s) failed', task_obj.id, task_obj.name)
+        now = timezone.now()
+        if task_obj.attempts < task_obj.max_attempts:
+            delay = task_type.retry_delay * 2 ** (task_obj.attempts - 1)
+            outcome = {
+                'status': Task.QUEUED,
+                'run_after': now + timedelta(seconds=delay),
+            }
+        else:
+            outcome = {'status': Task.FAILED, 'finished_at': now}
+        outcome['error'] = error
+    else:
+        outcome = {'status': Task.DONE, 'finished_at': timezone.now()}
+
+    # Unless the lease ran out and another worker has taken over
+    recorded = Task.objects.filter(
+        id=task_obj.id, status=Task.RUNNING, locked_by=worker_id,
+    ).update(locked_by='', locked_until=None, **outcome)
+    if recorded and outcome['status'] == Task.FAILED and task_type.on_failure:
+        try:
+            task_type.on_failure(**task_obj.kwargs)
+        except Exception:
+            logger.exception('on_failure of task %s failed', task_obj.id)
+    return outcome['status']
+
+
+def stats():
+    """Return the queue depth per status and how late the oldest task is"""
+    now = timezone.now()
+    counts = dict(
+        Task.objects.values_list('status').annotate(n=Count('id')).order_by()
+    )
+    oldest = Task.objects.filter(
+        status=Task.QUEUED, run_after__lte=now,
+    ).aggregate(oldest=Min('run_after'))['oldest']
+    return {
+        **{status: counts.get(status, 0) for status, _ in Task.STATUS_CHOICES},
+        'latency_seconds': (
+            round((now - oldest).total_seconds(), 3) if oldest else 0.0
+        ),
+    }
+
+
+def purge():
+    """Delete finished tasks older than TASK_RETENTION; return how many"""
+    cutoff = timezone.now() - settings.TASK_RETENTION
+    deleted, _ = Task.objects.filter(
+        status__in=[Task.DONE, Task.FAILED], finished_at__lt=cutoff,
+    ).delete()
+    return deleted
@@ -1,8 +1,13 @@
+from decimal import Decimal
+from unittest.mock import patch
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client
 
+from core import models
+from core.admin import RecipeAdmin
+
 
 
 
@@ -40,4 +45,70 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:core_user_add')
         res = self.client.get(url)
 
-        self.assertEqual(res.status_code, 200)
\ No newline at end of file
+        self.assertEqual(res.status_code, 200)
+
+class RecipeAdminTests(TestCase):
+    """Test the recipe admin pages scale to large tables"""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass123'
+        )
+        self.client.force_login(self.admin_user)
+        self.recipes = [
+            models.Recipe.objects.create(
+                user=self.admin_user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=Decimal('5.00'),
+            )
+            for i in range(5)
+        ]
+
+    @patch.object(RecipeAdmin, 'list_per_page', 2)
+    def test_recipe_changelist_cursor_paging(self):
+        """Test the changelist pages by primary key cursor"""
+        url = reverse('admin:core_recipe_changelist')
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'Recipe 4')
+        self.assertNotContains(res, 'Recipe 2')
+        cursor = self.recipes[3].id
+        self.assertContains(res, f'?cursor={cursor}')
+
+        res = self.client.get(url, {'cursor': cursor})
+
+        self.assertContains(res, 'Recipe 2')
+        self.assertNotContains(res, 'Recipe 3')
+
+    def test_recipe_search(self):
+        """Test searching recipes by title prefix"""
+        url = reverse('admin:core_recipe_changelist')
+        res = self.client.get(url, {'q': 'Recipe 3'})
+
+        self.assertContains(res, 'Recipe 3')
+        self.assertNotContains(res, 'Recipe 1')
+
+    def test_recipe_change_page(self):
+        """Test the recipe change page renders without loading all tags"""
+        url = reverse('admin:core_recipe_change', args=[self.recipes[0].id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_tag_autocomplete(self):
+        """Test tags are searchable for the autocomplete widget"""
+        models.Tag.objects.create(user=self.admin_user, name='Vegan')
+        url = reverse('admin:autocomplete')
+        res = self.client.get(url, {
+            'term': 'Veg',
+            'app_label': 'core',
+            'model_name': 'recipe',
+            'field_name': 'tags',
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['results'][0]['text'], 'Vegan')
@@ -0,0 +1,185 @@
+'''Tests for the batch request endpoint'''
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import AuthToken, Recipe, Tag
+from user.authentication import ExpiringTokenAuthentication
+
+
+BATCH_URL = reverse('batch')
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Helper function to create a user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class BatchApiTests(TestCase):
+    """Test running several API requests in one call"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        token = AuthToken.objects.issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = APIClient().post(BATCH_URL, {
+            'requests': [{'method': 'GET', 'path': '/api/user/me/'}],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_batch_runs_requests_in_order(self):
+        """Test reads and writes run in order and return their results"""
+        recipe = create_recipe(self.user)
+
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'method': 'GET', 'path': '/api/user/me/'},
+            {'method': 'POST', 'path': '/api/recipe/recipe/', 'body': {
+                'title': 'Curry', 'time_minutes': 30, 'price': '8.00',
+                'tags': [{'name': 'Dinner'}],
+            }},
+            {'method': 'GET', 'path': '/api/recipe/tag/'},
+            {'method': 'GET', 'path': f'/api/recipe/recipe/{recipe.id}/'},
+            {'method': 'GET', 'path': '/api/recipe/recipe/?ordering=title'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        me, created, tags, detail, recipes = res.data['responses']
+        self.assertEqual(me['status'], 200)
+        self.assertEqual(me['body']['email'], self.user.email)
+        self.assertEqual(created['status'], 201)
+        self.assertEqual(tags['body'], created['body']['tags'])
+        self.assertEqual(detail['body']['id'], recipe.id)
+        self.assertEqual(
+            [r['id'] for r in recipes['body']],
+            [created['body']['id'], recipe.id],
+        )
+
+    def test_batch_authenticates_once(self):
+        """Test sub-requests reuse the batch request's authentication"""
+        original = ExpiringTokenAuthentication.authenticate_credentials
+        with patch.object(
+            ExpiringTokenAuthentication,
+            'authenticate_credentials',
+            autospec=True,
+            side_effect=original,
+        ) as patched_authenticate:
+            res = self.client.post(BATCH_URL, {'requests': [
+                {'method': 'GET', 'path': '/api/recipe/tag/'},
+                {'method': 'GET', 'path': '/api/recipe/ingredient/'},
+                {'method': 'GET', 'path': '/api/user/me/'},
+            ]}, format='json')
+
+        self.assertEqual(
+            [r['status'] for r in res.data['responses']], [200] * 3,
+        )
+        self.assertEqual(patched_authenticate.call_count, 1)
+
+    def test_batch_reports_errors_per_request(self):
+        """Test failing sub-requests don't fail the batch"""
+        other = create_user(email='other@example.com')
+        recipe = create_recipe(other)
+
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'method': 'GET', 'path': '/api/recipe/nothing-here/'},
+            {'method': 'GET', 'path': f'/api/recipe/recipe/{recipe.id}/'},
+            {'method': 'POST', 'path': '/api/recipe/recipe/', 'body': {}},
+            {'method': 'POST', 'path': '/api/batch/', 'body': {}},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['status'] for r in res.data['responses']], [404, 404, 400, 404],
+        )
+
+    def test_batch_rejects_file_responses(self):
+        """Test streamed and non-JSON responses are refused per request"""
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'method': 'GET', 'path': '/api/schema/'},
+            {'method': 'GET', 'path': '/api/user/me/'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        schema, me = res.data['responses']
+        self.assertEqual(schema['status'], 400)
+        self.assertEqual(me['status'], 200)
+
+    def test_batch_reports_server_errors(self):
+        """Test a sub-request that raises keeps its 500 status"""
+        self.client.raise_request_exception = False
+
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'method': 'GET', 'path': '/api/recipe/recipe/?tags=abc'},
+            {'method': 'GET', 'path': '/api/user/me/'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        error, me = res.data['responses']
+        self.assertEqual(error['status'], 500)
+        self.assertEqual(error['body'], {'detail': 'A server error occurred.'})
+        self.assertEqual(me['status'], 200)
+
+    def test_batch_validation(self):
+        """Test non-API paths and oversized batches are rejected"""
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'method': 'GET', 'path': '/admin/'},
+        ]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.settings(BATCH_MAX_REQUESTS=2):
+            res = self.client.post(BATCH_URL, {'requests': [
+                {'method': 'GET', 'path': '/api/user/me/'},
+            ] * 3}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ParallelBatchApiTests(TransactionTestCase):
+    """Test running the reads of a batch concurrently"""
+
+    def test_parallel_reads(self):
+        """Test parallel reads return the same results in request order"""
+        user = create_user()
+        client = APIClient()
+        client.force_authenticate(user)
+        Tag.objects.create(user=user, name='Dinner')
+        recipe = create_recipe(user)
+        requests = [
+            {'method': 'GET', 'path': '/api/recipe/tag/'},
+            {'method': 'GET', 'path': f'/api/recipe/recipe/{recipe.id}/'},
+            {'method': 'PATCH', 'path': f'/api/recipe/recipe/{recipe.id}/',
+             'body': {'title': 'Renamed'}},
+            {'method': 'GET', 'path': f'/api/recipe/recipe/{recipe.id}/'},
+            {'method': 'GET', 'path': '/api/user/me/'},
+        ]
+
+        res = client.post(
+            BATCH_URL, {'requests': requests, 'parallel': True}, format='json',
+        )
+
+        responses = res.data['responses']
+        self.assertEqual([r['status'] for r in responses], [200] * 5)
+        self.assertEqual(responses[0]['body'][0]['name'], 'Dinner')
+        self.assertEqual(responses[1]['body']['title'], 'Sample recipe')
+        self.assertEqual(responses[3]['body']['title'], 'Renamed')
+        self.assertEqual(responses[4]['body']['email'], user.email)
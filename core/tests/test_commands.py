@@ -1,8 +1,23 @@
+from datetime import timedelta
+from decimal import Decimal
 from unittest.mock import patch
 from psycopg2 import OperationalError as Psycopg2Error
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core.models import (
+    AuthToken,
+    Ingredient,
+    Recipe,
+    RecipeStats,
+    Tag,
+    Tombstone,
+)
 
 @patch('core.management.commands.wait_for_db.Command.check')
 @patch('time.sleep')
@@ -16,3 +31,157 @@ class CommandTests(SimpleTestCase):
         patched_check.assert_called_once_with(databases=['default'])
         patched_sleep.assert_not_called()  # sleep should not be called if the db is ready
 
+    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+        """Test waiting for db retries with growing sub-second delays"""
+        patched_check.side_effect = [Psycopg2Error] * 2 + \
+            [OperationalError] * 3 + [True]
+
+        call_command('wait_for_db', initial_delay=0.1, max_delay=5)
+
+        self.assertEqual(patched_check.call_count, 6)
+        delays = [c.args[0] for c in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 5)
+        self.assertLessEqual(delays[0], 0.1)
+        for i, delay in enumerate(delays):
+            self.assertLessEqual(delay, 0.1 * 2 ** i)
+
+    def test_wait_for_db_deadline(self, patched_sleep, patched_check):
+        """Test waiting for db gives up after the timeout"""
+        patched_check.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', timeout=0)
+
+        patched_sleep.assert_not_called()
+
+    @patch('core.management.commands.wait_for_db.warm_up')
+    def test_wait_for_db_warm(self, patched_warm, patched_sleep, patched_check):
+        """Test warm up runs for every database alias"""
+        patched_check.return_value = True
+
+        call_command('wait_for_db', warm=True)
+
+        patched_warm.assert_called_once_with('default')
+
+    @patch('core.management.commands.wait_for_db.warm_up')
+    def test_wait_for_db_warm_retries(
+        self, patched_warm, patched_sleep, patched_check,
+    ):
+        """Test a failing warm up is retried until the timeout"""
+        patched_check.return_value = True
+        patched_warm.side_effect = [OperationalError, None]
+
+        call_command('wait_for_db', warm=True)
+
+        self.assertEqual(patched_warm.call_count, 2)
+        self.assertEqual(patched_sleep.call_count, 1)
+
+        patched_warm.side_effect = OperationalError
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', warm=True, timeout=0)
+
+
+class ClearExpiredTokensTests(TestCase):
+    """Test deleting expired auth tokens"""
+
+    def test_clear_expired_tokens(self):
+        """Test only expired tokens are deleted, in batches"""
+        User = get_user_model()
+        now = timezone.now()
+        for i in range(5):
+            user = User.objects.create_user(f'user{i}@example.com', 'pass123')
+            AuthToken.objects.create(
+                user=user,
+                expires_at=now + timedelta(hours=1 if i == 0 else -1),
+            )
+
+        call_command('clear_expired_tokens', batch_size=2, pause=0)
+
+        self.assertEqual(AuthToken.objects.count(), 1)
+        self.assertTrue(AuthToken.objects.filter(expires_at__gt=now).exists())
+
+
+class ClearTombstonesTests(TestCase):
+    """Test purging old sync tombstones"""
+
+    def test_clear_tombstones(self):
+        """Test only tombstones past the retention period are deleted"""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123',
+        )
+        now = timezone.now()
+        for days in (1, 40, 400):
+            Tombstone.objects.create(
+                user=user,
+                kind='recipe',
+                object_id=days,
+                deleted_at=now - timedelta(days=days),
+            )
+
+        with self.settings(SYNC_TOMBSTONE_RETENTION=timedelta(days=30)):
+            call_command('clear_tombstones', batch_size=1, pause=0)
+
+        self.assertEqual(
+            list(Tombstone.objects.values_list('object_id', flat=True)), [1],
+        )
+
+
+class MergeDuplicateNamesTests(TransactionTestCase):
+    """Test merging tags and ingredients that differ in case or spacing"""
+
+    def setUp(self):
+        # Duplicates can only predate the uniqueness constraints
+        for model in (Tag, Ingredient):
+            constraint, = model._meta.constraints
+            # SQLite rebuilds the table from the model's current constraints
+            with patch.object(model._meta, 'constraints', []):
+                with connection.schema_editor() as editor:
+                    editor.remove_constraint(model, constraint)
+            self.addCleanup(self._add_constraint, model, constraint)
+
+    def _add_constraint(self, model, constraint):
+        with connection.schema_editor() as editor:
+            editor.add_constraint(model, constraint)
+
+    def test_merge_duplicate_names(self):
+        """Test duplicates are merged into the oldest item"""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123',
+        )
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'pass123',
+        )
+        dinner = Tag.objects.create(user=user, name='Dinner')
+        lower = Tag.objects.create(user=user, name='dinner ')
+        upper = Tag.objects.create(user=user, name='DINNER')
+        salt = Ingredient.objects.create(user=user, name='Salt')
+        other_salt = Ingredient.objects.create(user=other, name='salt')
+        both = Recipe.objects.create(
+            user=user, title='Stew', time_minutes=10, price=Decimal('5.00'),
+        )
+        both.tags.add(dinner, lower)
+        one = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=10, price=Decimal('5.00'),
+        )
+        one.tags.add(upper)
+        one.ingredients.add(salt)
+        Recipe.objects.update(updated_at=timezone.now() - timedelta(days=1))
+
+        call_command('merge_duplicate_names', batch_size=1, pause=0)
+
+        self.assertEqual(list(Tag.objects.all()), [dinner])
+        self.assertEqual(list(both.tags.all()), [dinner])
+        self.assertEqual(list(one.tags.all()), [dinner])
+        self.assertCountEqual(Ingredient.objects.all(), [salt, other_salt])
+        self.assertCountEqual(
+            Tombstone.objects.values_list('kind', 'object_id'),
+            [('tag', lower.id), ('tag', upper.id)],
+        )
+        self.assertEqual(
+            Recipe.objects.filter(
+                updated_at__gt=timezone.now() - timedelta(hours=1),
+            ).count(),
+            2,
+        )
+        recipe_stats = RecipeStats.objects.get(user=user)
+        self.assertEqual(recipe_stats.tag_counts, {str(dinner.id): 2})
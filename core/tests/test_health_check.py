@@ -1,9 +1,21 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework import status   
 from rest_framework.test import APIClient
 
+from core import health
+from core.models import Task
+
+
+
+HEALTH_CHECK_URL = reverse('health-check')
 
 
 class HealthCheckTest(TestCase):
@@ -13,3 +25,69 @@ class HealthCheckTest(TestCase):
         res = client.get(url)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    HEALTH_CHECK_CACHE_SECONDS=60,
+)
+class DeepHealthCheckTest(TestCase):
+    """Test the deep health check"""
+
+    def setUp(self):
+        self.client = APIClient()
+        health.reset_cache()
+        self.addCleanup(health.reset_cache)
+
+    def test_deep_health_check_reports_dependencies(self):
+        """Test deep mode probes every dependency"""
+        res = self.client.get(HEALTH_CHECK_URL, {'deep': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data['healthy'])
+        for name in ('database', 'storage', 'cache', 'tasks'):
+            self.assertIn(name, res.data['checks'])
+            self.assertIn('latency_ms', res.data['checks'][name])
+
+    def test_deep_health_check_database_down(self):
+        """Test an unreachable database returns 503"""
+        with patch.dict(
+            health.PROBES,
+            database=Mock(side_effect=OperationalError),
+        ):
+            res = self.client.get(HEALTH_CHECK_URL, {'deep': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(res.data['healthy'])
+        self.assertEqual(res.data['checks']['database']['status'], 'down')
+
+    @override_settings(HEALTH_CHECK_THRESHOLDS_MS={'database': -1})
+    def test_deep_health_check_degraded(self):
+        """Test a slow dependency is reported as degraded"""
+        res = self.client.get(HEALTH_CHECK_URL, {'deep': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], 'degraded')
+        self.assertEqual(res.data['checks']['database']['status'], 'degraded')
+
+    @override_settings(HEALTH_CHECK_TASK_LATENCY_SECONDS=60)
+    def test_deep_health_check_task_backlog(self):
+        """Test tasks waiting too long degrade the task queue check"""
+        Task.objects.create(
+            name='core.example',
+            run_after=timezone.now() - timedelta(minutes=5),
+        )
+
+        res = self.client.get(HEALTH_CHECK_URL, {'deep': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['checks']['tasks']['status'], 'degraded')
+        self.assertEqual(res.data['checks']['tasks']['queued'], 1)
+
+    def test_deep_health_check_cached(self):
+        """Test the probe result is reused within the cache window"""
+        with patch('core.health.run_probes', wraps=health.run_probes) as run:
+            self.client.get(HEALTH_CHECK_URL, {'deep': 1})
+            self.client.get(HEALTH_CHECK_URL, {'deep': 1})
+
+        run.assert_called_once()
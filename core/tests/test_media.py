@@ -0,0 +1,135 @@
+'''Tests for serving uploaded media files'''
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from core.files import IMMUTABLE_MAX_AGE
+
+
+IMAGE = 'uploads/recipe/0b4f3c3e-6a4b-4d3c-9e0f-5d2c1a7b8e9f.jpg'
+
+
+def media_url(path):
+    """Return the URL of a media file"""
+    return f'/static/media/{path}'
+
+
+def content(response):
+    data = b''.join(response.streaming_content)
+    response.close()
+    return data
+
+
+class MediaServingTests(TestCase):
+    """Test media files are served with range and cache headers"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(
+            MEDIA_ROOT=self.root, MEDIA_SENDFILE='', MEDIA_CACHE_MAX_AGE=60,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.data = bytes(range(256)) * 4
+        self.write(IMAGE, self.data)
+
+    def write(self, path, data):
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as file:
+            file.write(data)
+
+    def test_serve_content_named_file(self):
+        """Test a file named by its content is cached as immutable"""
+        res = self.client.get(media_url(IMAGE))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(content(res), self.data)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Content-Length'], str(len(self.data)))
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', res)
+        self.assertIn('Last-Modified', res)
+        self.assertNotIn('Content-Disposition', res)
+        self.assertEqual(
+            res['Cache-Control'],
+            f'public, max-age={IMMUTABLE_MAX_AGE}, immutable',
+        )
+
+    def test_serve_other_file(self):
+        """Test a file that may change is cached for MEDIA_CACHE_MAX_AGE"""
+        self.write('logo.png', b'png')
+
+        res = self.client.get(media_url('logo.png'))
+
+        self.assertEqual(content(res), b'png')
+        self.assertEqual(res['Cache-Control'], 'public, max-age=60')
+
+    def test_range(self):
+        """Test a byte range is served as partial content"""
+        res = self.client.get(media_url(IMAGE), HTTP_RANGE='bytes=100-199')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(content(res), self.data[100:200])
+        self.assertEqual(res['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    def test_conditional_requests(self):
+        """Test unchanged files are answered with 304 Not Modified"""
+        res = self.client.get(media_url(IMAGE))
+        content(res)
+        etag = res['ETag']
+
+        res = self.client.get(media_url(IMAGE), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+        self.assertIn('immutable', res['Cache-Control'])
+
+        modified = os.stat(os.path.join(self.root, IMAGE)).st_mtime
+        res = self.client.get(
+            media_url(IMAGE), HTTP_IF_MODIFIED_SINCE=http_date(modified + 1),
+        )
+        self.assertEqual(res.status_code, 304)
+
+        res = self.client.get(media_url(IMAGE), HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(res.status_code, 200)
+        content(res)
+
+    @override_settings(
+        MEDIA_SENDFILE='x-accel-redirect',
+        MEDIA_ACCEL_PREFIX='/protected-media/',
+    )
+    def test_x_accel_redirect(self):
+        """Test nginx is told to send the file"""
+        res = self.client.get(media_url(IMAGE))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Accel-Redirect'], f'/protected-media/{IMAGE}')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res.content, b'')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_x_sendfile(self):
+        """Test the front server is given the file's path"""
+        res = self.client.get(media_url(IMAGE))
+
+        self.assertEqual(res['X-Sendfile'], os.path.join(self.root, IMAGE))
+        self.assertEqual(res.content, b'')
+
+    def test_not_found(self):
+        """Test missing files, directories and paths outside are 404"""
+        for path in ('missing.jpg', 'uploads/recipe', '../etc/passwd'):
+            with self.subTest(path=path):
+                res = self.client.get(media_url(path))
+                self.assertEqual(res.status_code, 404)
+
+    def test_post_not_allowed(self):
+        """Test media can only be read"""
+        res = self.client.post(media_url(IMAGE))
+
+        self.assertEqual(res.status_code, 405)
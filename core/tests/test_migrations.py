@@ -0,0 +1,63 @@
+'''Tests for data migrations'''
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MergeDuplicateNamesMigrationTests(TransactionTestCase):
+    """Test 0013 merges names differing only in case before the constraint"""
+
+    before = [('core', '0012_normalized_names')]
+    after = [('core', '0013_unique_normalized_names')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_merged_into_oldest(self):
+        """Test recipes move to the oldest item and the others are deleted"""
+        apps = self.migrate(self.before)
+        User = apps.get_model('core', 'User')
+        Tag = apps.get_model('core', 'Tag')
+        Recipe = apps.get_model('core', 'Recipe')
+        RecipeStats = apps.get_model('core', 'RecipeStats')
+        user = User.objects.create(email='user@example.com')
+        keeper = Tag.objects.create(
+            user=user, name='Vegan', normalized_name='vegan',
+        )
+        duplicate = Tag.objects.create(
+            user=user, name='VEGAN', normalized_name='vegan',
+        )
+        both = Recipe.objects.create(
+            user=user, title='Both', time_minutes=5, price='1.00',
+        )
+        both.tags.add(keeper, duplicate)
+        moved = Recipe.objects.create(
+            user=user, title='Moved', time_minutes=5, price='1.00',
+        )
+        moved.tags.add(duplicate)
+        RecipeStats.objects.create(user=user)
+
+        apps = self.migrate(self.after)
+        Tag = apps.get_model('core', 'Tag')
+        Recipe = apps.get_model('core', 'Recipe')
+        Tombstone = apps.get_model('core', 'Tombstone')
+
+        self.assertEqual(list(Tag.objects.values_list('id', flat=True)),
+                         [keeper.id])
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                list(recipe.tags.values_list('id', flat=True)), [keeper.id],
+            )
+        self.assertTrue(Tombstone.objects.filter(
+            user_id=user.id, kind='tag', object_id=duplicate.id,
+        ).exists())
+        self.assertFalse(
+            apps.get_model('core', 'RecipeStats').objects.exists()
+        )
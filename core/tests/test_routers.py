@@ -0,0 +1,149 @@
+'''Tests for the read replica router'''
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import (
+    SimpleTestCase,
+    RequestFactory,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.test import APIClient
+
+from core import routers
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Recipe
+from core.routers import ReplicaRouter
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    """Test routing reads to replicas and writes to the primary"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _route(self, method, write=False, user_id=1):
+        """Send a request through the middleware and record the read alias"""
+        routed = {}
+
+        def view(request):
+            routers.set_user(user_id)
+            if write:
+                self.router.db_for_write(Recipe)
+            routed['read'] = self.router.db_for_read(Recipe)
+            return HttpResponse()
+
+        request = self.factory.generic(method, '/api/recipe/recipe/')
+        ReplicaRoutingMiddleware(view)(request)
+        return routed['read']
+
+    def test_safe_request_reads_from_replica(self):
+        """Test GET requests read from a replica"""
+        self.assertEqual(self._route('GET'), 'replica_1')
+
+    def test_unsafe_request_uses_primary(self):
+        """Test POST requests read and write on the primary"""
+        self.assertEqual(self._route('POST', write=True), 'default')
+
+    def test_read_your_writes(self):
+        """Test a user that wrote is pinned to the primary"""
+        self._route('POST', write=True)
+
+        self.assertEqual(self._route('GET'), 'default')
+        self.assertEqual(self._route('GET', user_id=2), 'replica_1')
+
+    def test_session_user_loaded_on_primary(self):
+        """Test the admin's session user is loaded before reads are routed"""
+        loaded = {}
+
+        def load_user():
+            loaded['state'] = routers.routing_state.get()
+            return Mock(is_authenticated=True, pk=7)
+
+        def view(request):
+            loaded['user_id'] = routers.routing_state.get()['user_id']
+            return HttpResponse()
+
+        request = self.factory.get('/admin/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'session'
+        request.user = SimpleLazyObject(load_user)
+        ReplicaRoutingMiddleware(view)(request)
+
+        self.assertEqual(loaded, {'state': None, 'user_id': 7})
+
+    def test_outside_request_uses_primary(self):
+        """Test reads outside a request go to the primary"""
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_replicas_not_migrated(self):
+        """Test migrations only run on the primary"""
+        self.assertFalse(self.router.allow_migrate('replica_1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+    def test_shared_cache_required(self):
+        """Test replicas with a per-process cache fail the system checks"""
+        errors = routers.check_replica_cache(None)
+        self.assertEqual([e.id for e in errors], ['core.E001'])
+
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/recipe-api-test-cache',
+        }}):
+            self.assertEqual(routers.check_replica_cache(None), [])
+
+
+@override_settings(REPLICA_DATABASES=['default'], REPLICA_STICKY_SECONDS=5)
+class ReplicaLoginTests(TestCase):
+    """Test a new login reads its own token and writes"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123',
+        )
+
+    def test_login_pins_user(self):
+        """Test issuing a token pins the user to the primary"""
+        res = APIClient().post(reverse('user:token'), {
+            'email': 'user@example.com', 'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, 200)
+        user = get_user_model().objects.get()
+        self.assertIsNotNone(cache.get(f'replica-pin:{user.pk}'))
+
+    def test_token_missing_on_replica(self):
+        """Test a token not yet on the replica is looked up on the primary"""
+        res = APIClient().post(reverse('user:token'), {
+            'email': 'user@example.com', 'password': 'testpass123',
+        })
+        cache.clear()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {res.data["token"]}')
+        lookup = TokenAuthentication.authenticate_credentials
+
+        def lagging_lookup(auth, key):
+            # The replica hasn't received the token yet
+            if routers.routing_state.get()['use_replica']:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            return lookup(auth, key)
+
+        with patch.object(
+            TokenAuthentication, 'authenticate_credentials', lagging_lookup,
+        ):
+            res = client.get(reverse('user:me'))
+
+        self.assertEqual(res.status_code, 200)
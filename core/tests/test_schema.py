@@ -0,0 +1,83 @@
+'''Tests for the precomputed OpenAPI schema'''
+import json
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import schema
+
+
+SCHEMA_URL = reverse('api-schema')
+
+
+@override_settings(APP_VERSION='test-version')
+class SchemaViewTests(TestCase):
+    """Test serving the cached schema"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        settings_override = override_settings(
+            SCHEMA_CACHE_DIR=self.cache_dir.name,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema.reset()
+        self.addCleanup(schema.reset)
+
+    def test_schema_generated_once(self):
+        """Test repeated requests reuse the generated schema"""
+        with patch('core.schema.generate', wraps=schema.generate) as generate:
+            res1 = self.client.get(SCHEMA_URL)
+            res2 = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res1.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.content, res2.content)
+        generate.assert_called_once()
+        self.assertIn('max-age', res1['Cache-Control'])
+
+    def test_schema_etag_not_modified(self):
+        """Test a matching If-None-Match returns 304"""
+        res = self.client.get(SCHEMA_URL)
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_schema_json_format(self):
+        """Test the schema is available as JSON"""
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('openapi', json.loads(res.content))
+
+    def test_schema_served_from_generated_file(self):
+        """Test the view serves the file written by generate_schema"""
+        call_command('generate_schema', stdout=StringIO())
+        schema.reset()
+
+        with patch('core.schema.generate') as generate:
+            res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        generate.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(schema.schema_path('test-version').exists())
+
+    def test_schema_regenerated_for_new_version(self):
+        """Test a new code version does not reuse the old schema"""
+        self.client.get(SCHEMA_URL)
+
+        with override_settings(APP_VERSION='next-version'):
+            schema.code_version.cache_clear()
+            with patch('core.schema.generate', wraps=schema.generate) as gen:
+                self.client.get(SCHEMA_URL)
+
+        gen.assert_called_once()
@@ -0,0 +1,345 @@
+'''Tests for per-user sharding
+
+The tests that move data between databases need a second shard and run
+with DB_SQLITE_SHARDS=1.
+'''
+import unittest
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.models import (
+    AuthToken,
+    Ingredient,
+    Recipe,
+    RecipeStats,
+    Tag,
+    Tombstone,
+    UserShard,
+)
+from core.routers import ShardRouter
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+@override_settings(SHARD_DATABASES=['default', 'shard_1', 'shard_2'])
+class ShardRingTests(SimpleTestCase):
+    """Test placing users by consistent hashing"""
+
+    def placements(self, users):
+        return {user_id: sharding.ring_database(user_id) for user_id in users}
+
+    def test_users_spread_over_shards(self):
+        """Test every shard gets a fair share of users"""
+        placements = self.placements(range(1, 3001))
+
+        for alias in settings.SHARD_DATABASES:
+            share = list(placements.values()).count(alias) / len(placements)
+            self.assertGreater(share, 0.25, alias)
+
+    def test_adding_a_shard_moves_few_users(self):
+        """Test only users placed on a new shard change placement"""
+        before = self.placements(range(1, 3001))
+        with self.settings(
+            SHARD_DATABASES=['default', 'shard_1', 'shard_2', 'shard_3'],
+        ):
+            after = self.placements(range(1, 3001))
+
+        moved = [user_id for user_id in before if before[user_id] != after[user_id]]
+        self.assertLess(len(moved) / len(before), 0.35)
+        self.assertEqual({after[user_id] for user_id in moved}, {'shard_3'})
+
+
+@override_settings(SHARD_DATABASES=['default', 'shard_1'])
+class ShardRouterTests(SimpleTestCase):
+    """Test which shard queries are sent to"""
+
+    def setUp(self):
+        self.router = ShardRouter()
+        self.directory = {1: ('shard_1', False), 2: ('default', False)}
+        patcher = patch.object(
+            sharding, 'locate', side_effect=self.directory.__getitem__,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_global_tables_not_routed(self):
+        """Test users, tokens and tasks are left to the other routers"""
+        with sharding.for_user(1):
+            self.assertIsNone(self.router.db_for_read(get_user_model()))
+            self.assertIsNone(self.router.db_for_write(AuthToken))
+
+    def test_route_by_instance(self):
+        """Test saves and related managers follow the instance's user"""
+        user = get_user_model()(id=1)
+
+        self.assertEqual(
+            self.router.db_for_write(Recipe, instance=Recipe(user_id=1)),
+            'shard_1',
+        )
+        self.assertEqual(
+            self.router.db_for_read(Recipe, instance=user), 'shard_1',
+        )
+        self.assertEqual(
+            self.router.db_for_read(
+                Recipe.tags.through, instance=Recipe(user_id=2),
+            ),
+            'default',
+        )
+
+    def test_route_by_scope(self):
+        """Test for_user() and use_shard() select the shard"""
+        with sharding.for_user(1):
+            self.assertEqual(self.router.db_for_read(Tag), 'shard_1')
+            with sharding.use_shard('default'):
+                self.assertEqual(self.router.db_for_read(Tag), 'default')
+
+    def test_route_by_request_user(self):
+        """Test queries in a request go to the shard of its user"""
+        request = RequestFactory().get('/')
+        request.user = get_user_model()(id=1)
+        token = sharding.current_request.set(request)
+        self.addCleanup(sharding.current_request.reset, token)
+
+        self.assertEqual(self.router.db_for_read(Ingredient), 'shard_1')
+
+    def test_no_shard_selected(self):
+        """Test a sharded query without a user or shard is refused"""
+        with self.assertRaises(sharding.NoShardSelected):
+            self.router.db_for_read(Recipe)
+
+    def test_writes_refused_while_moving(self):
+        """Test a moving user's data can be read but not written"""
+        self.directory[1] = ('shard_1', True)
+
+        with sharding.for_user(1):
+            self.assertEqual(self.router.db_for_read(Recipe), 'shard_1')
+            with self.assertRaises(sharding.UserMoving):
+                self.router.db_for_write(Recipe)
+
+    @override_settings(SHARD_DATABASES=['default'])
+    def test_single_database(self):
+        """Test nothing is routed without shards"""
+        self.assertIsNone(self.router.db_for_read(Recipe))
+
+
+@unittest.skipUnless(
+    len(settings.SHARD_DATABASES) > 1, 'needs DB_SQLITE_SHARDS=1',
+)
+class ShardMoveTests(TransactionTestCase):
+    """Test moving users between shards"""
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.source, self.target = settings.SHARD_DATABASES[:2]
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123',
+        )
+        UserShard.objects.filter(user=self.user).update(database=self.source)
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, title):
+        res = self.client.post(RECIPES_URL, {
+            'title': title,
+            'time_minutes': 10,
+            'price': Decimal('5.50'),
+            'tags': [{'name': 'Dinner'}],
+            'ingredients': [{'name': 'Salt'}],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def rows(self, alias):
+        user_id = self.user.id
+        return {
+            'recipes': list(
+                Recipe.objects.using(alias).filter(user_id=user_id)
+                .order_by('id').values_list('id', 'title', 'updated_at')
+            ),
+            'tags': list(
+                Recipe.tags.through.objects.using(alias)
+                .filter(recipe__user_id=user_id)
+                .order_by('id').values_list('id', 'recipe_id', 'tag_id')
+            ),
+            'stats': list(
+                RecipeStats.objects.using(alias).filter(user_id=user_id)
+                .values_list('recipe_count', flat=True)
+            ),
+            'tombstones': Tombstone.objects.using(alias).filter(
+                user_id=user_id,
+            ).count(),
+        }
+
+    def test_move_user(self):
+        """Test a user's data is copied unchanged and served from the target"""
+        first = self.create_recipe('Soup')
+        self.create_recipe('Stew')
+        self.client.delete(reverse('recipe:recipe-detail', args=[first]))
+        self.create_recipe('Curry')
+        before = self.rows(self.source)
+        out = StringIO()
+
+        call_command(
+            'rebalance_shards', self.user.email, to=self.target, wait=0,
+            stdout=out,
+        )
+
+        self.assertIn(f'from {self.source} to {self.target}', out.getvalue())
+        self.assertEqual(self.rows(self.target), before)
+        self.assertEqual(
+            self.rows(self.source),
+            {'recipes': [], 'tags': [], 'stats': [], 'tombstones': 0},
+        )
+        self.assertEqual(
+            UserShard.objects.get(user=self.user).database, self.target,
+        )
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(
+            sorted(recipe['title'] for recipe in res.data),
+            ['Curry', 'Stew'],
+        )
+
+        # Ids stay unique: the target hands out ids from its own range
+        new_id = self.create_recipe('Pie')
+        self.assertGreaterEqual(new_id, settings.SHARD_ID_SPAN)
+        self.assertFalse(
+            Recipe.objects.using(self.target).filter(
+                user_id=self.user.id, id__in=[r[0] for r in before['recipes']],
+            ).exclude(title__in=['Curry', 'Stew']).exists()
+        )
+
+    def test_users_moved_together(self):
+        """Test a group of users shares the pauses of one move"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123',
+        )
+        UserShard.objects.filter(user=other).update(database=self.source)
+        cache.clear()
+        self.create_recipe('Soup')
+        out = StringIO()
+
+        with patch.object(sharding.time, 'sleep') as sleep:
+            call_command(
+                'rebalance_shards', self.user.email, other.email,
+                to=self.target, wait=5, stdout=out,
+            )
+
+        self.assertEqual(sleep.call_count, 2)
+        self.assertIn('Moved 2 users', out.getvalue())
+        self.assertEqual(
+            set(UserShard.objects.values_list('database', flat=True)),
+            {self.target},
+        )
+        self.assertEqual(len(self.rows(self.target)['recipes']), 1)
+
+    def test_writes_refused_while_moving(self):
+        """Test a user's writes get 503 while their data is being moved"""
+        self.create_recipe('Soup')
+        UserShard.objects.filter(user=self.user).update(moving=True)
+        cache.clear()
+
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Stew', 'time_minutes': 5, 'price': '1.00',
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', res)
+        self.assertEqual(len(self.client.get(RECIPES_URL).data), 1)
+
+    def test_failed_move_keeps_source(self):
+        """Test the user stays on the source shard when copying fails"""
+        self.create_recipe('Soup')
+
+        with patch.object(sharding, '_insert', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            sharding.move_user(self.user.id, self.target, wait=0)
+
+        directory = UserShard.objects.get(user=self.user)
+        self.assertEqual(directory.database, self.source)
+        self.assertFalse(directory.moving)
+        self.assertEqual(len(self.rows(self.source)['recipes']), 1)
+        self.assertEqual(self.rows(self.target)['recipes'], [])
+
+    def test_delete_user_deletes_shard_data(self):
+        """Test deleting a user removes their rows from their shard"""
+        self.create_recipe('Soup')
+        sharding.move_user(self.user.id, self.target, wait=0)
+
+        self.user.delete()
+
+        self.assertEqual(
+            Recipe.objects.using(self.target).filter(
+                user_id=self.user.id,
+            ).count(),
+            0,
+        )
+        self.assertFalse(
+            Tag.objects.using(self.target).filter(user_id=self.user.id).exists()
+        )
+
+
+@unittest.skipUnless(
+    len(settings.SHARD_DATABASES) > 1, 'needs DB_SQLITE_SHARDS=1',
+)
+class ShardAdminTests(TransactionTestCase):
+    """Test the admin reads per-user data from the right shard"""
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.shard = settings.SHARD_DATABASES[1]
+        admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='testpass123',
+        )
+        UserShard.objects.filter(user=admin_user).update(database='default')
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123',
+        )
+        UserShard.objects.filter(user=user).update(database=self.shard)
+        cache.clear()
+        with sharding.for_user(user.id):
+            self.recipe = Recipe.objects.create(
+                user=user, title='Shard soup', time_minutes=5,
+                price=Decimal('2.00'),
+            )
+        self.client.force_login(admin_user)
+
+    def test_changelist_shard_filter(self):
+        """Test the changelist lists the shard picked in its filter"""
+        url = reverse('admin:core_recipe_changelist')
+
+        self.assertNotContains(self.client.get(url), 'Shard soup')
+        res = self.client.get(url, {'shard': self.shard})
+        self.assertContains(res, 'Shard soup')
+        self.assertContains(res, 'user@example.com')
+
+    def test_change_page_finds_shard(self):
+        """Test an object's page is read from the shard holding it"""
+        url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+
+        res = self.client.get(url)
+
+        self.assertContains(res, 'Shard soup')
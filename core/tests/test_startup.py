@@ -0,0 +1,98 @@
+'''Tests for lazily loaded views and start-up profiling'''
+import os
+import subprocess
+import sys
+from io import StringIO
+from unittest.mock import patch
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, SimpleTestCase
+from django.urls import resolve, reverse
+from django.utils.module_loading import import_string
+
+from core.apps import CoreConfig
+from core.lazy import lazy_view
+from core.management.commands.profile_startup import parse_importtime
+
+
+IMPORTTIME_OUTPUT = '''\
+import time: self [us] | cumulative | imported package
+import time:      1500 |       1500 |   yaml.loader
+import time:       500 |       2000 | yaml
+import time:      2000 |       2000 | django.urls
+'''
+
+
+class LazyLoadingTests(SimpleTestCase):
+    """Test heavyweight views are imported on first use"""
+
+    def test_lazy_view_imports_on_first_request(self):
+        """Test the view class is imported once, when first called"""
+        view = lazy_view('django.views.generic.RedirectView', url='/to/')
+        request = RequestFactory().get('/from/')
+
+        with patch(
+            'core.lazy.import_string', wraps=import_string,
+        ) as patched_import:
+            first = view(request)
+            second = view(request)
+
+        patched_import.assert_called_once()
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(second.url, '/to/')
+
+    def test_startup_skips_schema_and_admin_modules(self):
+        """Test serving the health check imports no schema, admin or Pillow"""
+        code = (
+            'import sys, django; django.setup()\n'
+            'from django.urls import resolve\n'
+            'resolve("/api/health-check/")\n'
+            'print(sorted(m for m in ("drf_spectacular.views", '
+            '"core.admin", "django.contrib.auth.admin", "PIL") '
+            'if m in sys.modules))\n'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'app.settings'},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_admin_urls_resolve(self):
+        """Test the lazily included admin URLconf still resolves"""
+        url = reverse('admin:core_recipe_changelist')
+
+        self.assertEqual(resolve(url).namespace, 'admin')
+
+    def test_core_app_config_used(self):
+        """Test the core app still runs its ready() next to the admin config"""
+        self.assertIsInstance(apps.get_app_config('core'), CoreConfig)
+
+
+class ProfileStartupTests(SimpleTestCase):
+    """Test the profile_startup command"""
+
+    def test_parse_importtime(self):
+        """Test self times are summed per top-level package"""
+        packages = parse_importtime(IMPORTTIME_OUTPUT)
+
+        self.assertEqual(packages, {'yaml': 2.0, 'django': 2.0})
+
+    def test_profile_startup(self):
+        """Test the command serves a first request and reports timings"""
+        out = StringIO()
+
+        call_command('profile_startup', target_ms=0, stdout=out)
+
+        self.assertIn('first request (200 OK)', out.getvalue())
+        self.assertIn('django', out.getvalue())
+
+    def test_profile_startup_over_target(self):
+        """Test the command fails when start-up exceeds the target"""
+        with self.assertRaises(CommandError):
+            call_command('profile_startup', target_ms=0.001, stdout=StringIO())
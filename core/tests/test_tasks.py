@@ -0,0 +1,136 @@
+'''Tests for the background task queue'''
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core import tasks
+from core.models import Task
+
+
+calls = []
+
+
+@tasks.task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@tasks.task(name='tests.flaky', max_attempts=2, retry_delay=30)
+def flaky():
+    raise ValueError('Try again')
+
+
+@tasks.task(name='tests.limited', concurrency=1)
+def limited():
+    pass
+
+
+class TaskQueueTests(TestCase):
+    """Test queueing, claiming and running tasks"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_failed_task_retried_with_backoff(self):
+        """Test a failing task is retried later, then marked failed"""
+        task_obj = tasks.enqueue(flaky)
+
+        claimed, = tasks.claim('worker', 1)
+        self.assertEqual(tasks.run(claimed, 'worker'), Task.QUEUED)
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.attempts, 1)
+        self.assertIn('Try again', task_obj.error)
+        self.assertGreater(
+            task_obj.run_after, timezone.now() + timedelta(seconds=25),
+        )
+        self.assertEqual(tasks.claim('worker', 1), [])
+
+        Task.objects.update(run_after=timezone.now())
+        claimed, = tasks.claim('worker', 1)
+        self.assertEqual(tasks.run(claimed, 'worker'), Task.FAILED)
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.attempts, 2)
+
+    def test_task_claimed_once_until_lease_expires(self):
+        """Test a running task is only claimed again after its lease"""
+        tasks.enqueue(record, value=1)
+
+        self.assertEqual(len(tasks.claim('first', 5)), 1)
+        self.assertEqual(tasks.claim('second', 5), [])
+
+        Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        claimed, = tasks.claim('second', 5)
+        self.assertEqual(claimed.attempts, 2)
+        self.assertEqual(claimed.locked_by, 'second')
+
+        # The first worker no longer owns the task and can't finish it
+        tasks.run(claimed, 'first')
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, Task.RUNNING)
+
+    def test_concurrency_limit(self):
+        """Test no more tasks of a type run at once than it allows"""
+        for _ in range(3):
+            tasks.enqueue(limited)
+
+        self.assertEqual(len(tasks.claim('first', 5)), 1)
+        self.assertEqual(tasks.claim('second', 5), [])
+
+    def test_stats(self):
+        """Test queue depth and the age of the oldest due task"""
+        tasks.enqueue(record, value=1)
+        Task.objects.update(run_after=timezone.now() - timedelta(minutes=2))
+        tasks.enqueue(record, delay=60, value=2)
+        Task.objects.create(name='tests.record', status=Task.FAILED)
+
+        result = tasks.stats()
+
+        self.assertEqual(
+            {k: v for k, v in result.items() if k != 'latency_seconds'},
+            {'queued': 2, 'running': 0, 'done': 0, 'failed': 1},
+        )
+        self.assertGreaterEqual(result['latency_seconds'], 120)
+
+    def test_purge(self):
+        """Test only old finished tasks are purged"""
+        now = timezone.now()
+        with self.settings(TASK_RETENTION=timedelta(days=7)):
+            Task.objects.create(
+                name='tests.record', status=Task.DONE,
+                finished_at=now - timedelta(days=8),
+            )
+            kept = Task.objects.create(
+                name='tests.record', status=Task.DONE, finished_at=now,
+            )
+
+            self.assertEqual(tasks.purge(), 1)
+
+        self.assertEqual(list(Task.objects.all()), [kept])
+
+
+class TaskWorkerTests(TransactionTestCase):
+    """Test the run_tasks worker, whose threads use their own connections"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_worker_runs_queued_tasks(self):
+        """Test the worker runs due tasks and leaves later ones queued"""
+        first = tasks.enqueue(record, value=1)
+        second = tasks.enqueue(record, value=2)
+        later = tasks.enqueue(record, delay=3600, value=3)
+        out = StringIO()
+
+        call_command('run_tasks', once=True, concurrency=1, stdout=out)
+
+        self.assertEqual(calls, [1, 2])
+        self.assertIn('Ran 2 tasks', out.getvalue())
+        for task_obj in (first, second):
+            task_obj.refresh_from_db()
+            self.assertEqual(task_obj.status, Task.DONE)
+            self.assertEqual(task_obj.attempts, 1)
+        later.refresh_from_db()
+        self.assertEqual(later.status, Task.QUEUED)
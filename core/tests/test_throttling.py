@@ -0,0 +1,117 @@
+'''Tests for the token bucket throttling'''
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import throttling
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Helper function to create a user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def store_path(test):
+    """Return a bucket file removed when the test ends"""
+    handle, path = tempfile.mkstemp()
+    os.close(handle)
+    test.addCleanup(os.remove, path)
+    return path
+
+
+class BucketStoreTests(SimpleTestCase):
+    """Test the shared bucket file"""
+
+    def setUp(self):
+        self.path = store_path(self)
+
+    def open_store(self):
+        store = throttling.BucketStore(self.path, 1024)
+        self.addCleanup(store.close)
+        return store
+
+    @patch('core.throttling.time.monotonic')
+    def test_bucket_empties_and_refills(self, patched_monotonic):
+        """Test tokens run out and come back at the bucket's rate"""
+        patched_monotonic.return_value = 100.0
+        store = self.open_store()
+
+        results = [store.take('key', 2, 0.5) for _ in range(3)]
+
+        self.assertEqual(results, [(True, 0.0), (True, 0.0), (False, 2.0)])
+        patched_monotonic.return_value = 102.0
+        self.assertEqual(store.take('key', 2, 0.5), (True, 0.0))
+        self.assertEqual(store.take('other', 2, 0.5), (True, 0.0))
+
+    def test_buckets_shared_between_processes(self):
+        """Test separate mappings of the same file share their buckets"""
+        first, second = self.open_store(), self.open_store()
+
+        self.assertTrue(first.take('key', 2, 0.001)[0])
+        self.assertTrue(second.take('key', 2, 0.001)[0])
+        self.assertFalse(first.take('key', 2, 0.001)[0])
+
+
+class ThrottleApiTests(TestCase):
+    """Test throttling requests per user and route class"""
+
+    def setUp(self):
+        settings = override_settings(
+            THROTTLE_STORE_PATH=store_path(self),
+            THROTTLE_RATES={
+                'reads': '2/min', 'writes': '1/min', 'token': '1/min',
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reads_throttled_per_user(self):
+        """Test a user's reads get 429 once their bucket is empty"""
+        for _ in range(2):
+            res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+
+        other = APIClient()
+        other.force_authenticate(create_user(email='other@example.com'))
+        res = other.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_route_classes_have_separate_buckets(self):
+        """Test writes don't use up the reads bucket and vice versa"""
+        payload = {'title': 'Curry', 'time_minutes': 30, 'price': '8.00'}
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_token_issuance_throttled_per_client(self):
+        """Test anonymous token requests are throttled by client IP"""
+        payload = {'email': self.user.email, 'password': 'testpass123'}
+
+        res = APIClient().post(TOKEN_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = APIClient().post(TOKEN_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
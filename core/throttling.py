@@ -0,0 +1,159 @@
+'''Token bucket throttling with counters shared by the workers of a host
+
+Buckets live in a memory-mapped file (THROTTLE_STORE_PATH) that every
+worker process on the host maps. A bucket is a fixed-size slot found by
+hashing its key; a check locks only that slot, with a byte-range lock
+for other processes and a striped lock for other threads, so workers
+only wait for each other when they hit the same bucket. No request
+touches the database or the cache.
+'''
+import functools
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.throttling import SimpleRateThrottle
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Key hash, tokens left and monotonic time of the last check
+SLOT = struct.Struct('<Qdd')
+
+_lock = threading.Lock()
+_store = None
+
+
+class BucketStore:
+    """Token buckets in a file shared by all processes that open it"""
+
+    def __init__(self, path, slots):
+        self.slots = slots
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * SLOT.size
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+        self.locks = [threading.Lock() for _ in range(64)]
+        self.tags = {}
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def take(self, key, capacity, per_second):
+        """Take a token from the key's bucket
+
+        Return (allowed, seconds until a token is available).
+        """
+        tag = self.tags.get(key)
+        if tag is None:
+            if len(self.tags) >= self.slots:
+                self.tags.clear()
+            digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+            tag = self.tags[key] = int.from_bytes(digest, 'little')
+        offset = tag % self.slots * SLOT.size
+
+        with self.locks[tag % len(self.locks)]:
+            if fcntl is not None:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                stored_tag, tokens, checked_at = SLOT.unpack_from(
+                    self.map, offset,
+                )
+                now = time.monotonic()
+                if stored_tag != tag:
+                    # Empty slot, or one taken over from a colliding key
+                    tokens = capacity
+                else:
+                    elapsed = max(now - checked_at, 0.0)
+                    tokens = min(capacity, tokens + elapsed * per_second)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                SLOT.pack_into(self.map, offset, tag, tokens, now)
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, SLOT.size, offset)
+
+        return allowed, 0.0 if allowed else (1 - tokens) / per_second
+
+
+def get_store():
+    """Return this process's mapping of the shared bucket file"""
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = BucketStore(
+                    settings.THROTTLE_STORE_PATH, settings.THROTTLE_SLOTS,
+                )
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting in ('THROTTLE_STORE_PATH', 'THROTTLE_SLOTS'):
+        with _lock:
+            if _store is not None:
+                _store.close()
+            _store = None
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_rate(rate):
+    """Return the bucket size and tokens per second of a rate"""
+    capacity, duration = SimpleRateThrottle.parse_rate(None, rate)
+    return capacity, capacity / duration
+
+
+class BucketThrottle(SimpleRateThrottle):
+    """Throttle each user, or anonymous client IP, per route class
+
+    The route class is the view's throttle_scope, or 'reads' / 'writes'
+    by request method. Its THROTTLE_RATES entry, e.g. '300/min', is both
+    the bucket size and the refill rate; scopes without a rate are not
+    throttled.
+    """
+
+    def __init__(self):
+        # The rate depends on the view, see allow_request
+        self.wait_seconds = None
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'reads' if request.method in SAFE_METHODS else 'writes'
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(request, view)
+        rate = settings.THROTTLE_RATES.get(self.scope)
+        if not rate:
+            return True
+        capacity, per_second = _parse_rate(rate)
+
+        user = request.user
+        if user and user.is_authenticated:
+            ident = f'user:{user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        allowed, self.wait_seconds = get_store().take(
+            f'{self.scope}:{ident}', capacity, per_second,
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
@@ -1,7 +1,51 @@
-from rest_framework.decorators import api_view
+from django.views.decorators.http import require_safe
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from core import batch as batch_requests
+from core import files, health
+from core.serializers import BatchResponseSerializer, BatchSerializer
+from user.authentication import ExpiringTokenAuthentication
+
 
 @api_view(['GET'])  
 def health_check(request):
-    return Response({'healthy': True})
\ No newline at end of file
+    """Report API health, probing dependencies when ?deep=1 is given"""
+    if request.query_params.get('deep') not in ('1', 'true'):
+        return Response({'healthy': True})
+
+    result = health.get_deep_health()
+    if result['healthy']:
+        return Response(result)
+
+    return Response(result, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@extend_schema(request=BatchSerializer, responses=BatchResponseSerializer)
+@api_view(['POST'])
+@authentication_classes([ExpiringTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def batch(request):
+    """Run several API requests, authenticated once, in one round-trip"""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    results = batch_requests.run(
+        request,
+        serializer.validated_data['requests'],
+        parallel=serializer.validated_data['parallel'],
+    )
+
+    return Response({'responses': results})
+
+
+@require_safe
+def media(request, path):
+    """Serve an uploaded file with range, conditional and cache headers"""
+    return files.serve_media(request, path)
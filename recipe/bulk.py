@@ -0,0 +1,172 @@
+'''Set-based bulk updates for recipes'''
+from rest_framework import serializers
+
+from core import sharding, stats, sync
+from core.models import Recipe, Tag, Ingredient
+
+
+SCALAR_FIELDS = ('title', 'time_minutes', 'price', 'link', 'description')
+STATS_FIELDS = ('time_minutes', 'price')
+
+# Patch key -> (recipe m2m field, item model, add or remove)
+M2M_OPERATIONS = {
+    'add_tags': ('tags', Tag, True),
+    'remove_tags': ('tags', Tag, False),
+    'add_ingredients': ('ingredients', Ingredient, True),
+    'remove_ingredients': ('ingredients', Ingredient, False),
+}
+
+
+def _through(attr):
+    """Return the through model of Recipe.<attr> and its item column"""
+    through = getattr(Recipe, attr).through
+    return through, through._meta.get_field(attr[:-1]).attname
+
+
+def _check_owned(user, model, ids, key):
+    """Raise a validation error unless the user owns every id"""
+    found = set(
+        model.objects.filter(user=user, id__in=ids).values_list('id', flat=True)
+    )
+    missing = sorted(set(ids) - found)
+    if missing:
+        raise serializers.ValidationError({key: f'Unknown ids: {missing}'})
+
+
+def _add_assignments(user, attr, pairs):
+    """Insert the (recipe_id, item_id) through rows that don't exist yet"""
+    through, column = _through(attr)
+    pairs = set(pairs)
+    existing = set(
+        through.objects.filter(
+            recipe_id__in={recipe_id for recipe_id, _ in pairs},
+            **{f'{column}__in': {item_id for _, item_id in pairs}},
+        ).values_list('recipe_id', column)
+    )
+    new = pairs - existing
+    through.objects.bulk_create(
+        [through(recipe_id=r, **{column: i}) for r, i in new],
+        batch_size=1000,
+    )
+    stats.apply_items(user.id, attr, [item_id for _, item_id in new], 1)
+
+
+def _remove_assignments(user, attr, pairs):
+    """Delete the (recipe_id, item_id) through rows, one DELETE per item"""
+    through, column = _through(attr)
+    by_item = {}
+    for recipe_id, item_id in pairs:
+        by_item.setdefault(item_id, set()).add(recipe_id)
+    for item_id, recipe_ids in by_item.items():
+        removed, _ = through.objects.filter(
+            recipe_id__in=recipe_ids, **{column: item_id},
+        ).delete()
+        stats.apply_items(user.id, attr, [item_id] * removed, -1)
+
+
+def _stats_values(recipe_ids):
+    return list(
+        Recipe.objects.filter(id__in=recipe_ids)
+        .values_list('time_minutes', 'price')
+    )
+
+
+def _apply(user, recipe_ids, updates, assignments):
+    """Run the scalar updates and through-table changes for recipe_ids
+
+    updates is a list of (fields, [Recipe, ...]) groups for bulk_update,
+    or a single (fields_dict, None) pair for a queryset update.
+    assignments maps each patch key in M2M_OPERATIONS to (recipe, item)
+    pairs.
+    """
+    touches_stats = any(
+        field in STATS_FIELDS
+        for fields, _ in updates
+        for field in fields
+    )
+    stats.ensure(user.id)
+    if touches_stats:
+        before = _stats_values(recipe_ids)
+
+    for fields, objs in updates:
+        if objs is None:
+            Recipe.objects.filter(id__in=recipe_ids).update(**fields)
+        else:
+            Recipe.objects.bulk_update(objs, fields, batch_size=500)
+
+    if touches_stats:
+        stats.replace_recipes(user.id, before, _stats_values(recipe_ids))
+
+    for key, pairs in assignments.items():
+        attr, _, add = M2M_OPERATIONS[key]
+        if not pairs:
+            continue
+        if add:
+            _add_assignments(user, attr, pairs)
+        else:
+            _remove_assignments(user, attr, pairs)
+
+    # bulk_update and queryset updates skip auto_now
+    sync.touch_recipes(recipe_ids)
+
+
+def update_recipes(user, items=None, filter=None, patch=None):
+    """Apply a bulk update for the user and return the recipes affected"""
+    with sharding.atomic(user.pk):
+        if items is not None:
+            return _update_items(user, items)
+        return _update_filtered(user, filter, patch)
+
+
+def _update_items(user, items):
+    recipe_ids = [item['id'] for item in items]
+    _check_owned(user, Recipe, recipe_ids, 'items')
+    for key, (attr, model, _) in M2M_OPERATIONS.items():
+        _check_owned(
+            user, model,
+            {i for item in items for i in item.get(key, [])}, key,
+        )
+
+    groups = {}
+    assignments = {key: [] for key in M2M_OPERATIONS}
+    for item in items:
+        fields = tuple(sorted(f for f in SCALAR_FIELDS if f in item))
+        if fields:
+            groups.setdefault(fields, []).append(
+                Recipe(id=item['id'], **{f: item[f] for f in fields})
+            )
+        for key in M2M_OPERATIONS:
+            assignments[key] += [
+                (item['id'], item_id) for item_id in item.get(key, [])
+            ]
+
+    _apply(user, recipe_ids, list(groups.items()), assignments)
+    return len(recipe_ids)
+
+
+def _update_filtered(user, filter, patch):
+    recipes = Recipe.objects.filter(user=user)
+    if filter.get('ids'):
+        recipes = recipes.filter(id__in=filter['ids'])
+    if filter.get('tags'):
+        recipes = recipes.filter(tags__id__in=filter['tags'])
+    if filter.get('ingredients'):
+        recipes = recipes.filter(ingredients__id__in=filter['ingredients'])
+    recipe_ids = list(recipes.values_list('id', flat=True).distinct())
+    for key, (attr, model, _) in M2M_OPERATIONS.items():
+        _check_owned(user, model, patch.get(key, []), key)
+    if not recipe_ids:
+        return 0
+
+    fields = {f: patch[f] for f in SCALAR_FIELDS if f in patch}
+    updates = [(fields, None)] if fields else []
+    assignments = {
+        key: [
+            (recipe_id, item_id)
+            for recipe_id in recipe_ids
+            for item_id in patch.get(key, [])
+        ]
+        for key in M2M_OPERATIONS
+    }
+    _apply(user, recipe_ids, updates, assignments)
+    return len(recipe_ids)
@@ -0,0 +1,135 @@
+'''Account export archives
+
+An export is a zip archive of the user's tags, ingredients and recipes
+as JSON, plus the original recipe images. It is built by a background
+task (recipe.tasks.build_export): every entry is streamed into a
+temporary file on disk, which is then copied in chunks to the 'exports'
+storage, so the archive is never held in memory.
+'''
+import json
+import logging
+import os
+import tempfile
+import uuid
+import zipfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage, storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core import sharding
+from core.models import Export, Ingredient, Recipe, Tag
+from recipe import serializers
+
+
+logger = logging.getLogger(__name__)
+
+# Images are compressed already
+IMAGE_COMPRESSION = zipfile.ZIP_STORED
+
+
+def image_path(recipe):
+    """Return where a recipe's image is stored in the archive"""
+    return f'images/{recipe.id}-{os.path.basename(recipe.image.name)}'
+
+
+def _write_json(archive, name, rows):
+    """Stream rows into the archive as one JSON array"""
+    with archive.open(name, 'w', force_zip64=True) as entry:
+        entry.write(b'[')
+        for index, row in enumerate(rows):
+            if index:
+                entry.write(b',')
+            entry.write(b'\n')
+            entry.write(json.dumps(row, cls=DjangoJSONEncoder).encode())
+        entry.write(b'\n]\n')
+
+
+def _recipe_rows(recipes):
+    for recipe in recipes:
+        row = serializers.RecipeDetailSerializer(recipe).data
+        row['image'] = image_path(recipe) if recipe.image else None
+        yield row
+
+
+def _write_image(archive, recipe):
+    """Copy a recipe's image from media storage into the archive"""
+    try:
+        size = default_storage.size(recipe.image.name)
+        source = default_storage.open(recipe.image.name)
+    except FileNotFoundError:
+        logger.warning('Image of recipe %s is missing', recipe.id)
+        return
+    info = zipfile.ZipInfo(
+        image_path(recipe), timezone.localtime().timetuple()[:6],
+    )
+    info.compress_type = IMAGE_COMPRESSION
+    info.file_size = size
+    with source, archive.open(info, 'w') as entry:
+        for chunk in source.chunks():
+            entry.write(chunk)
+
+
+def write_archive(user, file):
+    """Write the user's export archive to a binary file object"""
+    recipes = Recipe.objects.filter(user=user).order_by('id')
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        _write_json(archive, 'tags.json', (
+            serializers.TagSerializer(tag).data
+            for tag in Tag.objects.filter(user=user).order_by('id').iterator()
+        ))
+        _write_json(archive, 'ingredients.json', (
+            serializers.IngredientSerializer(ingredient).data
+            for ingredient in Ingredient.objects.filter(
+                user=user,
+            ).order_by('id').iterator()
+        ))
+        _write_json(archive, 'recipes.json', _recipe_rows(
+            recipes.prefetch_related('tags', 'ingredients')
+            .iterator(chunk_size=500)
+        ))
+        for recipe in recipes.exclude(image='').only('id', 'image').iterator():
+            _write_image(archive, recipe)
+
+
+def build(export_id):
+    """Build an export's archive and keep it as the user's latest export"""
+    export = Export.objects.filter(id=export_id).select_related('user').first()
+    if export is None or export.status == Export.READY:
+        return
+    Export.objects.filter(id=export.id).update(status=Export.RUNNING)
+
+    storage = storages['exports']
+    with tempfile.TemporaryFile() as file, sharding.for_user(export.user_id):
+        write_archive(export.user, file)
+        size = file.tell()
+        file.seek(0)
+        file_name = storage.save(
+            f'{export.user_id}/{uuid.uuid4()}.zip', File(file),
+        )
+
+    Export.objects.filter(id=export.id).update(
+        status=Export.READY,
+        file_name=file_name,
+        size=size,
+        finished_at=timezone.now(),
+    )
+    # Only the latest archive is kept
+    for old in Export.objects.filter(user=export.user_id, id__lt=export.id):
+        old.delete()
+
+
+def mark_failed(export_id):
+    """Record that building an export has failed for good"""
+    Export.objects.filter(id=export_id).exclude(
+        status=Export.READY,
+    ).update(status=Export.FAILED, finished_at=timezone.now())
+
+
+@receiver(post_delete, sender=Export)
+def _delete_archive(sender, instance, **kwargs):
+    if instance.file_name:
+        storages['exports'].delete(instance.file_name)
@@ -1,12 +1,51 @@
 '''Serializers for recipe app'''
+from django.urls import reverse
 from rest_framework import serializers
-from core.models import Recipe, Tag, Ingredient
 
+from core import images, sync
+from core.models import (
+    Export,
+    Ingredient,
+    Recipe,
+    RecipeStats,
+    Tag,
+    normalize_name,
+)
 
 
 
-# Create a new class IngredientSerializer that inherits from serializers.ModelSerializer
-class IngredientSerializer(serializers.ModelSerializer):
+
+# Create a new class NamedItemSerializer that inherits from serializers.ModelSerializer
+class NamedItemSerializer(serializers.ModelSerializer):
+    """Base serializer for tags and ingredients"""
+
+    def validate_name(self, value):
+        """Reject names too long once normalized, or taken in another case"""
+        normalized_name = normalize_name(value)
+        # Case folding can lengthen a name, e.g. 'ß' becomes 'ss'
+        max_length = self.Meta.model._meta.get_field(
+            'normalized_name'
+        ).max_length
+        if len(normalized_name) > max_length:
+            raise serializers.ValidationError(
+                f'Ensure this field has no more than {max_length} '
+                'characters once case is ignored.'
+            )
+        if self.instance is not None:
+            taken = type(self.instance).objects.filter(
+                user=self.instance.user,
+                normalized_name=normalized_name,
+            ).exclude(pk=self.instance.pk)
+            if taken.exists():
+                raise serializers.ValidationError(
+                    'An item with this name already exists.'
+                )
+        return value
+
+
+
+# Create a new class IngredientSerializer that inherits from NamedItemSerializer
+class IngredientSerializer(NamedItemSerializer):
     """Serializer for ingredient objects"""
 
     class Meta:
@@ -16,8 +55,8 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 
-# Create a new class TagSerializer that inherits from serializers.ModelSerializer
-class TagSerializer(serializers.ModelSerializer):
+# Create a new class TagSerializer that inherits from NamedItemSerializer
+class TagSerializer(NamedItemSerializer):
     """Serializer for tag objects"""
 
     class Meta:
@@ -27,6 +66,26 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 
+# Create a new class BulkDeleteSerializer that inherits from serializers.Serializer
+class BulkDeleteSerializer(serializers.Serializer):
+    """Serializer for selecting tags or ingredients to delete in bulk"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        max_length=10000,
+    )
+    unassigned = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        """Require at least one selection criterion"""
+        if not attrs.get('ids') and not attrs['unassigned']:
+            raise serializers.ValidationError(
+                'Provide a list of ids or unassigned=true.'
+            )
+        return attrs
+
+
+
 # Create a new class RecipeSerializer that inherits from serializers.ModelSerializer
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for recipe objects"""
@@ -44,21 +103,17 @@ class RecipeSerializer(serializers.ModelSerializer):
     
     def _get_or_create_tags(self,tags,recipe):
         """Get or create tags"""
-        auth_user = self.context['request'].user
         for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=recipe.user,
-                **tag,
+            tag_obj = Tag.objects.get_or_create_by_name(
+                recipe.user, tag['name'],
             )
             recipe.tags.add(tag_obj)
 
     def _get_or_create_ingredients(self,ingredients,recipe):
         """Get or create ingredients"""
-        auth_user = self.context['request'].user
         for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=recipe.user,
-                **ingredient,
+            ingredient_obj = Ingredient.objects.get_or_create_by_name(
+                recipe.user, ingredient['name'],
             )
             recipe.ingredients.add(ingredient_obj)
 
@@ -100,12 +155,287 @@ class RecipeDetailSerializer(RecipeSerializer):
 
 
 
+# Create a new class RecipePatchSerializer that inherits from serializers.ModelSerializer
+class RecipePatchSerializer(serializers.ModelSerializer):
+    """Serializer for the changes applied by a bulk recipe update"""
+    add_tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+    )
+    remove_tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+    )
+    add_ingredients = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+    )
+    remove_ingredients = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+    )
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'title', 'time_minutes', 'price', 'link', 'description',
+            'add_tags', 'remove_tags', 'add_ingredients', 'remove_ingredients',
+        )
+        extra_kwargs = {
+            'title': {'required': False},
+            'time_minutes': {'required': False},
+            'price': {'required': False},
+        }
+
+    def validate(self, attrs):
+        """Reject empty patches"""
+        if not attrs:
+            raise serializers.ValidationError('Patch must change something.')
+        return attrs
+
+
+class RecipePatchItemSerializer(RecipePatchSerializer):
+    """Serializer for a bulk update patch addressed to one recipe"""
+    id = serializers.IntegerField()
+
+    class Meta(RecipePatchSerializer.Meta):
+        fields = ('id',) + RecipePatchSerializer.Meta.fields
+
+    def validate(self, attrs):
+        """Reject patches that only name a recipe"""
+        if len(attrs) == 1:
+            raise serializers.ValidationError('Patch must change something.')
+        return attrs
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    """Serializer for selecting the recipes a bulk update applies to"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+    )
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+    )
+
+
+# Each ordering is served by a (user, field, id) index on Recipe
+RECIPE_ORDERING_FIELDS = ('id', 'price', 'time_minutes', 'title')
+
+
+# Create a new class RecipeListParamsSerializer that inherits from serializers.Serializer
+class RecipeListParamsSerializer(serializers.Serializer):
+    """Serializer for the recipe list query parameters"""
+    price_min = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False,
+    )
+    price_max = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False,
+    )
+    time_min = serializers.IntegerField(required=False)
+    time_max = serializers.IntegerField(required=False)
+    ordering = serializers.ChoiceField(
+        choices=[
+            prefix + field
+            for field in RECIPE_ORDERING_FIELDS
+            for prefix in ('', '-')
+        ],
+        default='-id',
+    )
+
+
+# Create a new class BulkRecipeUpdateSerializer that inherits from serializers.Serializer
+class BulkRecipeUpdateSerializer(serializers.Serializer):
+    """Serializer for bulk recipe updates
+
+    Either per-recipe patches in items, or one patch applied to every
+    recipe matched by filter.
+    """
+    items = RecipePatchItemSerializer(
+        many=True, required=False, max_length=1000,
+    )
+    filter = RecipeFilterSerializer(required=False)
+    patch = RecipePatchSerializer(required=False)
+
+    def validate(self, attrs):
+        """Require exactly one of items or filter with patch"""
+        items = attrs.get('items')
+        if items is not None:
+            if 'filter' in attrs or 'patch' in attrs:
+                raise serializers.ValidationError(
+                    'Use either items or filter with patch, not both.'
+                )
+            ids = [item['id'] for item in items]
+            if len(ids) != len(set(ids)):
+                raise serializers.ValidationError(
+                    {'items': 'Each recipe may only appear once.'}
+                )
+        elif 'filter' not in attrs or 'patch' not in attrs:
+            raise serializers.ValidationError(
+                'Provide items, or filter together with patch.'
+            )
+        return attrs
+
+
+
+# Create a new class ImageUploadField that inherits from serializers.ImageField
+class ImageUploadField(serializers.ImageField):
+    """Image field checking the upload's header before Pillow verifies it"""
+
+    def to_internal_value(self, data):
+        # Anything but a file is rejected by ImageField as usual
+        if hasattr(data, 'size'):
+            images.check_image(data)
+        return super().to_internal_value(data)
+
+
 # Create a new class RecipeImageSerializer that inherits from serializers.ModelSerializer
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
+    image = ImageUploadField(required=True)
 
     class Meta:
         model = Recipe
         fields = ('id', 'image')
         read_only_fields = ('id',)
-        extra_kwargs = {'image': {'required': 'True'}}
\ No newline at end of file
+
+    def update(self, instance, validated_data):
+        # Only the image changes, so the statistics aren't touched
+        instance.image = validated_data['image']
+        instance.save(update_fields=['image', 'updated_at'])
+        return instance
+
+
+
+# Create a new class RecipeStatsSerializer that inherits from serializers.ModelSerializer
+class RecipeStatsSerializer(serializers.ModelSerializer):
+    """Serializer for per-user recipe statistics"""
+    top_items = 5
+
+    average_time_minutes = serializers.SerializerMethodField()
+    average_price = serializers.SerializerMethodField()
+    price_distribution = serializers.DictField(
+        source='price_buckets',
+        child=serializers.IntegerField(),
+    )
+    top_tags = serializers.SerializerMethodField()
+    top_ingredients = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RecipeStats
+        fields = (
+            'recipe_count', 'average_time_minutes', 'average_price',
+            'price_distribution', 'top_tags', 'top_ingredients',
+        )
+        read_only_fields = fields
+
+    def get_average_time_minutes(self, obj) -> float:
+        if not obj.recipe_count:
+            return 0.0
+        return round(obj.total_time_minutes / obj.recipe_count, 2)
+
+    def get_average_price(self, obj) -> float:
+        if not obj.recipe_count:
+            return 0.0
+        return round(float(obj.total_price) / obj.recipe_count, 2)
+
+    def _top(self, model, counts, user_id):
+        """Return the most used items with their names and recipe counts"""
+        ranked = sorted(counts.items(), key=lambda item: -item[1])
+        ids = [int(item_id) for item_id, _ in ranked[:self.top_items]]
+        names = dict(
+            model.objects.filter(user_id=user_id, id__in=ids)
+            .values_list('id', 'name')
+        )
+        return [
+            {'id': int(item_id), 'name': names[int(item_id)], 'count': count}
+            for item_id, count in ranked[:self.top_items]
+            if int(item_id) in names
+        ]
+
+    def get_top_tags(self, obj) -> list[dict]:
+        return self._top(Tag, obj.tag_counts, obj.user_id)
+
+    def get_top_ingredients(self, obj) -> list[dict]:
+        return self._top(Ingredient, obj.ingredient_counts, obj.user_id)
+
+
+# Create a new class SimilarRecipesParamsSerializer that inherits from serializers.Serializer
+class SimilarRecipesParamsSerializer(serializers.Serializer):
+    """Serializer for the similar recipes query parameters"""
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    metric = serializers.ChoiceField(
+        choices=['jaccard', 'weighted'], default='jaccard',
+    )
+
+
+class SimilarRecipeSerializer(serializers.Serializer):
+    """Serializer for a recipe and its similarity score"""
+    score = serializers.FloatField()
+    recipe = RecipeSerializer()
+
+
+# Create a new class ShoppingListSerializer that inherits from serializers.Serializer
+class ShoppingListSerializer(serializers.Serializer):
+    """Serializer for the recipes to build a shopping list for"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Serializer for an ingredient and the number of recipes using it"""
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.CharField(source='ingredient__name')
+    recipe_count = serializers.IntegerField()
+
+
+# Create a new class SyncParamsSerializer that inherits from serializers.Serializer
+class SyncParamsSerializer(serializers.Serializer):
+    """Serializer for the delta sync query parameters"""
+    since = serializers.CharField(required=False)
+
+    def validate_since(self, value):
+        """Decode the sync token into a change position"""
+        try:
+            return sync.decode_token(value)
+        except sync.InvalidToken:
+            raise serializers.ValidationError('Invalid sync token.')
+
+
+class SyncChangeSerializer(serializers.Serializer):
+    """Serializer for one changed or deleted object"""
+    type = serializers.ChoiceField(choices=list(sync.KINDS))
+    id = serializers.IntegerField()
+    deleted = serializers.BooleanField()
+    data = serializers.DictField(required=False)
+
+
+# Create a new class SyncPageSerializer that inherits from serializers.Serializer
+class SyncPageSerializer(serializers.Serializer):
+    """Serializer for a page of the delta sync stream"""
+    changes = SyncChangeSerializer(many=True)
+    token = serializers.CharField()
+    more = serializers.BooleanField()
+
+
+# Create a new class ExportSerializer that inherits from serializers.ModelSerializer
+class ExportSerializer(serializers.ModelSerializer):
+    """Serializer for the status of an account export"""
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Export
+        fields = (
+            'id', 'status', 'size', 'created_at', 'finished_at',
+            'download_url',
+        )
+        read_only_fields = fields
+
+    def get_download_url(self, obj) -> str | None:
+        """Return where to download the archive once it is ready"""
+        if obj.status != Export.READY:
+            return None
+        url = reverse('recipe:export-download', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
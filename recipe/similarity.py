@@ -0,0 +1,183 @@
+'''Similar recipes by overlap of their tags and ingredients
+
+Each user's recipes are kept in an in-process inverted index (tag or
+ingredient -> recipe ids), i.e. the sparse recipe x item matrix stored
+by column. Scoring a recipe walks only the postings of its own items, so
+the cost depends on how many recipes share an item with it rather than
+on the total number of recipes. The index is refreshed incrementally
+from updated_at and recipe tombstones (see core.sync), which also cover
+changes made by other processes.
+'''
+import heapq
+import math
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from datetime import timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import Recipe, Tombstone
+
+
+METRICS = ('jaccard', 'weighted')
+
+# Reload everything rather than this many changed recipes one by one
+REBUILD_THRESHOLD = 1000
+
+_lock = threading.Lock()
+_indexes = OrderedDict()
+
+
+class RecipeIndex:
+    """Tags and ingredients of one user's recipes, indexed both ways"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.features = {}
+        self.postings = defaultdict(set)
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def _load(self, recipe_ids=None):
+        """Return {recipe_id: features} for recipe_ids, or all recipes"""
+        features = defaultdict(set)
+        for attr in ('tags', 'ingredients'):
+            through = getattr(Recipe, attr).through
+            column = through._meta.get_field(attr[:-1]).attname
+            rows = through.objects.filter(recipe__user_id=self.user_id)
+            if recipe_ids is not None:
+                rows = rows.filter(recipe_id__in=recipe_ids)
+            for recipe_id, item_id in rows.values_list('recipe_id', column):
+                features[recipe_id].add((attr, item_id))
+        return features
+
+    def _remove(self, recipe_id):
+        for feature in self.features.pop(recipe_id, ()):
+            recipes = self.postings[feature]
+            recipes.discard(recipe_id)
+            if not recipes:
+                del self.postings[feature]
+
+    def _add(self, recipe_id, features):
+        if not features:
+            return
+        self.features[recipe_id] = frozenset(features)
+        for feature in features:
+            self.postings[feature].add(recipe_id)
+
+    def _rebuild(self):
+        self.features = {}
+        self.postings = defaultdict(set)
+        for recipe_id, features in self._load().items():
+            self._add(recipe_id, features)
+
+    def refresh(self):
+        """Bring the index up to date with the database"""
+        now = timezone.now()
+        if self.checked_at is None:
+            self._rebuild()
+            self.checked_at = now
+            return
+
+        # Look back far enough to see transactions that committed late;
+        # reapplying a change is harmless.
+        since = self.checked_at - timedelta(
+            seconds=settings.SYNC_SETTLE_SECONDS,
+        )
+        changed = list(
+            Recipe.objects.filter(user_id=self.user_id, updated_at__gte=since)
+            .values_list('id', flat=True)
+        )
+        deleted = Tombstone.objects.filter(
+            user_id=self.user_id, kind='recipe', deleted_at__gte=since,
+        ).values_list('object_id', flat=True)
+        if len(changed) > REBUILD_THRESHOLD:
+            self._rebuild()
+            self.checked_at = now
+            return
+
+        for recipe_id in [*changed, *deleted]:
+            self._remove(recipe_id)
+        if changed:
+            for recipe_id, features in self._load(changed).items():
+                self._add(recipe_id, features)
+        self.checked_at = now
+
+    def similar(self, recipe_id, limit=10, metric='jaccard'):
+        """Return the top (recipe_id, score) pairs most like recipe_id
+
+        Both metrics are a (weighted) Jaccard index: shared / (query +
+        other - shared), with every item weighing 1, or its inverse
+        document frequency for 'weighted'. The shared weight of every
+        candidate is summed over the query's postings; candidates are
+        then scored in order of shared weight until shared / query, an
+        upper bound of the score, drops below the current top results.
+        """
+        query = self.features.get(recipe_id)
+        if not query:
+            return []
+
+        if metric == 'weighted':
+            count = len(self.features)
+
+            def weight_of(feature):
+                return math.log(1 + count / len(self.postings[feature]))
+
+            overlap = defaultdict(float)
+            for feature in query:
+                weight = weight_of(feature)
+                for other in self.postings[feature]:
+                    overlap[other] += weight
+        else:
+            weight_of = None
+            overlap = Counter()
+            for feature in query:
+                overlap.update(self.postings[feature])
+        del overlap[recipe_id]
+
+        def size_of(features):
+            if weight_of is None:
+                return len(features)
+            return sum(map(weight_of, features))
+
+        total = size_of(query)
+        top = []
+        for other, shared in sorted(
+            overlap.items(), key=itemgetter(1), reverse=True,
+        ):
+            if len(top) == limit and shared / total < top[0][0]:
+                break
+            score = shared / (total + size_of(self.features[other]) - shared)
+            entry = (score, -other)
+            if len(top) < limit:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+        return [(-other, score) for score, other in sorted(top, reverse=True)]
+
+
+def get_index(user_id):
+    """Return the user's index, keeping those of the most recent users"""
+    with _lock:
+        index = _indexes.pop(user_id, None) or RecipeIndex(user_id)
+        _indexes[user_id] = index
+        while len(_indexes) > settings.SIMILAR_RECIPES_CACHE_USERS:
+            _indexes.popitem(last=False)
+        return index
+
+
+def similar_recipes(user_id, recipe_id, limit=10, metric='jaccard'):
+    """Return (recipe_id, score) pairs of the user's most similar recipes"""
+    index = get_index(user_id)
+    with index.lock:
+        index.refresh()
+        return index.similar(recipe_id, limit, metric)
+
+
+def reset():
+    """Forget all cached indexes"""
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,17 @@
+'''Background tasks of the recipe app'''
+from django.conf import settings
+
+from core.tasks import task
+from recipe import exports
+
+
+@task(
+    name='recipe.build_export',
+    retry_delay=30,
+    timeout=3600,
+    concurrency=settings.EXPORT_CONCURRENCY,
+    on_failure=exports.mark_failed,
+)
+def build_export(export_id):
+    """Build the archive of an account export"""
+    exports.build(export_id)
@@ -0,0 +1,217 @@
+'''Tests for the account export API'''
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import tasks
+from core.models import Export, Ingredient, Recipe, Tag, Task
+
+
+EXPORT_URL = reverse('recipe:export-list')
+
+
+def detail_url(export_id):
+    """Return the status URL of an export"""
+    return reverse('recipe:export-detail', args=[export_id])
+
+
+def download_url(export_id):
+    """Return the download URL of an export"""
+    return reverse('recipe:export-download', args=[export_id])
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Helper function to create a user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def run_tasks():
+    """Run every due task in this thread"""
+    for task_obj in tasks.claim('test', 10):
+        tasks.run(task_obj, 'test')
+
+
+def content(response):
+    return b''.join(response.streaming_content)
+
+
+class ExportApiTests(TestCase):
+    """Test building and downloading account exports"""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        storage = 'django.core.files.storage.FileSystemStorage'
+        settings = override_settings(STORAGES={
+            'default': {
+                'BACKEND': storage,
+                'OPTIONS': {'location': f'{root}/media'},
+            },
+            'exports': {
+                'BACKEND': storage,
+                'OPTIONS': {'location': f'{root}/exports'},
+            },
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def build(self):
+        res = self.client.post(EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        run_tasks()
+        return Export.objects.get(id=res.data['id'])
+
+    def test_export_archive(self):
+        """Test the archive holds the user's data and images"""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('2.00'),
+        )
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+        recipe.image.save('soup.jpg', ContentFile(b'image bytes'))
+        other = create_user('other@example.com')
+        Tag.objects.create(user=other, name='Other')
+
+        export = self.build()
+
+        self.assertEqual(export.status, Export.READY)
+        res = self.client.get(detail_url(export.id))
+        self.assertEqual(res.data['status'], Export.READY)
+        self.assertEqual(res.data['size'], export.size)
+        self.assertTrue(res.data['download_url'].endswith(
+            download_url(export.id),
+        ))
+
+        res = self.client.get(download_url(export.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/zip')
+        self.assertEqual(int(res['Content-Length']), export.size)
+        self.assertIn('attachment', res['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(content(res))) as archive:
+            tags = json.loads(archive.read('tags.json'))
+            ingredients = json.loads(archive.read('ingredients.json'))
+            recipes = json.loads(archive.read('recipes.json'))
+            image = archive.read(recipes[0]['image'])
+
+        self.assertEqual([t['name'] for t in tags], ['Dinner'])
+        self.assertEqual([i['name'] for i in ingredients], ['Salt'])
+        self.assertEqual(len(recipes), 1)
+        self.assertEqual(recipes[0]['title'], 'Soup')
+        self.assertEqual(recipes[0]['tags'][0]['name'], 'Dinner')
+        self.assertEqual(image, b'image bytes')
+
+    def test_download_range(self):
+        """Test a download can be resumed with a range request"""
+        export = self.build()
+        with storages['exports'].open(export.file_name) as file:
+            archive = file.read()
+        etag = f'"export-{export.id}-{export.size}"'
+
+        res = self.client.get(download_url(export.id), HTTP_RANGE='bytes=10-')
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(
+            res['Content-Range'], f'bytes 10-{export.size - 1}/{export.size}',
+        )
+        self.assertEqual(content(res), archive[10:])
+
+        res = self.client.get(
+            download_url(export.id), HTTP_RANGE='bytes=-5', HTTP_IF_RANGE=etag,
+        )
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(content(res), archive[-5:])
+
+        res = self.client.get(
+            download_url(export.id), HTTP_RANGE=f'bytes={export.size}-',
+        )
+        self.assertEqual(
+            res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        )
+        self.assertEqual(res['Content-Range'], f'bytes */{export.size}')
+
+        # The archive changed since the partial download
+        res = self.client.get(
+            download_url(export.id), HTTP_RANGE='bytes=10-',
+            HTTP_IF_RANGE='"stale"',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(content(res), archive)
+
+    def test_download_not_batchable(self):
+        """Test a download inside a batch is refused, not read"""
+        export = self.build()
+
+        res = self.client.post(reverse('batch'), {'requests': [
+            {'method': 'GET', 'path': download_url(export.id)},
+            {'method': 'GET', 'path': detail_url(export.id)},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        download, detail = res.data['responses']
+        self.assertEqual(download['status'], 400)
+        self.assertEqual(detail['body']['status'], 'ready')
+
+    def test_export_in_progress_reused(self):
+        """Test starting an export while one is being built returns it"""
+        first = self.client.post(EXPORT_URL)
+        second = self.client.post(EXPORT_URL)
+
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(first.data['status'], Export.PENDING)
+        self.assertIsNone(first.data['download_url'])
+        res = self.client.get(download_url(first.data['id']))
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_new_export_replaces_old_archive(self):
+        """Test only the latest archive is kept"""
+        old = self.build()
+        new = self.build()
+
+        self.assertFalse(Export.objects.filter(id=old.id).exists())
+        self.assertFalse(storages['exports'].exists(old.file_name))
+        self.assertTrue(storages['exports'].exists(new.file_name))
+
+    def test_failed_export(self):
+        """Test an export is marked failed once its retries run out"""
+        self.client.post(EXPORT_URL)
+        Task.objects.update(max_attempts=1)
+
+        with patch('recipe.exports.write_archive', side_effect=OSError):
+            run_tasks()
+
+        export = Export.objects.get(user=self.user)
+        self.assertEqual(export.status, Export.FAILED)
+
+    def test_other_users_export_not_found(self):
+        """Test a user can't see or download another user's export"""
+        export = Export.objects.create(
+            user=create_user('other@example.com'), status=Export.READY,
+        )
+
+        self.assertEqual(
+            self.client.get(detail_url(export.id)).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+        self.assertEqual(
+            self.client.get(download_url(export.id)).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
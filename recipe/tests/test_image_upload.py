@@ -0,0 +1,201 @@
+'''Tests for validating recipe image uploads'''
+import io
+import os
+import re
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import images
+from core.models import Recipe
+
+
+def image_upload_url(recipe_id):
+    """Return URL for recipe image upload"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def image_bytes(width, height, format='JPEG'):
+    """Return an encoded image"""
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(out, format)
+    return out.getvalue()
+
+
+def png_bomb(width, height):
+    """Return a tiny PNG whose header claims width x height pixels"""
+    def chunk(kind, data):
+        body = kind + data
+        return (
+            struct.pack('>I', len(data)) + body
+            + struct.pack('>I', zlib.crc32(body))
+        )
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+        + chunk(b'IDAT', zlib.compress(b'\0' * 1024)) + chunk(b'IEND', b'')
+    )
+
+
+def status_kb(field):
+    with open('/proc/self/status') as status_file:
+        return int(re.search(
+            rf'^{field}:\s+(\d+) kB', status_file.read(), re.MULTILINE,
+        ).group(1))
+
+
+def reset_peak_rss():
+    """Reset the process's peak RSS to its current RSS (Linux only)"""
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+
+
+class CheckImageTests(SimpleTestCase):
+    """Test the header checks and the upload size limit"""
+
+    def check(self, data, name='image.jpg'):
+        images.check_image(SimpleUploadedFile(name, data))
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=10_000)
+    def test_limits(self):
+        """Test byte, format and pixel limits are enforced"""
+        self.check(image_bytes(100, 100))
+
+        cases = [
+            (image_bytes(101, 100), 'max_pixels'),
+            (png_bomb(100_000, 100_000), 'max_pixels'),
+            (b'not an image', 'invalid_image'),
+            (image_bytes(10, 10, 'BMP'), 'invalid_image'),
+        ]
+        for data, code in cases:
+            with self.subTest(code=code), \
+                    self.assertRaises(ValidationError) as cm:
+                self.check(data)
+            self.assertEqual(cm.exception.code, code)
+
+        with override_settings(IMAGE_UPLOAD_MAX_BYTES=100), \
+                self.assertRaises(ValidationError) as cm:
+            self.check(image_bytes(100, 100))
+        self.assertEqual(cm.exception.code, 'max_bytes')
+
+    def test_upload_handler_drops_oversized_upload(self):
+        """Test chunks past the limit aren't passed on"""
+        handler = images.MaxSizeUploadHandler(100)
+        handler.new_file('image', 'image.jpg', 'image/jpeg', None)
+
+        self.assertEqual(handler.receive_data_chunk(b'a' * 60, 0), b'a' * 60)
+        self.assertIsNone(handler.receive_data_chunk(b'a' * 60, 60))
+        self.assertIsNone(handler.receive_data_chunk(b'a' * 60, 120))
+        upload = handler.file_complete(180)
+
+        self.assertEqual(upload.size, 180)
+        self.assertEqual(upload.name, 'image.jpg')
+        self.assertEqual(upload.read(), b'')
+
+
+class ImageUploadApiTests(TestCase):
+    """Test uploading recipe images"""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(
+            STORAGES={'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': root},
+            }},
+            IMAGE_UPLOAD_MAX_BYTES=2 * 1024 * 1024,
+            IMAGE_UPLOAD_MAX_PIXELS=4_000_000,
+            FILE_UPLOAD_MAX_MEMORY_SIZE=64 * 1024,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('2.00'),
+        )
+
+    def upload(self, data, name='image.jpg'):
+        return self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': SimpleUploadedFile(name, data)},
+            format='multipart',
+        )
+
+    def test_upload_image(self):
+        """Test a valid image is saved"""
+        res = self.upload(image_bytes(1000, 800))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image.storage.exists(self.recipe.image.name))
+
+    def test_reject_oversized_upload(self):
+        """Test an upload over IMAGE_UPLOAD_MAX_BYTES is rejected"""
+        res = self.upload(os.urandom(3 * 1024 * 1024))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('at most 2.0\xa0MB', res.data['image'][0])
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_reject_decompression_bomb(self):
+        """Test an image with too many pixels is rejected"""
+        res = self.upload(png_bomb(50_000, 50_000), name='bomb.png')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pixels', res.data['image'][0])
+
+    def test_reject_format(self):
+        """Test formats missing from IMAGE_UPLOAD_FORMATS are rejected"""
+        with override_settings(IMAGE_UPLOAD_FORMATS=['PNG']):
+            res = self.upload(image_bytes(10, 10))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('PNG', res.data['image'][0])
+
+    @unittest.skipUnless(
+        os.path.exists('/proc/self/clear_refs'), 'needs Linux /proc',
+    )
+    def test_peak_rss_per_upload(self):
+        """Test no upload raises the worker's peak RSS by much"""
+        uploads = {
+            # Decoded, these would take gigabytes
+            'png_bomb': (png_bomb(50_000, 50_000), 'bomb.png'),
+            'jpeg_over_pixel_limit': (image_bytes(4000, 1500), 'big.jpg'),
+            'jpeg_accepted': (image_bytes(1600, 1200), 'ok.jpg'),
+        }
+        peaks = {}
+        for case, (data, name) in uploads.items():
+            upload = SimpleUploadedFile(name, data)
+            reset_peak_rss()
+            before = status_kb('VmRSS')
+            self.client.post(
+                image_upload_url(self.recipe.id), {'image': upload},
+                format='multipart',
+            )
+            peaks[case] = status_kb('VmHWM') - before
+
+        # A decoded 1600 x 1200 image alone would take 7.5 MB
+        for case, peak_kb in peaks.items():
+            with self.subTest(case=case, peak_kb=peak_kb):
+                self.assertLess(peak_kb, 16 * 1024)
@@ -13,6 +13,7 @@ from recipe.serializers import IngredientSerializer
 
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+BULK_DELETE_URL = reverse('recipe:ingredient-bulk-delete')
 
 
 
@@ -137,4 +138,61 @@ class PrivateIngredientTests(TestCase):
 
         res=self.client.get(INGREDIENTS_URL, {'assigned_only':1})
 
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data), 1)
+
+    def test_bulk_delete_ingredients_by_id(self):
+        """Test deleting several ingredients in one request"""
+        ingredient1 = Ingredient.objects.create(user=self.user, name='Salt')
+        ingredient2 = Ingredient.objects.create(user=self.user, name='Pepper')
+        ingredient3 = Ingredient.objects.create(user=self.user, name='Kale')
+        other = Ingredient.objects.create(
+            user=create_user(email='other@example.com'), name='Salt',
+        )
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('4.50'),
+        )
+        recipe.ingredients.add(ingredient1)
+
+        res = self.client.post(
+            BULK_DELETE_URL,
+            {'ids': [ingredient1.id, ingredient2.id, other.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], 2)
+        self.assertEqual(
+            list(Ingredient.objects.filter(user=self.user)), [ingredient3],
+        )
+        self.assertTrue(Ingredient.objects.filter(id=other.id).exists())
+        self.assertEqual(recipe.ingredients.count(), 0)
+
+    def test_bulk_delete_unassigned_ingredients(self):
+        """Test deleting every ingredient not assigned to a recipe"""
+        ingredient1 = Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='Pepper')
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('4.50'),
+        )
+        recipe.ingredients.add(ingredient1)
+
+        res = self.client.post(
+            BULK_DELETE_URL, {'unassigned': True}, format='json',
+        )
+
+        self.assertEqual(res.data['deleted'], 1)
+        self.assertEqual(
+            list(Ingredient.objects.filter(user=self.user)), [ingredient1],
+        )
+
+    def test_bulk_delete_requires_selection(self):
+        """Test bulk delete without ids or unassigned is rejected"""
+        res = self.client.post(BULK_DELETE_URL, {}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
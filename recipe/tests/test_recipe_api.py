@@ -11,7 +11,8 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Tag, Ingredient
+from core import stats
+from core.models import Recipe, RecipeStats, Tag, Ingredient
 
 from recipe.serializers import (
     RecipeSerializer,
@@ -20,6 +21,8 @@ from recipe.serializers import (
 
 
 RECIPE_URL = reverse('recipe:recipe-list')
+BULK_UPDATE_URL = reverse('recipe:recipe-bulk-update')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
 
 
 
@@ -243,6 +246,20 @@ class PrivateRecipeApiTests(TestCase):
             self.assertTrue(exists)
 
 
+    def test_create_recipe_with_overlong_tag_rejected(self):
+        """Test tag names too long once case is folded are rejected"""
+        payload = {
+            'title': 'Strudel',
+            'tags': [{'name': 'ß' * 200}],
+            'time_minutes': 60,
+            'price': Decimal('20.00'),
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+
     def test_create_recipe_with_existing_tags(self):
         """Test creating a recipe with tags"""
         tag_bd=Tag.objects.create(user=self.user, name='Vegan')
@@ -269,6 +286,27 @@ class PrivateRecipeApiTests(TestCase):
             self.assertTrue(exists)
 
 
+    def test_create_recipe_matches_names_ignoring_case(self):
+        """Test tags and ingredients differing in case or spacing are reused"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Sea Salt')
+        payload = {
+            'title': 'Salted caramel',
+            'tags': [{'name': 'vegan'}, {'name': ' VEGAN'}],
+            'ingredients': [{'name': 'sea   salt'}],
+            'time_minutes': 30,
+            'price': Decimal('4.00'),
+        }
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(list(recipe.tags.all()), [tag])
+        self.assertEqual(list(recipe.ingredients.all()), [ingredient])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+
     def test_create_tag_on_update(self):
         """Test creating a tag on update"""
         recipe=create_recipe(user=self.user)
@@ -439,6 +477,61 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
 
+    def test_filter_by_tags_no_duplicates(self):
+        """Test a recipe matching several tags is listed once"""
+        recipe=create_recipe(user=self.user)
+        tag1=Tag.objects.create(user=self.user, name='Dinner')
+        tag2=Tag.objects.create(user=self.user, name='Quick')
+        recipe.tags.add(tag1, tag2)
+
+        res=self.client.get(RECIPE_URL, {'tags':f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+
+    def test_filter_by_price_and_time_range(self):
+        """Test filtering recipes by price and time ranges"""
+        cheap_quick=create_recipe(user=self.user, price=Decimal('4.00'), time_minutes=10)
+        cheap_slow=create_recipe(user=self.user, price=Decimal('6.00'), time_minutes=90)
+        create_recipe(user=self.user, price=Decimal('25.00'), time_minutes=20)
+
+        res=self.client.get(RECIPE_URL, {'price_min':'4', 'price_max':'10'})
+        self.assertEqual(
+            {r['id'] for r in res.data}, {cheap_quick.id, cheap_slow.id},
+        )
+
+        res=self.client.get(RECIPE_URL, {'price_max':'10', 'time_max':'30'})
+        self.assertEqual([r['id'] for r in res.data], [cheap_quick.id])
+
+        res=self.client.get(RECIPE_URL, {'time_min':'60'})
+        self.assertEqual([r['id'] for r in res.data], [cheap_slow.id])
+
+    def test_ordering(self):
+        """Test ordering recipes by an indexed field, ties broken by id"""
+        r1=create_recipe(user=self.user, title='B', price=Decimal('7.00'))
+        r2=create_recipe(user=self.user, title='A', price=Decimal('3.00'))
+        r3=create_recipe(user=self.user, title='C', price=Decimal('7.00'))
+
+        res=self.client.get(RECIPE_URL, {'ordering':'price'})
+        self.assertEqual([r['id'] for r in res.data], [r2.id, r1.id, r3.id])
+
+        res=self.client.get(RECIPE_URL, {'ordering':'-price'})
+        self.assertEqual([r['id'] for r in res.data], [r3.id, r1.id, r2.id])
+
+        res=self.client.get(RECIPE_URL, {'ordering':'title'})
+        self.assertEqual([r['id'] for r in res.data], [r2.id, r1.id, r3.id])
+
+    def test_invalid_list_params_rejected(self):
+        """Test unindexed orderings and malformed ranges return 400"""
+        for params in (
+            {'ordering':'description'},
+            {'ordering':'price,title'},
+            {'price_min':'cheap'},
+            {'time_max':'1.5'},
+        ):
+            res=self.client.get(RECIPE_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 
 # # Test for the image upload
@@ -513,4 +606,149 @@ class RecipeImageUploadTests(TestCase):
         url = image_upload_url(self.recipe.id)
         res = self.client.post(url, {'image': 'notimage'}, format='multipart')
 
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+class BulkRecipeUpdateTests(TestCase):
+    """Test patching many recipes in one request"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='testpass')
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_update_per_recipe_patches(self):
+        """Test applying different patches to different recipes"""
+        recipe1 = create_recipe(user=self.user, price=Decimal('5.00'))
+        recipe2 = create_recipe(user=self.user, title='Soup')
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        payload = {'items': [
+            {'id': recipe1.id, 'price': '7.50', 'add_tags': [tag.id]},
+            {'id': recipe2.id, 'title': 'Tomato soup', 'time_minutes': 20},
+        ]}
+
+        res = self.client.patch(BULK_UPDATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['updated'], 2)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.price, Decimal('7.50'))
+        self.assertEqual(list(recipe1.tags.all()), [tag])
+        self.assertEqual(recipe2.title, 'Tomato soup')
+        self.assertEqual(recipe2.time_minutes, 20)
+
+    def test_bulk_update_filtered_set(self):
+        """Test adding a tag to every recipe with an ingredient"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Rice')
+        old_tag = Tag.objects.create(user=self.user, name='Old')
+        tag = Tag.objects.create(user=self.user, name='Grain')
+        with_rice = [create_recipe(user=self.user) for _ in range(3)]
+        for recipe in with_rice:
+            recipe.ingredients.add(ingredient)
+            recipe.tags.add(old_tag)
+        with_rice[0].tags.add(tag)
+        other = create_recipe(user=self.user)
+        payload = {
+            'filter': {'ingredients': [ingredient.id]},
+            'patch': {
+                'price': '3.00',
+                'add_tags': [tag.id],
+                'remove_tags': [old_tag.id],
+            },
+        }
+
+        res = self.client.patch(BULK_UPDATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['updated'], 3)
+        for recipe in with_rice:
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.price, Decimal('3.00'))
+            self.assertEqual(list(recipe.tags.all()), [tag])
+        other.refresh_from_db()
+        self.assertEqual(other.price, Decimal('5.00'))
+        self.assertEqual(other.tags.count(), 0)
+
+    def test_bulk_update_keeps_stats_exact(self):
+        """Test bulk updates keep the recipe statistics in sync"""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+        RecipeStats.objects.all().delete()
+        payload = {
+            'filter': {'ids': [r.id for r in recipes]},
+            'patch': {'price': '25.00', 'add_tags': [tag.id]},
+        }
+
+        self.client.patch(BULK_UPDATE_URL, payload, format='json')
+
+        row = RecipeStats.objects.get(user=self.user)
+        incremental = (row.total_price, row.price_buckets, row.tag_counts)
+        row = stats.rebuild(self.user.id)
+        self.assertEqual(
+            incremental, (row.total_price, row.price_buckets, row.tag_counts),
+        )
+        self.assertEqual(row.tag_counts, {str(tag.id): 3})
+
+    def test_bulk_update_other_users_recipe_rejected(self):
+        """Test recipes of other users cannot be patched"""
+        other = create_recipe(user=create_user(email='other@example.com'))
+        payload = {'items': [{'id': other.id, 'title': 'Hijacked'}]}
+
+        res = self.client.patch(BULK_UPDATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        other.refresh_from_db()
+        self.assertEqual(other.title, 'Sample recipe')
+
+    def test_bulk_update_requires_items_or_filter(self):
+        """Test a payload without items or filter is rejected"""
+        res = self.client.patch(
+            BULK_UPDATE_URL, {'patch': {'price': '1.00'}}, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ShoppingListTests(TestCase):
+    """Test aggregating the ingredients of many recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def test_shopping_list_counts_recipes_per_ingredient(self):
+        """Test ingredients are deduplicated and counted in one query"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+        for recipe in recipes:
+            recipe.ingredients.add(salt)
+        recipes[0].ingredients.add(rice)
+        unplanned = create_recipe(user=self.user)
+        unplanned.ingredients.add(rice)
+        other = create_recipe(user=create_user(email='other@example.com'))
+        other.ingredients.add(
+            Ingredient.objects.create(user=other.user, name='Secret')
+        )
+        ids = [r.id for r in recipes] + [recipes[0].id, other.id]
+
+        with self.assertNumQueries(1):
+            res = self.client.post(
+                SHOPPING_LIST_URL, {'recipes': ids}, format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': rice.id, 'name': 'Rice', 'recipe_count': 1},
+            {'id': salt.id, 'name': 'Salt', 'recipe_count': 3},
+        ])
+
+    def test_shopping_list_requires_recipes(self):
+        """Test an empty or oversized list of recipes is rejected"""
+        for ids in ([], list(range(1001))):
+            res = self.client.post(
+                SHOPPING_LIST_URL, {'recipes': ids}, format='json',
+            )
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,123 @@
+'''Tests for the similar recipes API'''
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import similarity
+
+
+def similar_url(recipe_id):
+    """Return the similar recipes URL for a recipe"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Helper function to create a user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def create_recipe(user, tags=(), ingredients=(), **params):
+    """Create and return a sample recipe with the given items"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.tags.add(*tags)
+    recipe.ingredients.add(*ingredients)
+    return recipe
+
+
+class SimilarRecipesApiTests(TestCase):
+    """Test ranking recipes by shared tags and ingredients"""
+
+    def setUp(self):
+        similarity.reset()
+        self.addCleanup(similarity.reset)
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.dinner = Tag.objects.create(user=self.user, name='Dinner')
+        self.spicy = Tag.objects.create(user=self.user, name='Spicy')
+        self.chicken = Ingredient.objects.create(user=self.user, name='Chicken')
+        self.saffron = Ingredient.objects.create(user=self.user, name='Saffron')
+
+    def ranked(self, recipe, **params):
+        res = self.client.get(similar_url(recipe.id), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [(r['recipe']['id'], round(r['score'], 3)) for r in res.data]
+
+    def test_jaccard_ranking(self):
+        """Test recipes are ranked by the Jaccard index of their items"""
+        recipe = create_recipe(
+            self.user, [self.dinner, self.spicy], [self.chicken],
+        )
+        same = create_recipe(
+            self.user, [self.dinner, self.spicy], [self.chicken],
+        )
+        partial = create_recipe(self.user, [self.dinner])
+        create_recipe(self.user, [], [self.saffron])
+        create_recipe(self.user)
+        other_user = create_user(email='other@example.com')
+        create_recipe(other_user)
+
+        self.assertEqual(self.ranked(recipe), [
+            (same.id, 1.0),
+            (partial.id, 0.333),
+        ])
+        self.assertEqual(self.ranked(recipe, limit=1), [(same.id, 1.0)])
+
+    def test_weighted_ranking(self):
+        """Test rare items count for more with the weighted metric"""
+        recipe = create_recipe(self.user, [self.dinner], [self.saffron])
+        shares_rare = create_recipe(self.user, [], [self.saffron])
+        shares_common = create_recipe(self.user, [self.dinner])
+        for _ in range(3):
+            create_recipe(self.user, [self.dinner])
+
+        jaccard = self.ranked(recipe)
+        self.assertEqual(jaccard[0][1], jaccard[1][1])
+
+        weighted = self.ranked(recipe, metric='weighted')
+        self.assertEqual(weighted[0][0], shares_rare.id)
+        self.assertGreater(weighted[0][1], weighted[1][1])
+        self.assertIn(shares_common.id, [r for r, _ in weighted])
+
+    def test_index_follows_changes(self):
+        """Test assignment changes and deletions update the cached index"""
+        recipe = create_recipe(self.user, [self.dinner, self.spicy])
+        other = create_recipe(self.user, [self.dinner])
+        self.assertEqual(self.ranked(recipe), [(other.id, 0.5)])
+
+        other.tags.add(self.spicy)
+        self.assertEqual(self.ranked(recipe), [(other.id, 1.0)])
+
+        added = create_recipe(self.user, [self.spicy])
+        other.delete()
+        self.assertEqual(self.ranked(recipe), [(added.id, 0.5)])
+
+    def test_invalid_params(self):
+        """Test an unknown metric or limit is rejected"""
+        recipe = create_recipe(self.user, [self.dinner])
+
+        for params in ({'metric': 'cosine'}, {'limit': 0}):
+            res = self.client.get(similar_url(recipe.id), params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_recipe_not_found(self):
+        """Test similar recipes of another user's recipe are not exposed"""
+        other_user = create_user(email='other@example.com')
+        recipe = create_recipe(other_user)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,167 @@
+'''Tests for the recipe statistics API'''
+from io import StringIO
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import stats
+from core.models import Recipe, RecipeStats, Tag, Ingredient
+
+
+STATS_URL = reverse('recipe:recipe-stats')
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Helper function to create a user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def stored_stats(user):
+    """Return the maintained stats row as comparable values"""
+    row = RecipeStats.objects.get(user=user)
+    return (
+        row.recipe_count, row.total_time_minutes, row.total_price,
+        row.price_buckets, row.tag_counts, row.ingredient_counts,
+    )
+
+
+class PublicRecipeStatsApiTests(TestCase):
+    """Test unauthenticated stats API access"""
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateRecipeStatsApiTests(TestCase):
+    """Test the incrementally maintained recipe statistics"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def assertMatchesRebuild(self):
+        """Assert the incremental stats equal a full recompute"""
+        incremental = stored_stats(self.user)
+        stats.rebuild(self.user.id)
+        self.assertEqual(incremental, stored_stats(self.user))
+
+    def test_retrieve_stats(self):
+        """Test the stats endpoint summarises the user's recipes"""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        r1 = create_recipe(self.user, time_minutes=10, price=Decimal('4.00'))
+        r2 = create_recipe(self.user, time_minutes=30, price=Decimal('12.00'))
+        r1.tags.add(tag)
+        r2.tags.add(tag)
+        create_recipe(create_user(email='other@example.com'))
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['average_time_minutes'], 20)
+        self.assertEqual(res.data['average_price'], 8)
+        self.assertEqual(
+            res.data['price_distribution'], {'0-5': 1, '10-20': 1},
+        )
+        self.assertEqual(
+            res.data['top_tags'],
+            [{'id': tag.id, 'name': 'Dinner', 'count': 2}],
+        )
+
+    def test_stats_follow_api_changes(self):
+        """Test create, update and delete through the API keep stats exact"""
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 30,
+            'price': Decimal('7.50'),
+            'tags': [{'name': 'Spicy'}, {'name': 'Dinner'}],
+            'ingredients': [{'name': 'Rice'}],
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+        recipe_id = res.data['id']
+        self.client.post(RECIPE_URL, payload, format='json')
+        self.assertMatchesRebuild()
+
+        url = reverse('recipe:recipe-detail', args=[recipe_id])
+        self.client.patch(url, {
+            'price': Decimal('60.00'),
+            'tags': [{'name': 'Lunch'}],
+        }, format='json')
+        self.assertMatchesRebuild()
+
+        self.client.delete(url)
+        self.assertMatchesRebuild()
+        self.assertEqual(stored_stats(self.user)[0], 1)
+
+    def test_stats_follow_m2m_and_item_changes(self):
+        """Test reverse m2m changes and tag deletion keep stats exact"""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        tag.recipe_set.add(recipe)
+        recipe.ingredients.add(ingredient)
+        recipe.ingredients.remove(ingredient, ingredient)
+        recipe.tags.remove(Tag.objects.create(user=self.user, name='Unused'))
+        self.assertMatchesRebuild()
+
+        tag.delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(stored_stats(self.user)[4], {})
+
+    def test_save_without_counted_fields_skips_stats(self):
+        """Test saving other fields neither reads back nor locks stats"""
+        recipe = Recipe.objects.get(pk=create_recipe(self.user).pk)
+        recipe.title = 'Renamed'
+        recipe.price = Decimal('99.00')
+
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save(update_fields=['title', 'updated_at'])
+
+        self.assertFalse([
+            q['sql'] for q in queries
+            if 'core_recipestats' in q['sql'] or 'SELECT' in q['sql']
+        ])
+        self.assertEqual(stored_stats(self.user)[2], Decimal('5.00'))
+
+    def test_stats_built_for_existing_recipes(self):
+        """Test a user without a stats row gets one built on first change"""
+        create_recipe(self.user)
+        RecipeStats.objects.all().delete()
+
+        create_recipe(self.user)
+
+        self.assertEqual(stored_stats(self.user)[0], 2)
+
+    def test_rebuild_command(self):
+        """Test the rebuild command recomputes drifted stats"""
+        create_recipe(self.user)
+        RecipeStats.objects.filter(user=self.user).update(recipe_count=99)
+
+        call_command('rebuild_recipe_stats', stdout=StringIO())
+
+        self.assertEqual(stored_stats(self.user)[0], 1)
@@ -0,0 +1,193 @@
+'''Tests for the delta sync API'''
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import sync
+from core.models import Ingredient, Recipe, Tag, Tombstone
+
+
+SYNC_URL = reverse('recipe:sync-list')
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Helper function to create a user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def changed(res):
+    """Return the (type, id, deleted) triples of a sync response"""
+    return [(c['type'], c['id'], c['deleted']) for c in res.data['changes']]
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncApiTests(TestCase):
+    """Test streaming changes since a sync token"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_first_sync_returns_everything(self):
+        """Test a sync without a token returns all of the user's objects"""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(tag)
+        other = create_user(email='other@example.com')
+        create_recipe(other)
+        Tombstone.objects.create(user=self.user, kind='tag', object_id=999)
+
+        res = self.client.get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertCountEqual(changed(res), [
+            ('tag', tag.id, False),
+            ('ingredient', ingredient.id, False),
+            ('recipe', recipe.id, False),
+        ])
+        self.assertFalse(res.data['more'])
+        data = {c['type']: c['data'] for c in res.data['changes']}
+        self.assertEqual(data['recipe']['tags'], [
+            {'id': tag.id, 'name': 'Dinner'},
+        ])
+
+    def test_sync_returns_only_changes(self):
+        """Test a sync with a token returns updates and deletions only"""
+        recipe = create_recipe(self.user)
+        unchanged = create_recipe(self.user, title='Unchanged')
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        token = self.client.get(SYNC_URL).data['token']
+
+        recipe.title = 'Renamed'
+        recipe.save()
+        tag_id = tag.id
+        tag.delete()
+        res = self.client.get(SYNC_URL, {'since': token})
+
+        self.assertEqual(changed(res), [
+            ('recipe', recipe.id, False),
+            ('tag', tag_id, True),
+        ])
+        self.assertNotIn(unchanged.id, [c['id'] for c in res.data['changes']])
+        self.assertEqual(res.data['changes'][0]['data']['title'], 'Renamed')
+
+        res = self.client.get(SYNC_URL, {'since': res.data['token']})
+
+        self.assertEqual(res.data['changes'], [])
+
+    def test_sync_pages_through_ties(self):
+        """Test paging returns each change once, including equal timestamps"""
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        tags = [Tag.objects.create(user=self.user, name=f'T{i}') for i in range(2)]
+        same_time = timezone.now() - timedelta(seconds=1)
+        Recipe.objects.update(updated_at=same_time)
+        Tag.objects.update(updated_at=same_time)
+
+        seen = []
+        token = None
+        with self.settings(SYNC_PAGE_SIZE=2):
+            while True:
+                params = {'since': token} if token else {}
+                res = self.client.get(SYNC_URL, params)
+                seen += changed(res)
+                token = res.data['token']
+                if not res.data['more']:
+                    break
+
+        self.assertEqual(seen, [
+            *[('recipe', r.id, False) for r in recipes],
+            *[('tag', t.id, False) for t in tags],
+        ])
+
+    def test_assignment_changes_touch_recipe(self):
+        """Test adding a tag to a recipe reports the recipe as changed"""
+        recipe = create_recipe(self.user)
+        token = self.client.get(SYNC_URL).data['token']
+
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        tag.recipe_set.add(recipe)
+        res = self.client.get(SYNC_URL, {'since': token})
+
+        self.assertCountEqual(changed(res), [
+            ('recipe', recipe.id, False),
+            ('tag', tag.id, False),
+        ])
+
+    def test_bulk_operations_are_synced(self):
+        """Test bulk updates and bulk deletes are reported"""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        recipe.tags.add(tag)
+        token = self.client.get(SYNC_URL).data['token']
+
+        self.client.patch(
+            reverse('recipe:recipe-bulk-update'),
+            {'items': [{'id': recipe.id, 'price': '7.00'}]},
+            format='json',
+        )
+        res = self.client.get(SYNC_URL, {'since': token})
+        self.assertEqual(changed(res), [('recipe', recipe.id, False)])
+
+        self.client.post(
+            reverse('recipe:tag-bulk-delete'), {'ids': [tag.id]},
+            format='json',
+        )
+        res = self.client.get(SYNC_URL, {'since': res.data['token']})
+        self.assertEqual(changed(res), [
+            ('recipe', recipe.id, False),
+            ('tag', tag.id, True),
+        ])
+
+    def test_recent_changes_held_back(self):
+        """Test changes inside the settle window wait for the next sync"""
+        token = self.client.get(SYNC_URL).data['token']
+        recipe = create_recipe(self.user)
+
+        with self.settings(SYNC_SETTLE_SECONDS=60):
+            res = self.client.get(SYNC_URL, {'since': token})
+        self.assertEqual(res.data['changes'], [])
+
+        res = self.client.get(SYNC_URL, {'since': res.data['token']})
+        self.assertEqual(changed(res), [('recipe', recipe.id, False)])
+
+    def test_invalid_token(self):
+        """Test a malformed token returns 400"""
+        res = self.client.get(SYNC_URL, {'since': 'not-a-token'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_token(self):
+        """Test a token older than the tombstone retention returns 410"""
+        token = sync.encode_token(
+            (timezone.now() - timedelta(days=365), '', 0),
+        )
+
+        res = self.client.get(SYNC_URL, {'since': token})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
@@ -1,17 +1,20 @@
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db.models import QuerySet
 from django.test import TestCase
 
 from decimal import Decimal
+from unittest.mock import patch
 
 from  rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag, Recipe
+from core.models import Tag, Recipe, Tombstone
 from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+BULK_DELETE_URL = reverse('recipe:tag-bulk-delete')
 
 
 # Create a helper function to return a recipe detail URL
@@ -89,6 +92,29 @@ class PrivateTagsApiTests(TestCase):
         self.assertEqual(tag.name, payload['name'])
 
 
+    def test_rename_tag_to_existing_name_rejected(self):
+        """Test a tag can't be renamed to another tag's name in another case"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        tag = Tag.objects.create(user=self.user, name='Healthy')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'VEGAN'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.patch(detail_url(tag.id), {'name': 'healthy'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+    def test_name_too_long_once_normalized_rejected(self):
+        """Test names that case folding makes too long are rejected"""
+        tag = Tag.objects.create(user=self.user, name='Healthy')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'ß' * 200})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Healthy')
+
+
     def test_delete_tag(self):
         """Test deleting a tag"""
         tag = Tag.objects.create(user=self.user, name='Non-Vegan')
@@ -142,3 +168,88 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_bulk_delete_tags_by_id(self):
+        """Test deleting several tags in one request"""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dessert')
+        tag3 = Tag.objects.create(user=self.user, name='Spicy')
+        other = Tag.objects.create(
+            user=create_user(email='other@example.com'), name='Vegan',
+        )
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('4.50'),
+        )
+        recipe.tags.add(tag1)
+
+        res = self.client.post(
+            BULK_DELETE_URL,
+            {'ids': [tag1.id, tag2.id, other.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], 2)
+        self.assertEqual(
+            list(Tag.objects.filter(user=self.user)), [tag3],
+        )
+        self.assertTrue(Tag.objects.filter(id=other.id).exists())
+        self.assertEqual(recipe.tags.count(), 0)
+
+    def test_bulk_delete_unassigned_tags(self):
+        """Test deleting every tag not assigned to a recipe"""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dessert')
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('4.50'),
+        )
+        recipe.tags.add(tag1)
+
+        res = self.client.post(
+            BULK_DELETE_URL, {'unassigned': True}, format='json',
+        )
+
+        self.assertEqual(res.data['deleted'], 1)
+        self.assertEqual(
+            list(Tag.objects.filter(user=self.user)), [tag1],
+        )
+
+    def test_bulk_delete_tombstones_only_deleted_tags(self):
+        """Test tags assigned meanwhile are neither deleted nor tombstoned"""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dessert')
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('4.50'),
+        )
+        raw_delete = QuerySet._raw_delete
+
+        def assign_first(queryset, using):
+            # A concurrent request assigning the tag before the DELETE
+            recipe.tags.add(tag1)
+            return raw_delete(queryset, using)
+
+        with patch.object(QuerySet, '_raw_delete', assign_first):
+            res = self.client.post(
+                BULK_DELETE_URL, {'unassigned': True}, format='json',
+            )
+
+        self.assertEqual(res.data['deleted'], 1)
+        self.assertEqual(
+            list(Tombstone.objects.values_list('object_id', flat=True)),
+            [tag2.id],
+        )
+
+    def test_bulk_delete_requires_selection(self):
+        """Test bulk delete without ids or unassigned is rejected"""
+        res = self.client.post(BULK_DELETE_URL, {}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
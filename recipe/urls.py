@@ -9,6 +9,8 @@ router = DefaultRouter()
 router.register('recipe', views.RecipeViewSet)
 router.register('tag', views.TagViewSet)
 router.register('ingredient', views.IngredientViewSet)
+router.register('sync', views.SyncViewSet, basename='sync')
+router.register('export', views.ExportViewSet, basename='export')
 
 
 app_name = 'recipe'
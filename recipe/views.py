@@ -9,13 +9,21 @@ from rest_framework import (
     mixins,
     status,
     )
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
-from core.models import Recipe, Tag, Ingredient
-from recipe import serializers
+from django.core.files.storage import storages
+
+from core import images, sharding, stats, sync, tasks
+from core.files import ranged_response
+from core.models import Export, Recipe, RecipeStats, Tag, Ingredient
+from recipe import bulk, serializers, similarity
+from recipe.tasks import build_export
+from user.authentication import ExpiringTokenAuthentication
 
 
 
@@ -35,7 +43,36 @@ from recipe import serializers
             'ingredients',
             OpenApiTypes.STR,
             description='Filter recipes by ingredients',
-            )
+            ),
+        OpenApiParameter(
+            'price_min',
+            OpenApiTypes.DECIMAL,
+            description='Only recipes costing at least this much',
+            ),
+        OpenApiParameter(
+            'price_max',
+            OpenApiTypes.DECIMAL,
+            description='Only recipes costing at most this much',
+            ),
+        OpenApiParameter(
+            'time_min',
+            OpenApiTypes.INT,
+            description='Only recipes taking at least this many minutes',
+            ),
+        OpenApiParameter(
+            'time_max',
+            OpenApiTypes.INT,
+            description='Only recipes taking at most this many minutes',
+            ),
+        OpenApiParameter(
+            'ordering',
+            OpenApiTypes.STR,
+            enum=serializers.RecipeListParamsSerializer().fields[
+                'ordering'
+            ].choices,
+            description='Sort by price, time_minutes, title or id '
+                        '(prefix with - for descending, default -id)',
+            ),
           ]
         )
     )
@@ -45,8 +82,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
 
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    # Reads or writes by request method, unless an action sets a scope
+    throttle_scope = None
+    range_filters = {
+        'price_min': 'price__gte',
+        'price_max': 'price__lte',
+        'time_min': 'time_minutes__gte',
+        'time_max': 'time_minutes__lte',
+    }
 
 
     def _params_to_ints(self, qs):
@@ -57,15 +102,42 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Return objects for the current authenticated user only"""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
+        queryset = self.queryset.filter(user=self.request.user)
+        # Semi-joins instead of joining the through tables, so no
+        # DISTINCT is needed and the ordering can come from an index.
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = queryset.filter(
+                id__in=Recipe.tags.through.objects.filter(
+                    tag_id__in=tag_ids,
+                ).values('recipe_id')
+            )
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = queryset.filter(
+                id__in=Recipe.ingredients.through.objects.filter(
+                    ingredient_id__in=ingredient_ids,
+                ).values('recipe_id')
+            )
+
+        if self.action != 'list':
+            return queryset.order_by('-id')
 
-        return queryset.filter(user=self.request.user).order_by('-id').distinct()
+        params = serializers.RecipeListParamsSerializer(
+            data=self.request.query_params,
+        )
+        params.is_valid(raise_exception=True)
+        for param, lookup in self.range_filters.items():
+            if param in params.validated_data:
+                queryset = queryset.filter(
+                    **{lookup: params.validated_data[param]}
+                )
+
+        # Break ties on id in the same direction, so the whole ordering
+        # is a scan of the matching (user, field, id) index.
+        ordering = params.validated_data['ordering']
+        tie_breaker = '-id' if ordering.startswith('-') else 'id'
+        return queryset.order_by(ordering, tie_breaker)
     
 
     def get_serializer_class(self):
@@ -74,6 +146,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'stats':
+            return serializers.RecipeStatsSerializer
+        elif self.action == 'bulk_update':
+            return serializers.BulkRecipeUpdateSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
+        elif self.action == 'shopping_list':
+            return serializers.ShoppingListSerializer
         
         return self.serializer_class
 
@@ -84,9 +164,96 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """Return the user's recipe statistics"""
+        recipe_stats = RecipeStats.objects.filter(user=request.user).first()
+        if recipe_stats is None:
+            recipe_stats = stats.rebuild(request.user.id)
+        serializer = self.get_serializer(recipe_stats)
+
+        return Response(serializer.data)
+
+
+    @extend_schema(
+        parameters=[serializers.SimilarRecipesParamsSerializer],
+        responses=serializers.SimilarRecipeSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Return the user's recipes sharing the most tags and ingredients"""
+        recipe = self.get_object()
+        params = serializers.SimilarRecipesParamsSerializer(
+            data=request.query_params,
+        )
+        params.is_valid(raise_exception=True)
+        ranked = similarity.similar_recipes(
+            request.user.id, recipe.id, **params.validated_data,
+        )
+        recipes = Recipe.objects.prefetch_related(
+            'tags', 'ingredients',
+        ).in_bulk([recipe_id for recipe_id, _ in ranked])
+        serializer = self.get_serializer(
+            [
+                {'score': score, 'recipe': recipes[recipe_id]}
+                for recipe_id, score in ranked
+                if recipe_id in recipes
+            ],
+            many=True,
+        )
+
+        return Response(serializer.data)
+
+
+    @extend_schema(
+        responses=serializers.ShoppingListItemSerializer(many=True),
+    )
+    @action(methods=['POST'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """Return the ingredients of many recipes with their recipe counts"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # One GROUP BY over the through table; ids of other users'
+        # recipes are ignored.
+        items = (
+            Recipe.ingredients.through.objects
+            .filter(
+                recipe_id__in=set(serializer.validated_data['recipes']),
+                recipe__user=request.user,
+            )
+            .values('ingredient_id', 'ingredient__name')
+            .annotate(recipe_count=Count('recipe_id'))
+            .order_by('ingredient__name', 'ingredient_id')
+        )
+
+        return Response(
+            serializers.ShoppingListItemSerializer(items, many=True).data
+        )
+
+
+    @action(methods=['PATCH'], detail=False, url_path='bulk-update')
+    def bulk_update(self, request):
+        """Patch many recipes in one transaction"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = bulk.update_recipes(request.user, **serializer.validated_data)
+
+        return Response({'updated': updated}, status=status.HTTP_200_OK)
+
+
+    @action(
+        methods=['POST'],
+        detail=True,
+        url_path='upload-image',
+        throttle_scope='uploads',
+    )
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe"""
+        # Must come before request.data is parsed
+        request.upload_handlers.insert(
+            0, images.MaxSizeUploadHandler(settings.IMAGE_UPLOAD_MAX_BYTES),
+        )
         recipe = self.get_object()
         serializer = self.get_serializer(
             recipe,
@@ -127,7 +294,7 @@ class BaseRecipeAttrViewSet(
                             mixins.CreateModelMixin,
                             mixins.UpdateModelMixin,):
     """Base viewset for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -142,6 +309,62 @@ class BaseRecipeAttrViewSet(
         return queryset.filter(
             user=self.request.user
             ).order_by('-name').distinct()
+
+    def get_serializer_class(self):
+        """Return appropriate serializer class"""
+        if self.action == 'bulk_delete':
+            return serializers.BulkDeleteSerializer
+
+        return self.serializer_class
+
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete many of the user's items in one statement per table"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get('ids')
+
+        model = self.queryset.model
+        items = model.objects.filter(user=request.user)
+        if ids:
+            items = items.filter(id__in=ids)
+        if serializer.validated_data['unassigned']:
+            items = items.filter(recipe__isnull=True)
+
+        through = getattr(Recipe, self.recipe_field).through
+        item_column = model._meta.model_name
+        with sharding.atomic(request.user.pk):
+            # Locked, so they can't be assigned to a recipe from now on
+            item_ids = list(
+                items.select_for_update(of=('self',))
+                .values_list('id', flat=True)
+            )
+            items = items.filter(id__in=item_ids)
+            if not serializer.validated_data['unassigned']:
+                assignments = through.objects.filter(
+                    **{f'{item_column}__in': item_ids}
+                )
+                sync.touch_recipes(assignments.values('recipe_id'))
+                assignments.delete()
+            # _raw_delete issues a single DELETE without collecting the
+            # objects into Python; no through rows reference them anymore.
+            deleted = items.order_by()._raw_delete(items.db)
+            # Only what was deleted, should one have been assigned before
+            # it was locked
+            deleted_ids = set(item_ids).difference(
+                model.objects.filter(id__in=item_ids)
+                .values_list('id', flat=True)
+            )
+            sync.record_deletions(
+                sync.MODEL_KINDS[model],
+                [(request.user.id, item_id) for item_id in deleted_ids],
+            )
+            if ids:
+                stats.forget_items(
+                    request.user.id, self.recipe_field, deleted_ids,
+                )
+
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
     
 
 # Create a new class TagViewSet that inherits from viewsets.GenericViewSet
@@ -149,6 +372,7 @@ class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database"""
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'
 
 
 
@@ -157,5 +381,108 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database"""
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
- 
- 
+    recipe_field = 'ingredients'
+
+
+
+# Create a new class SyncViewSet that inherits from viewsets.GenericViewSet
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(
+            'since',
+            OpenApiTypes.STR,
+            description='Token from the previous sync; omit to sync everything',
+            )
+          ],
+        responses=serializers.SyncPageSerializer,
+        )
+    )
+
+class SyncViewSet(viewsets.GenericViewSet):
+    """Stream the user's changed and deleted recipes, tags and ingredients"""
+    serializer_class = serializers.SyncParamsSerializer
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    data_serializers = {
+        'recipe': serializers.RecipeDetailSerializer,
+        'tag': serializers.TagSerializer,
+        'ingredient': serializers.IngredientSerializer,
+    }
+
+    def list(self, request):
+        """Return a page of changes after the since token"""
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        position = params.validated_data.get('since')
+        if position is not None and sync.is_expired(position):
+            return Response(
+                {'detail': 'Sync token expired, sync from scratch.'},
+                status=status.HTTP_410_GONE,
+            )
+
+        page, next_position, more = sync.changes(
+            request.user, position, settings.SYNC_PAGE_SIZE,
+        )
+        changes = []
+        for (_, kind, object_id), obj in page:
+            change = {'type': kind, 'id': object_id, 'deleted': obj is None}
+            if obj is not None:
+                change['data'] = self.data_serializers[kind](obj).data
+            changes.append(change)
+
+        return Response({
+            'changes': changes,
+            'token': sync.encode_token(next_position),
+            'more': more,
+        })
+
+
+# Create a new class ExportViewSet that inherits from viewsets.GenericViewSet
+class ExportViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Build an archive of the user's account and download it"""
+    serializer_class = serializers.ExportSerializer
+    queryset = Export.objects.all()
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        """Retrieve exports for authenticated user"""
+        return self.queryset.filter(user=self.request.user)
+
+    @extend_schema(request=None)
+    def create(self, request):
+        """Start building an export, or return the one in progress"""
+        export = self.get_queryset().filter(
+            status__in=[Export.PENDING, Export.RUNNING],
+        ).order_by('-id').first()
+        if export is None:
+            with transaction.atomic():
+                export = Export.objects.create(user=request.user)
+                tasks.enqueue(build_export, export_id=export.id)
+
+        serializer = self.get_serializer(export)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(responses={
+        (200, 'application/zip'): OpenApiTypes.BINARY,
+        (206, 'application/zip'): OpenApiTypes.BINARY,
+    })
+    @action(methods=['GET'], detail=True)
+    def download(self, request, pk=None):
+        """Download the archive, or a byte range of it to resume"""
+        export = self.get_object()
+        if export.status != Export.READY:
+            return Response(
+                {'detail': 'Export is not ready.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        return ranged_response(
+            request,
+            storages['exports'].open(export.file_name),
+            export.size,
+            'application/zip',
+            filename=f'recipes-export-{export.id}.zip',
+            etag=f'"export-{export.id}-{export.size}"',
+        )
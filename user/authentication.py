@@ -0,0 +1,35 @@
+'''Authentication classes for the user app'''
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core import routers
+from core.models import AuthToken
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """Token authentication with a sliding expiry window"""
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        try:
+            user, token = super().authenticate_credentials(key)
+        except exceptions.AuthenticationFailed:
+            # A token issued moments ago may not have reached the replica
+            if not routers.stop_using_replica():
+                raise
+            user, token = super().authenticate_credentials(key)
+        routers.set_user(user.pk)
+
+        now = timezone.now()
+        if token.expires_at <= now:
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+        expires_at = now + settings.AUTH_TOKEN_TTL
+        if expires_at - token.expires_at >= settings.AUTH_TOKEN_REFRESH_INTERVAL:
+            AuthToken.objects.filter(pk=token.pk).update(expires_at=expires_at)
+            token.expires_at = expires_at
+
+        return (user, token)
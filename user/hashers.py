@@ -0,0 +1,168 @@
+'''Password hashers for the user app
+
+With PASSWORD_HASH_WORKERS set, a hash is only computed while holding
+one of that many slots shared by every process on the host: byte-range
+locks on PASSWORD_HASH_SLOTS_PATH, like the throttle buckets. A login
+burst then uses at most PASSWORD_HASH_WORKERS CPUs however many request
+workers there are. A request waiting for a slot still holds its worker,
+for at most PASSWORD_HASH_TIMEOUT seconds.
+
+The user API views (signup, login, profile updates) hash inside
+reject_when_busy() and answer 429 when no slot frees up in time. Only
+management commands, the shell and the admin, which staff alone can
+reach, hash anyway once the wait is over, without the bound.
+'''
+import base64
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+
+# Seconds between attempts to take a slot
+POLL_INTERVAL = 0.01
+
+# Set by reject_when_busy(): raise HashingBusy instead of waiting it out
+_reject_when_busy = ContextVar('reject_when_busy', default=False)
+
+_lock = threading.Lock()
+_slots = None
+
+
+class HashingBusy(exceptions.Throttled):
+    """Raised when every password hashing slot stays busy"""
+    default_detail = _('Too many concurrent logins, please retry shortly.')
+
+
+class HashSlots:
+    """Slots in a file shared by all processes that open it"""
+
+    def __init__(self, path, count):
+        self.pid = os.getpid()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Byte-range locks are held per process, so threads need their own
+        self.locks = [threading.Lock() for _ in range(count)]
+
+    def close(self):
+        os.close(self.fd)
+
+    def _take(self, index):
+        if not self.locks[index].acquire(blocking=False):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, index)
+        except OSError:
+            self.locks[index].release()
+            return False
+        return True
+
+    def acquire(self, timeout):
+        """Take a free slot within timeout seconds; return it or None"""
+        deadline = time.monotonic() + timeout
+        while True:
+            for index in range(len(self.locks)):
+                if self._take(index):
+                    return index
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def release(self, index):
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, index)
+        self.locks[index].release()
+
+
+def get_slots():
+    """Return this process's handle on the shared hashing slots"""
+    global _slots
+    with _lock:
+        # A forked worker must not share the parent's locks
+        if _slots is None or _slots.pid != os.getpid():
+            _slots = HashSlots(
+                settings.PASSWORD_HASH_SLOTS_PATH,
+                settings.PASSWORD_HASH_WORKERS,
+            )
+        return _slots
+
+
+@receiver(setting_changed)
+def _reset_slots(setting, **kwargs):
+    global _slots
+    if setting in ('PASSWORD_HASH_SLOTS_PATH', 'PASSWORD_HASH_WORKERS'):
+        with _lock:
+            if _slots is not None:
+                _slots.close()
+            _slots = None
+
+
+@contextmanager
+def reject_when_busy():
+    """Raise HashingBusy (429) inside the block when no slot frees up"""
+    token = _reject_when_busy.set(True)
+    try:
+        yield
+    finally:
+        _reject_when_busy.reset(token)
+
+
+def pbkdf2(password, salt, iterations, digest_name):
+    """Derive a PBKDF2 key, in a shared hashing slot if configured
+
+    Callers wait up to PASSWORD_HASH_TIMEOUT seconds for a slot. Then
+    the user API views (see reject_when_busy) get HashingBusy, and
+    management commands and the admin hash anyway.
+    """
+    args = (digest_name, password.encode(), salt.encode(), iterations)
+    if not settings.PASSWORD_HASH_WORKERS:
+        return hashlib.pbkdf2_hmac(*args)
+
+    slots = get_slots()
+    slot = slots.acquire(settings.PASSWORD_HASH_TIMEOUT)
+    if slot is None:
+        if _reject_when_busy.get():
+            raise HashingBusy(wait=settings.PASSWORD_HASH_TIMEOUT)
+        return hashlib.pbkdf2_hmac(*args)
+    try:
+        return hashlib.pbkdf2_hmac(*args)
+    finally:
+        slots.release(slot)
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 hasher with a per-environment work factor
+
+    Stored hashes keep the pbkdf2_sha256 format. Hashes made with a
+    different iteration count are upgraded transparently on the next
+    successful login, since must_update compares against the setting.
+    """
+
+    @property
+    def iterations(self):
+        return (
+            settings.PASSWORD_HASH_ITERATIONS
+            or PBKDF2PasswordHasher.iterations
+        )
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        hash = pbkdf2(password, salt, iterations, self.digest().name)
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return '%s$%d$%s$%s' % (self.algorithm, iterations, salt, hash)
@@ -0,0 +1,158 @@
+'''Tests for the tunable password hasher'''
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user import hashers
+
+
+TOKEN_URL = reverse('user:token')
+
+# Takes slot 0 of the slots file given as argv[1] until killed
+HOLD_SLOT = '''
+import fcntl, os, sys, time
+fd = os.open(sys.argv[1], os.O_RDWR | os.O_CREAT, 0o600)
+fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)
+print('held', flush=True)
+time.sleep(60)
+'''
+
+
+def iterations_of(user):
+    """Return the PBKDF2 iteration count of a user's stored hash"""
+    return int(user.password.split('$')[1])
+
+
+class TunableHasherTests(TestCase):
+    """Test configurable work factor and bounded hashing"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_work_factor_from_settings(self):
+        """Test new hashes use the configured iteration count"""
+        user = get_user_model().objects.create_user(
+            email='test@example.com', password='testpass123',
+        )
+
+        self.assertEqual(iterations_of(user), 1000)
+        self.assertTrue(user.check_password('testpass123'))
+
+    def test_rehash_on_login(self):
+        """Test a hash with an old work factor is upgraded on login"""
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            user = get_user_model().objects.create_user(
+                email='test@example.com', password='testpass123',
+            )
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            res = self.client.post(TOKEN_URL, {
+                'email': 'test@example.com',
+                'password': 'testpass123',
+            })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertEqual(iterations_of(user), 2000)
+
+    def use_slots(self, count=1):
+        """Use count hashing slots in a file of this test's own"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        overrides = override_settings(
+            PASSWORD_HASH_WORKERS=count,
+            PASSWORD_HASH_SLOTS_PATH=os.path.join(directory, 'slots'),
+            PASSWORD_HASH_TIMEOUT=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        return hashers.get_slots()
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_hashing_in_slot(self):
+        """Test hashing in a slot matches inline hashing and frees it"""
+        hasher = hashers.TunablePBKDF2PasswordHasher()
+        inline = hasher.encode('testpass123', 'somesalt')
+        slots = self.use_slots()
+
+        self.assertEqual(hasher.encode('testpass123', 'somesalt'), inline)
+        self.assertEqual(slots.acquire(timeout=0), 0)
+        slots.release(0)
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_slots_shared_by_processes(self):
+        """Test a slot held by another process is not taken"""
+        slots = self.use_slots()
+        holder = subprocess.Popen(
+            [sys.executable, '-c', HOLD_SLOT, settings.PASSWORD_HASH_SLOTS_PATH],
+            stdout=subprocess.PIPE,
+        )
+        self.addCleanup(holder.wait)
+        self.addCleanup(holder.kill)
+        holder.stdout.readline()
+
+        self.assertIsNone(slots.acquire(timeout=0))
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_login_rejected_when_slots_busy(self):
+        """Test API logins are throttled when no hashing slot frees up"""
+        get_user_model().objects.create_user(
+            email='test@example.com', password='testpass123',
+        )
+        slots = self.use_slots()
+        slot = slots.acquire(timeout=0)
+        self.addCleanup(slots.release, slot)
+
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_password_writes_rejected_when_slots_busy(self):
+        """Test signup and password changes are throttled like logins"""
+        user = get_user_model().objects.create_user(
+            email='test@example.com', password='testpass123',
+        )
+        slots = self.use_slots()
+        slot = slots.acquire(timeout=0)
+        self.addCleanup(slots.release, slot)
+
+        res = self.client.post(reverse('user:create'), {
+            'email': 'new@example.com',
+            'password': 'testpass123',
+            'name': 'New',
+        })
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertFalse(
+            get_user_model().objects.filter(email='new@example.com').exists()
+        )
+
+        self.client.force_authenticate(user)
+        res = self.client.patch(reverse('user:me'), {'password': 'newpass123'})
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_hash_inline_outside_api_when_slots_busy(self):
+        """Test other logins (admin, shell) don't fail when slots are busy"""
+        user = get_user_model().objects.create_user(
+            email='test@example.com', password='testpass123',
+        )
+        slots = self.use_slots()
+        slot = slots.acquire(timeout=0)
+        self.addCleanup(slots.release, slot)
+
+        self.assertTrue(user.check_password('testpass123'))
@@ -0,0 +1,92 @@
+'''Tests for expiring token authentication'''
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import AuthToken
+
+
+TOKEN_URL = reverse('user:token')
+ME_URL = reverse('user:me')
+
+
+@override_settings(
+    AUTH_TOKEN_TTL=timedelta(hours=1),
+    AUTH_TOKEN_REFRESH_INTERVAL=timedelta(minutes=5),
+)
+class ExpiringTokenTests(TestCase):
+    """Test token expiry and sliding refresh"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+        )
+        self.token = AuthToken.objects.issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def _set_expiry(self, expires_at):
+        AuthToken.objects.filter(pk=self.token.pk).update(expires_at=expires_at)
+
+    def test_valid_token_authenticates(self):
+        """Test a live token authenticates the user"""
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_expired_token_rejected(self):
+        """Test an expired token is rejected"""
+        self._set_expiry(timezone.now() - timedelta(seconds=1))
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_sliding_refresh(self):
+        """Test use extends the expiry once the refresh interval passes"""
+        old_expiry = timezone.now() + timedelta(minutes=30)
+        self._set_expiry(old_expiry)
+
+        self.client.get(ME_URL)
+
+        self.token.refresh_from_db()
+        self.assertGreater(self.token.expires_at, old_expiry)
+
+    def test_no_refresh_within_interval(self):
+        """Test recent tokens are not rewritten on every request"""
+        recent_expiry = timezone.now() + timedelta(minutes=58)
+        self._set_expiry(recent_expiry)
+
+        self.client.get(ME_URL)
+
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.expires_at, recent_expiry)
+
+    def test_login_replaces_expired_token(self):
+        """Test logging in after expiry issues a new token"""
+        self._set_expiry(timezone.now() - timedelta(seconds=1))
+
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], self.token.key)
+        self.assertEqual(AuthToken.objects.filter(user=self.user).count(), 1)
+
+    def test_login_reuses_live_token(self):
+        """Test logging in with a live token returns the same token"""
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertEqual(res.data['token'], self.token.key)
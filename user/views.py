@@ -1,33 +1,61 @@
 
-from  rest_framework import generics, authentication, permissions
+from  rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from core import routers
+from core.models import AuthToken
+from core.throttling import BucketThrottle
+from user import hashers
+from user.authentication import ExpiringTokenAuthentication
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,  
 )
 
 
+class BoundedHashingMixin:
+    """Answer 429 when no password hashing slot frees up in time"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with hashers.reject_when_busy():
+            return super().dispatch(request, *args, **kwargs)
+
+
 # createUser is a view that creates a new user in the system.
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(BoundedHashingMixin, generics.CreateAPIView):
     """Create a new user in the system"""
     serializer_class = UserSerializer
 
  
 
 # createToken is a view that creates a new authentication token for the user.
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(BoundedHashingMixin, ObtainAuthToken):
     """Create a new auth token for the user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken turns throttling off
+    throttle_classes = (BucketThrottle,)
+    throttle_scope = 'token'
+
+    def post(self, request, *args, **kwargs):
+        """Issue a token, replacing the user's token if it has expired"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token = AuthToken.objects.issue(user)
+        # The new token must be found by the next request
+        routers.set_user(user.pk)
+
+        return Response({'token': token.key})
 
 
 
 # manageUser is a view that manages the authenticated user.
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(BoundedHashingMixin, generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):